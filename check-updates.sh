@@ -69,15 +69,14 @@ check_git_status() {
 check_hooks_diff() {
     print_section "Hooks 代码差异"
 
-    if [ ! -d "$CLAUDE_HOME/hooks" ]; then
+    if [ ! -e "$CLAUDE_HOME/hooks" ]; then
         echo -e "${RED}✗ hooks 目录不存在${NC}"
         return 1
     fi
 
-    # 排除临时文件的差异检查
-    local diff_output=$(diff -rq "$SCRIPT_DIR/hooks" "$CLAUDE_HOME/hooks" 2>/dev/null | grep -v ".experience_counter" | grep -v "^Only in")
-
-    if [ -z "$diff_output" ]; then
+    # 按文件哈希比较（.experience_counter 等运行时文件不计入）
+    local diff_output
+    if diff_output=$(python3 "$SCRIPT_DIR/scripts/hooksync.py" status); then
         echo -e "${GREEN}✓ hooks 已同步${NC}"
         return 0
     else
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+admin.py - 命令行管理工具
+
+用法：
+    python3 ~/.claude/hooks/admin.py stats            # 各 hook / 阶段耗时分位数
+    python3 ~/.claude/hooks/admin.py stats --reset    # 清空耗时统计
+    python3 ~/.claude/hooks/admin.py rules --days 30  # 规则命中统计，标记 30 天未命中的规则
+    python3 ~/.claude/hooks/admin.py sweep            # 把超过 1 小时仍无结果的 ask 请求标记为拒绝
+    python3 ~/.claude/hooks/admin.py memo             # 决策缓存命中率
+    python3 ~/.claude/hooks/admin.py analytics --days 7  # 决策分布、批准率、按小时分布
+    python3 ~/.claude/hooks/admin.py replay --rules new-rules.md --days 90
+                                                      # 用历史 feedback 回放候选规则
+    python3 ~/.claude/hooks/admin.py profile -o hooks.folded
+                                                      # 汇总剖析文件为火焰图折叠栈
+    python3 ~/.claude/hooks/admin.py prune --dry-run  # 按保留策略清理旧 feedback / 会话
+"""
+
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from lib import MEMORY_BANK_PROJECT
+from lib.timing import STATS_FILE, load_stats, percentile
+from lib.rules import default_rule_files, load_rules
+from lib.replay import replay
+from lib.rule_stats import compact_rule_hits, find_stale_rules, load_rule_stats, rule_stat_key
+from lib.storage import feedback_files, read_json, resolve_pending_outcomes
+from lib.analytics import analyze, load_columns_from_files
+from lib.memo import HITS_FILE, MEMO_FILE, pending_hits
+from lib.scheduler import note_resolved
+from lib.rule_scores import note_outcomes
+from lib.retention import prune, retention_config
+from lib.profiling import PROFILES_DIR, aggregate, find_profiles, folded_stacks, format_folded
+
+
+def cmd_stats(args) -> int:
+    if args.reset:
+        STATS_FILE.unlink(missing_ok=True)
+        print("已清空耗时统计")
+        return 0
+
+    hooks = load_stats()
+    if not hooks:
+        print("暂无耗时数据（设置 AUTO_DECISION_TIMING=1 或 instrumentation.enabled 开启）")
+        return 0
+
+    if args.json:
+        report = {
+            hook: {
+                name: {
+                    "count": stat["count"],
+                    "mean": stat["sum"] / stat["count"],
+                    **{f"p{p}": percentile(stat, p) for p in (50, 90, 99)},
+                    "max": stat["max"],
+                }
+                for name, stat in stages.items()
+            }
+            for hook, stages in hooks.items()
+        }
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    header = f"{'hook':<14} {'stage':<18} {'count':>7} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"
+    print(header)
+    print("-" * len(header))
+    for hook in sorted(hooks):
+        stages = hooks[hook]
+        # total 放最后，其余按平均耗时降序
+        names = sorted(
+            (n for n in stages if n != "total"),
+            key=lambda n: stages[n]["sum"] / max(stages[n]["count"], 1),
+            reverse=True,
+        )
+        if "total" in stages:
+            names.append("total")
+        for name in names:
+            stat = stages[name]
+            print(
+                f"{hook:<14} {name:<18} {stat['count']:>7} "
+                f"{stat['sum'] / stat['count']:>9.2f} "
+                f"{percentile(stat, 50):>9.2f} {percentile(stat, 90):>9.2f} "
+                f"{percentile(stat, 99):>9.2f} {stat['max']:>9.2f}"
+            )
+    print("\n单位: ms")
+    return 0
+
+
+def cmd_rules(args) -> int:
+    compact_rule_hits()
+    rules = load_rules()
+    stats = load_rule_stats()
+    stale = find_stale_rules(rules, args.days, stats)
+
+    if args.json:
+        print(json.dumps({"stale": stale, "stats": stats}, ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"{'rule':<32} {'source':<16} {'hits':>7}  last_hit")
+    print("-" * 78)
+    for rule in rules:
+        entry = stats.get(rule_stat_key(rule), {})
+        print(
+            f"{rule.get('id', ''):<32} {rule.get('source', ''):<16} "
+            f"{entry.get('hits', 0):>7}  {entry.get('last_hit', '-') or '-'}"
+        )
+
+    print()
+    if stale:
+        print(f"⚠️  {len(stale)} 条规则超过 {args.days} 天未命中，可考虑清理：")
+        for item in stale:
+            print(f"  - {item['id']} ({item['source']}, {item['tool']})")
+    else:
+        print(f"✓ 所有规则在 {args.days} 天内都有命中")
+    return 0
+
+
+def cmd_sweep(args) -> int:
+    rejected_entries = []
+    resolved = resolve_pending_outcomes(
+        session_id=args.session,
+        older_than=timedelta(hours=args.older_than_hours),
+        days=args.days,
+        rejected_entries=rejected_entries,
+    )
+    note_resolved(resolved)
+    note_outcomes((entry, False) for entry in rejected_entries)
+    print(f"已标记 {resolved} 条未执行的 ask 请求为用户拒绝")
+    return 0
+
+
+def cmd_memo(args) -> int:
+    if args.clear:
+        MEMO_FILE.unlink(missing_ok=True)
+        HITS_FILE.unlink(missing_ok=True)
+        print("已清空决策缓存")
+        return 0
+
+    memo = read_json(MEMO_FILE, {})
+    hits, misses = memo.get("hits", 0) + len(pending_hits()), memo.get("misses", 0)
+    total = hits + misses
+    rate = hits / total * 100 if total else 0.0
+    print(f"缓存条目: {len(memo.get('entries', {}))}")
+    print(f"命中: {hits}  未命中: {misses}  命中率: {rate:.1f}%")
+    return 0
+
+
+def _rate(stat: dict) -> str:
+    rate = stat["approval_rate"]
+    return f"{rate * 100:.0f}%" if rate is not None else "-"
+
+
+def cmd_analytics(args) -> int:
+    columns = load_columns_from_files(feedback_files(args.days))
+    report = analyze(columns)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    if not report["total"]:
+        print(f"最近 {args.days} 天没有 feedback 记录（{MEMORY_BANK_PROJECT / 'feedback'}）")
+        return 0
+
+    decisions = report["decisions"]
+    print(f"最近 {args.days} 天共 {report['total']} 次操作")
+    print(
+        f"  自动允许 {decisions['allow']}  自动拒绝 {decisions['deny']}  需确认 {decisions['ask']}"
+        f"（批准 {report['user_approved']} / 拒绝 {report['user_rejected']} / 未决 {report['pending']}，"
+        f"批准率 {_rate(report)}）"
+    )
+
+    header = f"{'':<36} {'total':>7} {'allow':>7} {'deny':>7} {'ask':>7} {'approve':>8}"
+    for title, groups in (("按工具", report["tools"]), ("按模式", report["patterns"])):
+        print(f"\n{title}:")
+        print(header)
+        ranked = sorted(groups.items(), key=lambda kv: -kv[1]["total"])[:args.top]
+        for name, stat in ranked:
+            asked = stat["user_approved"] + stat["user_rejected"] + stat["pending"]
+            print(
+                f"{name[:36]:<36} {stat['total']:>7} {stat['auto_allowed']:>7} "
+                f"{stat['auto_denied']:>7} {asked:>7} {_rate(stat):>8}"
+            )
+
+    print("\n按小时:")
+    peak = max(report["hours"]) or 1
+    for hour, count in enumerate(report["hours"]):
+        if count:
+            print(f"  {hour:02d}:00 {count:>6} {'█' * max(1, count * 40 // peak)}")
+    return 0
+
+
+def cmd_replay(args) -> int:
+    candidate = [(Path(f).expanduser(), "candidate") for f in args.rules]
+    missing = [str(path) for path, _ in candidate if not path.exists()]
+    if missing:
+        print(f"规则文件不存在: {', '.join(missing)}", file=sys.stderr)
+        return 1
+
+    current = default_rule_files()
+    if not args.only:
+        # 候选规则优先级最高，叠加在当前规则之上
+        candidate += current
+    baseline = None if args.baseline == "recorded" else current
+
+    report = replay(candidate, baseline, days=args.days, workers=args.workers)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    if not report["records"]:
+        print("没有可回放的 feedback 记录")
+        return 0
+
+    print(f"回放 {report['files']} 个日志文件，{report['records']} 条请求（基线: {args.baseline}）")
+    print()
+    print(f"{'decision':<10} {'baseline':>10} {'candidate':>10}")
+    for decision in ("allow", "deny", "ask"):
+        print(f"{decision:<10} {report['baseline'].get(decision, 0):>10} {report['candidate'].get(decision, 0):>10}")
+
+    print()
+    if report["transitions"]:
+        print("决策变化:")
+        for transition, count in sorted(report["transitions"].items(), key=lambda kv: -kv[1]):
+            print(f"  {transition:<14} {count:>7}")
+            for example in report["examples"].get(transition, []):
+                print(f"      {example}")
+    else:
+        print("候选规则不改变任何决策")
+
+    print()
+    print(
+        f"需要确认: {report['prompts_before']} → {report['prompts_after']} "
+        f"（减少 {report['prompt_reduction'] * 100:.1f}%）"
+    )
+    if report["rejected_allowed"]:
+        print(f"⚠️  {report['rejected_allowed']} 条用户当时拒绝的请求会被自动放行")
+    print(
+        f"吞吐: {report['records_per_second']:.0f} 条/秒（{report['workers']} 进程，"
+        f"{report['wall_seconds']:.2f}s），匹配 {report['match_us_per_record']:.1f} µs/条"
+    )
+    return 0
+
+
+def cmd_profile(args) -> int:
+    since = datetime.now() - timedelta(days=args.days) if args.days else None
+    paths = find_profiles(hook=args.hook, tool=args.tool, since=since)
+    if not paths:
+        print(f"没有匹配的剖析文件（{PROFILES_DIR}）。"
+              "设置 AUTO_DECISION_PROFILE=1 或 profiling.enabled 开启剖析模式", file=sys.stderr)
+        return 1
+
+    stats = aggregate(paths)
+    if stats is None:
+        print("剖析文件无法读取", file=sys.stderr)
+        return 1
+
+    if args.top:
+        print(f"# {len(paths)} 个剖析文件")
+        stats.sort_stats(args.sort).print_stats(args.top)
+        return 0
+
+    folded = format_folded(folded_stacks(stats))
+    if args.output:
+        Path(args.output).write_text(folded, encoding="utf-8")
+        print(f"已汇总 {len(paths)} 个剖析文件 → {args.output}（flamegraph.pl / speedscope 可直接打开）")
+    else:
+        sys.stdout.write(folded)
+    return 0
+
+
+def cmd_prune(args) -> int:
+    config = retention_config()
+    for key in ("max_age_days", "max_total_mb", "max_sessions"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+
+    report = prune(config=config, dry_run=args.dry_run)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    verb = "将删除" if args.dry_run else "已删除"
+    days = report["days"]
+    span = f"（{days[0]} ~ {days[-1]}）" if len(days) > 1 else f"（{days[0]}）" if days else ""
+    print(f"{verb} {len(days)} 天 feedback{span}、{report['sessions']} 个会话，释放 {report['bytes'] / 1024:.0f}KB")
+    if report["archived"]:
+        print(f"已将 {report['archived']} 条记录的统计并入 feedback/archive.json")
+    print(f"feedback 剩余 {report['remaining_bytes'] / 1024 / 1024:.1f}MB（上限 {config['max_total_mb']}MB）")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Auto-Decision 管理工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("stats", help="查看各 hook 分阶段耗时")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.add_argument("--reset", action="store_true", help="清空统计")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("rules", help="规则命中统计与清理建议")
+    p.add_argument("--days", type=int, default=30, help="超过多少天未命中视为可清理（默认 30）")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.set_defaults(func=cmd_rules)
+
+    p = sub.add_parser("sweep", help="批量收尾没有执行结果的 ask 请求（当前项目）")
+    p.add_argument("--older-than-hours", type=float, default=1, help="只处理早于 N 小时的请求（默认 1）")
+    p.add_argument("--days", type=int, default=7, help="回溯多少天的日志（默认 7）")
+    p.add_argument("--session", help="只处理指定会话")
+    p.set_defaults(func=cmd_sweep)
+
+    p = sub.add_parser("memo", help="决策缓存命中率")
+    p.add_argument("--clear", action="store_true", help="清空缓存")
+    p.set_defaults(func=cmd_memo)
+
+    p = sub.add_parser("analytics", help="feedback 统计：决策分布、批准率、按小时分布（当前项目）")
+    p.add_argument("--days", type=int, default=7, help="统计多少天，0 表示全部（默认 7）")
+    p.add_argument("--top", type=int, default=10, help="按工具/模式各显示前 N 项（默认 10）")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.set_defaults(func=cmd_analytics)
+
+    p = sub.add_parser("replay", help="用历史 feedback 回放候选规则集（当前项目）")
+    p.add_argument("--rules", nargs="+", required=True, metavar="FILE", help="候选规则文件（Markdown）")
+    p.add_argument("--only", action="store_true", help="只用候选规则，不叠加当前规则")
+    p.add_argument("--baseline", choices=("current", "recorded"), default="current",
+                   help="对比基线：当前规则（默认）或日志里记录的决策")
+    p.add_argument("--days", type=int, default=30, help="回放多少天的日志，0 表示全部（默认 30）")
+    p.add_argument("--workers", type=int, help="并行进程数（默认 CPU 数）")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出")
+    p.set_defaults(func=cmd_replay)
+
+    p = sub.add_parser("prune", help="按保留策略清理旧的 feedback / 会话文件（当前项目）")
+    p.add_argument("--dry-run", action="store_true", help="只显示将删除的内容")
+    p.add_argument("--max-age-days", type=int, help="覆盖 retention.max_age_days")
+    p.add_argument("--max-total-mb", type=float, help="覆盖 retention.max_total_mb")
+    p.add_argument("--max-sessions", type=int, help="覆盖 retention.max_sessions")
+    p.add_argument("--json", action="store_true", help="JSON 格式输出")
+    p.set_defaults(func=cmd_prune)
+
+    p = sub.add_parser("profile", help="汇总剖析文件为火焰图折叠栈（或按函数排序）")
+    p.add_argument("--hook", help="只汇总指定 hook（如 auto_decision）")
+    p.add_argument("--tool", help="只汇总指定工具（如 Bash）")
+    p.add_argument("--days", type=int, default=7, help="汇总最近多少天，0 表示全部（默认 7）")
+    p.add_argument("-o", "--output", help="写入文件（默认输出到 stdout）")
+    p.add_argument("--top", type=int, help="改为输出前 N 个函数的统计")
+    p.add_argument("--sort", default="cumulative", choices=("cumulative", "tottime", "ncalls"),
+                   help="--top 的排序方式（默认 cumulative）")
+    p.set_defaults(func=cmd_profile)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,64 +7,147 @@ auto_decision.py - PreToolUse Hook
 import json
 import sys
 from pathlib import Path
+from typing import Optional
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+from lib.timing import stage, flush_timings
+from lib.profiling import profiled, tag_tool
 from lib.logger import log
-from lib.rules import load_rules, match_rules
+from lib.rules import load_rules, match_rule
+from lib.rule_stats import flush_rule_hits, record_rule_hit
+from lib.rule_scores import sample_for_review
+from lib.memo import MEMO_MAX_ENTRIES, load_memo, memo_get, memo_key, memo_put, rules_version, save_memo
 from lib.storage import log_request, load_config
 from lib.llm import is_llm_enabled, llm_decide
+from lib.similar import find_similar, remember_decision
 
 
-def main():
-    try:
-        data = json.load(sys.stdin)
-    except json.JSONDecodeError:
-        log("PreToolUse", "JSON解析失败")
-        sys.exit(0)
+def evaluate(tool_name: str, tool_input: dict):
+    """
+    规则匹配 + LLM 兜底
+
+    返回 (decision, reason, rule, cacheable)
+    """
+    with stage("PreToolUse", "load_rules"):
+        rules = load_rules()
+    with stage("PreToolUse", "match_rules"):
+        rule = match_rule(tool_name, tool_input, rules)
+
+    if rule is not None:
+        record_rule_hit(rule)
+        decision, reason = rule.get("action", "ask"), rule.get("reason")
+    else:
+        decision, reason = "ask", None
+
+    cacheable = True
+    # 如果规则没命中且启用了 LLM，先找相似的已决策请求，没有再调用 LLM
+    if decision == "ask" and is_llm_enabled():
+        similar_config = load_config().get("similarity", {})
+        similar = None
+        if similar_config.get("enabled", True):
+            with stage("PreToolUse", "similar"):
+                similar = find_similar(tool_name, tool_input, similar_config)
+
+        if similar is not None:
+            decision, reason = similar["decision"], similar["reason"]
+            log("PreToolUse", f"复用相似请求的决策 ({similar['similarity']:.2f}): {similar['text'][:60]}")
+        else:
+            with stage("PreToolUse", "llm_decide"):
+                decision, reason = llm_decide(tool_name, tool_input)
+            if similar_config.get("enabled", True):
+                remember_decision(tool_name, tool_input, decision, reason, similar_config)
+        # LLM 没给出明确结论（超时/失败）时不缓存，下次还可以重试
+        cacheable = decision in ("allow", "deny")
+
+    return decision, reason, rule, cacheable
+
 
+def run(data: dict) -> Optional[dict]:
+    """决策一次工具调用，返回 hook 输出（ask 时为 None）"""
     tool_name = data.get("tool_name", "")
+    tag_tool(tool_name)
     tool_input = data.get("tool_input", {})
     tool_use_id = data.get("tool_use_id", "")
     session_id = data.get("session_id", "")
 
-    # 加载规则并匹配
-    rules = load_rules()
-    decision, reason = match_rules(tool_name, tool_input, rules)
+    config = load_config()
+    memo_config = config.get("memo", {})
+    memo = None
+    cached = None
 
-    # 如果规则没命中且启用了 LLM，尝试 LLM 决策
-    if decision == "ask" and is_llm_enabled():
-        decision, reason = llm_decide(tool_name, tool_input)
+    # 完全相同的调用直接复用上次的决策
+    if memo_config.get("enabled", True):
+        with stage("PreToolUse", "memo"):
+            memo = load_memo()
+            key = memo_key(tool_name, tool_input, rules_version())
+            cached = memo_get(memo, key)
+
+    if cached is not None:
+        decision, reason, rule = cached["decision"], cached.get("reason"), cached.get("rule")
+        if rule:
+            record_rule_hit(rule)
+    else:
+        decision, reason, rule, cacheable = evaluate(tool_name, tool_input)
+        if memo is not None and cacheable:
+            memo_put(memo, key, decision, reason, rule)
+
+    # 命中时只追加命中记录，不重写缓存文件
+    if memo is not None:
+        save_memo(memo, memo_config.get("max_entries", MEMO_MAX_ENTRIES))
+
+    # 学习规则的决策按比例交给用户复核，结果用于重新评分（缓存里保留规则的决策）
+    if sample_for_review(rule, decision, config.get("learning", {})):
+        log("PreToolUse", f"抽样复核学习规则 {rule.get('id', '')}: {decision} → ask")
+        decision, reason = "ask", None
 
     # 简洁日志
     log("PreToolUse", f"{tool_name} → {decision}")
 
     # 记录请求到 feedback
     try:
-        log_request(
-            request_id=tool_use_id,
-            tool_name=tool_name,
-            tool_input=tool_input,
-            auto_decision=decision,
-            session_id=session_id,
-        )
+        with stage("PreToolUse", "log_request"):
+            log_request(
+                request_id=tool_use_id,
+                tool_name=tool_name,
+                tool_input=tool_input,
+                auto_decision=decision,
+                session_id=session_id,
+            )
     except Exception as e:
         log("PreToolUse", f"记录失败: {e}")
 
     # 输出决策
     if decision in ("allow", "deny"):
-        output = {
+        return {
             "hookSpecificOutput": {
                 "hookEventName": "PreToolUse",
                 "permissionDecision": decision,
                 "permissionDecisionReason": reason or f"Auto {decision}",
             }
         }
+    return None
+
+
+def main():
+    try:
+        with stage("PreToolUse", "parse"):
+            data = json.load(sys.stdin)
+    except json.JSONDecodeError:
+        log("PreToolUse", "JSON解析失败")
+        sys.exit(0)
+
+    output = run(data)
+    if output:
         print(json.dumps(output))
 
 
 if __name__ == "__main__":
     try:
-        main()
+        with profiled("auto_decision"):
+            main()
     except Exception as e:
         log("PreToolUse", f"错误: {e}")
+    finally:
+        flush_rule_hits()
+        flush_timings()
@@ -7,13 +7,16 @@ context_injector.py - UserPromptSubmit Hook
 import json
 import sys
 from pathlib import Path
+from typing import Optional
 
 CLAUDE_HOME = Path.home() / ".claude"
-MEMORY_BANK_GLOBAL = CLAUDE_HOME / "memory-bank"
-MEMORY_BANK_PROJECT = Path(".claude/memory-bank")
 
 sys.path.insert(0, str(CLAUDE_HOME / "hooks"))
+from lib import MEMORY_BANK_GLOBAL, MEMORY_BANK_PROJECT
+from lib.timing import stage, flush_timings
+from lib.profiling import profiled
 from lib.logger import log
+from lib.session_summary import kick_stale_jobs
 
 
 def load_error_patterns() -> list:
@@ -60,48 +63,65 @@ def detect_task_type(prompt: str) -> str:
     return "general"
 
 
-def main():
-    try:
-        data = json.load(sys.stdin)
-    except json.JSONDecodeError:
-        sys.exit(0)
+def run(data: dict) -> Optional[dict]:
+    """根据用户消息生成要注入的上下文，没有时返回 None"""
+    # 上次会话排队的总结没处理完时重新拉起 worker
+    with stage("PromptSubmit", "summary_jobs"):
+        kick_stale_jobs()
 
     prompt = data.get("prompt", "")
     if not prompt:
-        sys.exit(0)
+        return None
 
     task_type = detect_task_type(prompt)
     log("PromptSubmit", f"任务类型: {task_type}")
 
     if task_type == "simple":
-        sys.exit(0)
+        return None
 
     context_parts = []
 
-    if task_type == "implementation":
-        errors = load_error_patterns()
-        if errors:
-            err_list = [p.get("pattern", str(p)) if isinstance(p, dict) else str(p) for p in errors]
-            context_parts.append("⚠️ 注意避免:\n" + "\n".join(f"- {e}" for e in err_list[:3]))
-
-    lesson = load_core_lesson()
-    if lesson:
-        context_parts.append(f"💡 {lesson}")
-
-    if context_parts:
-        log("PromptSubmit", "注入上下文")
-        output = {
-            "hookSpecificOutput": {
-                "hookEventName": "UserPromptSubmit",
-                "message": "📚 已加载经验上下文",
-                "systemPrompt": f"<context>\n{chr(10).join(context_parts)}\n</context>"
-            }
+    with stage("PromptSubmit", "load_context"):
+        if task_type == "implementation":
+            errors = load_error_patterns()
+            if errors:
+                err_list = [p.get("pattern", str(p)) if isinstance(p, dict) else str(p) for p in errors]
+                context_parts.append("⚠️ 注意避免:\n" + "\n".join(f"- {e}" for e in err_list[:3]))
+
+        lesson = load_core_lesson()
+        if lesson:
+            context_parts.append(f"💡 {lesson}")
+
+    if not context_parts:
+        return None
+
+    log("PromptSubmit", "注入上下文")
+    return {
+        "hookSpecificOutput": {
+            "hookEventName": "UserPromptSubmit",
+            "message": "📚 已加载经验上下文",
+            "systemPrompt": f"<context>\n{chr(10).join(context_parts)}\n</context>"
         }
+    }
+
+
+def main():
+    try:
+        with stage("PromptSubmit", "parse"):
+            data = json.load(sys.stdin)
+    except json.JSONDecodeError:
+        sys.exit(0)
+
+    output = run(data)
+    if output:
         print(json.dumps(output, ensure_ascii=False))
 
 
 if __name__ == "__main__":
     try:
-        main()
+        with profiled("context_injector"):
+            main()
     except Exception as e:
         log("PromptSubmit", f"错误: {e}")
+    finally:
+        flush_timings()
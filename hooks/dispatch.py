@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+dispatch.py - 合并的 UserPromptSubmit / PostToolUse 入口
+
+每个 hook 单独配置时，一次提交消息或一次工具调用要启动多个 Python 进程，
+各自设置 sys.path、读同样的配置文件。dispatch.py 在一个进程里运行同一事件的全部 provider：
+
+    python3 ~/.claude/hooks/dispatch.py prompt   # UserPromptSubmit
+    python3 ~/.claude/hooks/dispatch.py post     # PostToolUse
+
+- provider 是 hook 模块的 run(data) 函数，返回该 hook 原本要输出的 JSON（或 None）
+- stdin 只解析一次，provider 在线程中并发运行，每个有自己的时间预算（dispatch.budgets_ms）；
+  预算只决定输出是否参与合并：超出预算的 provider 输出丢弃
+- PostToolUse 的 provider 有副作用（标记执行结果、领取并运行模式检测），超出预算后仍在后台跑完，
+  合并输出写出后进程等它们结束再退出，不会把写到一半的状态留下；UserPromptSubmit 的 provider 只读，超时直接丢弃
+- 输出合并：systemPrompt / message 按 provider 顺序用空行拼接，systemMessage 逐行拼接
+- 运行哪些 provider 由 dispatch.prompt / dispatch.post 配置（update_checker 默认不启用）
+
+原来的单个 hook 脚本仍可独立运行。开启剖析模式时每个 provider 单独生成 .prof 文件。
+"""
+
+import importlib
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from lib.timing import stage, record, flush_timings
+from lib.profiling import profiled
+from lib.logger import log
+from lib.storage import load_config
+
+EVENTS = {
+    "prompt": "UserPromptSubmit",
+    "post": "PostToolUse",
+}
+
+DEFAULT_PROVIDERS = {
+    "prompt": ["context_injector"],
+    "post": ["feedback_collector", "experience_saver"],
+}
+
+# 每个 provider 的默认时间预算（毫秒）
+DEFAULT_BUDGETS_MS = {
+    "context_injector": 1000,
+    "update_checker": 500,
+    "feedback_collector": 2000,
+    "experience_saver": 10000,
+}
+FALLBACK_BUDGET_MS = 2000
+# provider 有副作用、超出预算也必须跑完的事件
+RUN_TO_COMPLETION = {"post"}
+
+# 超出预算、仍在后台运行的 provider（run_pending 等它们结束）
+_pending: list["_Call"] = []
+
+
+class _Call:
+    """在守护线程中运行一个 provider"""
+
+    def __init__(self, name: str, data: dict, daemon: bool = True):
+        self.name = name
+        self.output: Optional[dict] = None
+        self.error: Optional[Exception] = None
+        self.elapsed_ms = 0.0
+        self._data = data
+        # 非守护线程：解释器退出前会等它结束，不会在写状态的中途被杀掉
+        self._thread = threading.Thread(target=self._run, name=f"provider-{name}", daemon=daemon)
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            module = importlib.import_module(self.name)
+            with profiled(self.name, self._data.get("tool_name", "")):
+                self.output = module.run(self._data)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.elapsed_ms = (time.perf_counter() - start) * 1000
+
+    def start(self):
+        self._thread.start()
+
+    def join(self, deadline: Optional[float] = None) -> bool:
+        self._thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        return not self._thread.is_alive()
+
+    @property
+    def daemon(self) -> bool:
+        return self._thread.daemon
+
+
+def merge_outputs(event: str, outputs: list[dict]) -> Optional[dict]:
+    """把多个 provider 的输出合并成一个 hook 输出"""
+    merged: dict = {}
+    system_prompts, messages, system_messages = [], [], []
+    for output in outputs:
+        specific = output.get("hookSpecificOutput") or {}
+        if specific.get("systemPrompt"):
+            system_prompts.append(specific["systemPrompt"])
+        if specific.get("message"):
+            messages.append(specific["message"])
+        if output.get("systemMessage"):
+            system_messages.append(output["systemMessage"])
+        for key, value in output.items():
+            if key not in ("hookSpecificOutput", "systemMessage"):
+                merged.setdefault(key, value)
+
+    if system_prompts or messages:
+        specific = {"hookEventName": event}
+        if messages:
+            specific["message"] = "\n".join(messages)
+        if system_prompts:
+            specific["systemPrompt"] = "\n\n".join(system_prompts)
+        merged["hookSpecificOutput"] = specific
+    if system_messages:
+        merged["systemMessage"] = "\n".join(system_messages)
+    return merged or None
+
+
+def dispatch(kind: str, data: dict, config: Optional[dict] = None) -> Optional[dict]:
+    """并发运行 kind 事件的全部 provider，返回合并后的输出"""
+    event = EVENTS[kind]
+    config = (config if config is not None else load_config()).get("dispatch", {})
+    names = config.get(kind, DEFAULT_PROVIDERS[kind])
+    budgets = {**DEFAULT_BUDGETS_MS, **config.get("budgets_ms", {})}
+
+    calls = [_Call(name, data, daemon=kind not in RUN_TO_COMPLETION) for name in names]
+    started = time.monotonic()
+    for call in calls:
+        call.start()
+
+    outputs = []
+    for call in calls:
+        budget_ms = budgets.get(call.name, FALLBACK_BUDGET_MS)
+        if not call.join(started + budget_ms / 1000):
+            if call.daemon:
+                log("Dispatch", f"{call.name} 超出预算 {budget_ms}ms，忽略其输出")
+            else:
+                log("Dispatch", f"{call.name} 超出预算 {budget_ms}ms，忽略其输出，后台继续运行")
+                _pending.append(call)
+            continue
+        record("Dispatch", call.name, call.elapsed_ms)
+        if call.error is not None:
+            log("Dispatch", f"{call.name} 错误: {call.error}")
+        elif call.output:
+            outputs.append(call.output)
+    return merge_outputs(event, outputs)
+
+
+def run_pending():
+    """等超出预算的 provider 跑完（进程退出前调用）"""
+    while _pending:
+        call = _pending.pop(0)
+        call.join()
+        record("Dispatch", call.name, call.elapsed_ms)
+        if call.error is not None:
+            log("Dispatch", f"{call.name} 错误: {call.error}")
+
+
+def main():
+    kind = sys.argv[1] if len(sys.argv) > 1 else ""
+    if kind not in EVENTS:
+        print(f"用法: dispatch.py {{{'|'.join(EVENTS)}}}", file=sys.stderr)
+        sys.exit(0)
+
+    try:
+        with stage("Dispatch", "parse"):
+            data = json.load(sys.stdin)
+    except json.JSONDecodeError:
+        data = {}
+    if kind == "prompt" and not data:
+        sys.exit(0)
+
+    output = dispatch(kind, data)
+    if output:
+        print(json.dumps(output, ensure_ascii=False))
+    sys.stdout.flush()
+    run_pending()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        log("Dispatch", f"错误: {e}")
+    finally:
+        flush_timings()
+        sys.stdout.flush()
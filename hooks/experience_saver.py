@@ -7,54 +7,56 @@ experience_saver.py - PostToolUse Hook
 import json
 import sys
 from pathlib import Path
+from typing import Optional
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+from lib.timing import stage, flush_timings
+from lib.profiling import profiled, tag_tool
 from lib.logger import log
 from lib.storage import load_config
 from lib.patterns import detect_patterns, save_learned_rule, determine_scope, add_pending_global_rule
 from lib.llm import is_llm_enabled, llm_generate_rule_suggestion
+from lib.scheduler import claim_detection
+from lib.rule_scores import rescore_learned_rules
 
-DETECT_INTERVAL = 10
-call_counter_file = Path(__file__).parent / ".experience_counter"
 
-
-def get_call_count() -> int:
-    if call_counter_file.exists():
-        return int(call_counter_file.read_text().strip() or "0")
-    return 0
-
-
-def set_call_count(count: int):
-    call_counter_file.write_text(str(count))
-
-
-def main():
-    try:
-        data = json.load(sys.stdin)
-    except json.JSONDecodeError:
-        data = {}
-
-    config = load_config()
+def run(data: dict) -> Optional[dict]:
+    """按调度检测模式并保存规则；有新规则时返回提示消息"""
+    with stage("ExpSaver", "load_config"):
+        config = load_config()
     if not config.get("learning", {}).get("enabled", True):
-        sys.exit(0)
-
-    count = get_call_count() + 1
-    set_call_count(count)
-
-    if count % DETECT_INTERVAL != 0:
-        sys.exit(0)
-
-    log("ExpSaver", f"检测模式 (第{count}次)")
-
-    suggestions = detect_patterns()
+        return None
+
+    # 只有积累了足够多的新结果（或最早的结果等待过久）时才检测
+    with stage("ExpSaver", "schedule"):
+        outcomes = claim_detection()
+    if outcomes is None:
+        return None
+
+    log("ExpSaver", f"检测模式 ({outcomes} 个新结果)")
+
+    # 先按衰减分数重新评估已有的学习规则
+    messages = []
+    with stage("ExpSaver", "rescore"):
+        changes = rescore_learned_rules()
+    for label in changes["demoted"]:
+        messages.append(f"📉 学习规则降级为 ask（近期多次拒绝）: {label}")
+    for label in changes["retired"]:
+        messages.append(f"🗑️ 学习规则已删除（近期行为已改变）: {label}")
+    for label in changes["restored"]:
+        messages.append(f"📈 学习规则已恢复: {label}")
+
+    with stage("ExpSaver", "detect_patterns"):
+        suggestions = detect_patterns()
     if not suggestions:
         log("ExpSaver", "无新规则建议")
-        sys.exit(0)
+        return {"systemMessage": "\n".join(messages)} if messages else None
 
     for suggestion in suggestions:
         if is_llm_enabled():
-            enhanced = llm_generate_rule_suggestion(suggestion)
+            with stage("ExpSaver", "llm_suggestion"):
+                enhanced = llm_generate_rule_suggestion(suggestion)
             if enhanced:
                 suggestion = {**suggestion, **enhanced}
 
@@ -63,7 +65,11 @@ def main():
         action = suggestion.get('action', '')
 
         if scope == "global":
-            pending_id = add_pending_global_rule(suggestion, scope_reason)
+            with stage("ExpSaver", "save_rule"):
+                pending_id = add_pending_global_rule(suggestion, scope_reason)
+            if not pending_id:
+                log("ExpSaver", f"已拒绝过的全局规则，跳过: {tool}→{action}")
+                continue
             log("ExpSaver", f"待确认全局规则: {tool}→{action}")
 
             pattern = suggestion.get('pattern', '')
@@ -73,29 +79,45 @@ def main():
             if pattern:
                 rule_desc += f" ({pattern[:20]}...)" if len(pattern) > 20 else f" ({pattern})"
 
-            output = {
-                "systemMessage": (
-                    f"\n╔══════════════════════════════════════════════════════════╗\n"
-                    f"║  🌐 检测到可能适用于【全局】的规则                        ║\n"
-                    f"╠══════════════════════════════════════════════════════════╣\n"
-                    f"║  规则: {rule_desc:<50} ║\n"
-                    f"║  原因: {reason:<50} ║\n"
-                    f"╠══════════════════════════════════════════════════════════╣\n"
-                    f"║  💬 请回复:「同意全局」「仅本项目」「忽略」              ║\n"
-                    f"╚══════════════════════════════════════════════════════════╝"
-                )
-            }
-            print(json.dumps(output, ensure_ascii=False))
+            messages.append(
+                f"\n╔══════════════════════════════════════════════════════════╗\n"
+                f"║  🌐 检测到可能适用于【全局】的规则                        ║\n"
+                f"╠══════════════════════════════════════════════════════════╣\n"
+                f"║  规则: {rule_desc:<50} ║\n"
+                f"║  原因: {reason:<50} ║\n"
+                f"╠══════════════════════════════════════════════════════════╣\n"
+                f"║  💬 请回复:「同意全局」「仅本项目」「忽略」              ║\n"
+                f"╚══════════════════════════════════════════════════════════╝"
+            )
         else:
-            rule_id = save_learned_rule(suggestion, scope="project")
+            with stage("ExpSaver", "save_rule"):
+                rule_id = save_learned_rule(suggestion, scope="project")
             if rule_id:
                 log("ExpSaver", f"保存项目规则: {tool}→{action}")
-                output = {"systemMessage": f"📁 学习到项目规则: {suggestion.get('reason', '')}"}
-                print(json.dumps(output, ensure_ascii=False))
+                messages.append(f"📁 学习到项目规则: {suggestion.get('reason', '')}")
+
+    # 多条规则合并成一个输出（stdout 只能有一个 JSON 对象）
+    return {"systemMessage": "\n".join(messages)} if messages else None
+
+
+def main():
+    try:
+        with stage("ExpSaver", "parse"):
+            data = json.load(sys.stdin)
+    except json.JSONDecodeError:
+        data = {}
+
+    tag_tool(data.get("tool_name", ""))
+    output = run(data)
+    if output:
+        print(json.dumps(output, ensure_ascii=False))
 
 
 if __name__ == "__main__":
     try:
-        main()
+        with profiled("experience_saver"):
+            main()
     except Exception as e:
         log("ExpSaver", f"错误: {e}")
+    finally:
+        flush_timings()
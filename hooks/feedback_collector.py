@@ -7,32 +7,54 @@ feedback_collector.py - PostToolUse Hook
 import json
 import sys
 from pathlib import Path
+from typing import Optional
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+from lib.timing import stage, flush_timings
+from lib.profiling import profiled, tag_tool
 from lib.logger import log
 from lib.storage import update_request_executed
+from lib.scheduler import note_resolved
+from lib.rule_scores import note_outcomes
 
 
-def main():
-    try:
-        data = json.load(sys.stdin)
-    except json.JSONDecodeError:
-        sys.exit(0)
-
+def run(data: dict) -> Optional[dict]:
+    """标记请求已执行（没有输出）"""
     tool_name = data.get("tool_name", "")
     tool_use_id = data.get("tool_use_id", "")
 
     if tool_use_id:
-        updated = update_request_executed(tool_use_id, executed=True)
+        with stage("PostToolUse", "update_executed"):
+            updated = update_request_executed(tool_use_id, executed=True)
         if updated:
             log("PostToolUse", f"{tool_name} 已执行")
+            # 用户批准了一个 ask 请求，模式检测有了新数据
+            if updated.get("auto_decision") == "ask":
+                with stage("PostToolUse", "note_resolved"):
+                    note_resolved()
+                    note_outcomes([(updated, True)])
         else:
             log("PostToolUse", f"未找到记录: {tool_name} {tool_use_id}")
+    return None
+
+
+def main():
+    try:
+        with stage("PostToolUse", "parse"):
+            data = json.load(sys.stdin)
+    except json.JSONDecodeError:
+        sys.exit(0)
+
+    tag_tool(data.get("tool_name", ""))
+    run(data)
 
 
 if __name__ == "__main__":
     try:
-        main()
+        with profiled("feedback_collector"):
+            main()
     except Exception as e:
         log("PostToolUse", f"错误: {e}")
+    finally:
+        flush_timings()
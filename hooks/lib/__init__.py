@@ -2,14 +2,27 @@
 # 自动决策系统核心库
 
 from pathlib import Path
+from .paths import resolve_project_chain
 
 # 路径常量
 CLAUDE_HOME = Path.home() / ".claude"
 AUTO_DECISION_DIR = CLAUDE_HOME / "auto-decision"
 MEMORY_BANK_GLOBAL = CLAUDE_HOME / "memory-bank"
-MEMORY_BANK_PROJECT = Path(".claude/memory-bank")
 HOOKS_DIR = CLAUDE_HOME / "hooks"
 
+
+def _project_chain() -> list[Path]:
+    try:
+        cwd = Path.cwd()
+    except OSError:  # cwd 已被删除
+        return [Path(".claude/memory-bank")]
+    return resolve_project_chain(cwd, Path.home(), AUTO_DECISION_DIR / "project_roots.json")
+
+
+# 项目 memory-bank：从 cwd 向上查找，由近到远；第一个是当前项目（feedback 写入位置）
+PROJECT_MEMORY_BANKS = _project_chain()
+MEMORY_BANK_PROJECT = PROJECT_MEMORY_BANKS[0]
+
 # 配置文件
 CONFIG_FILE = AUTO_DECISION_DIR / "config.json"
 PROFILE_FILE = MEMORY_BANK_GLOBAL / "profile.md"
@@ -0,0 +1,149 @@
+"""
+analytics.py - feedback 统计
+
+一次遍历把记录读成列式编码（工具 / 模式 / 决策×结果 / 小时），
+再用 bincount 一次性得到：
+
+- 决策分布（allow / deny / ask）及 ask 的用户批准 / 拒绝 / 未决
+- 按工具、按模式（generate_pattern_key）的批准率
+- 按小时的操作分布
+
+装了 NumPy 时用 np.bincount，否则退回纯 Python 计数，结果相同。
+"""
+
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+from .patterns import generate_pattern_key
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖
+    np = None
+
+DECISIONS = ("allow", "deny", "ask", "other")
+# executed: True / False / None
+OUTCOMES = (True, False, None)
+CELLS = len(DECISIONS) * len(OUTCOMES)
+
+
+class Columns:
+    """列式 feedback：字符串列编码成整数下标"""
+
+    def __init__(self):
+        self.tools: list[str] = []
+        self.patterns: list[str] = []
+        self.tool_ids: list[int] = []
+        self.pattern_ids: list[int] = []
+        self.cells: list[int] = []  # 决策 × 结果
+        self.hours: list[int] = []
+        self._tool_index: dict[str, int] = {}
+        self._pattern_index: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def append(self, entry: dict):
+        tool = entry.get("tool") or "unknown"
+        tool_id = self._tool_index.get(tool)
+        if tool_id is None:
+            tool_id = self._tool_index[tool] = len(self.tools)
+            self.tools.append(tool)
+
+        pattern = generate_pattern_key(tool, entry.get("input") or {})
+        pattern_id = self._pattern_index.get(pattern)
+        if pattern_id is None:
+            pattern_id = self._pattern_index[pattern] = len(self.patterns)
+            self.patterns.append(pattern)
+
+        decision = entry.get("auto_decision")
+        decision_id = DECISIONS.index(decision) if decision in DECISIONS[:3] else 3
+        executed = entry.get("executed")
+        outcome_id = 0 if executed is True else 1 if executed is False else 2
+
+        ts = entry.get("ts") or ""
+        hour = int(ts[11:13]) if ts[11:13].isdigit() else -1
+
+        self.tool_ids.append(tool_id)
+        self.pattern_ids.append(pattern_id)
+        self.cells.append(decision_id * len(OUTCOMES) + outcome_id)
+        self.hours.append(hour)
+
+
+def load_columns(entries: Iterable[dict]) -> Columns:
+    columns = Columns()
+    for entry in entries:
+        columns.append(entry)
+    return columns
+
+
+def load_columns_from_files(files: Iterable[Path]) -> Columns:
+    """逐行读 JSONL，不先构造完整的记录列表"""
+    columns = Columns()
+    for log_file in files:
+        try:
+            f = open(log_file, "rb")
+        except OSError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    columns.append(json.loads(line))
+                except ValueError:
+                    continue
+    return columns
+
+
+def _bincount(values: list[int], size: int) -> list[int]:
+    if np is not None:
+        return np.bincount(np.asarray(values, dtype=np.int64), minlength=size).tolist()
+    counts = [0] * size
+    for value, count in Counter(values).items():
+        counts[value] = count
+    return counts
+
+
+def _outcome_stats(cells: list[int]) -> dict:
+    """把一组 决策×结果 计数转成统计字段"""
+    def cell(decision: str, executed) -> int:
+        return cells[DECISIONS.index(decision) * len(OUTCOMES) + OUTCOMES.index(executed)]
+
+    approved = cell("ask", True)
+    rejected = cell("ask", False)
+    return {
+        "total": sum(cells),
+        "auto_allowed": sum(cell("allow", e) for e in OUTCOMES),
+        "auto_denied": sum(cell("deny", e) for e in OUTCOMES),
+        "user_approved": approved,
+        "user_rejected": rejected,
+        "pending": cell("ask", None),
+        "approval_rate": approved / (approved + rejected) if approved + rejected else None,
+    }
+
+
+def _grouped(ids: list[int], cells: list[int], names: list[str]) -> dict:
+    counts = _bincount([i * CELLS + c for i, c in zip(ids, cells)], len(names) * CELLS)
+    return {
+        name: _outcome_stats(counts[i * CELLS:(i + 1) * CELLS])
+        for i, name in enumerate(names)
+    }
+
+
+def analyze(columns: Columns) -> dict:
+    """计算整体 / 按工具 / 按模式的决策统计和按小时分布"""
+    cells = _bincount(columns.cells, CELLS)
+    stats = _outcome_stats(cells)
+    stats["decisions"] = {
+        decision: sum(cells[i * len(OUTCOMES):(i + 1) * len(OUTCOMES)])
+        for i, decision in enumerate(DECISIONS[:3])
+    }
+    stats["tools"] = _grouped(columns.tool_ids, columns.cells, columns.tools)
+    stats["patterns"] = _grouped(columns.pattern_ids, columns.cells, columns.patterns)
+    stats["hours"] = _bincount([h for h in columns.hours if 0 <= h < 24], 24)
+    return stats
+
+
+def summarize(entries: Iterable[dict]) -> dict:
+    """只要整体决策统计时的快捷方式（会话总结用）"""
+    return _outcome_stats(_bincount(load_columns(entries).cells, CELLS))
@@ -0,0 +1,174 @@
+"""
+generalize.py - 规则建议的确定性泛化
+
+detect_patterns 对每个 generate_pattern_key 单独给出建议（^npm\\ test、^npm\\ run、**/*.ts ……），
+这里把同类建议合并成更少、覆盖更广的规则，不需要 LLM：
+
+- 同一命令下的子命令：npm test + npm run → ^npm\\ (?:run|test)(?:\\s|$)；
+  只覆盖批准过的子命令，不会放宽到整个命令（批准过 git status / diff / log 不代表 git push --force 安全）
+- 单个词的命令：ls + cat → ^(?:cat|ls)(?:\\s|$)
+- 同一扩展名的不同工具：Write + Edit → tool: Edit|Write
+- 同一组工具的不同扩展名：**/*.ts + **/*.tsx → **/*.{ts,tsx}
+
+每条合并结果都在历史记录上校验：allow 规则不能匹配被拒绝过的请求、deny 规则不能匹配被批准过的请求
+（成员规则自己已经覆盖的记录除外，它们已计入各自的置信度），否则保留原来的建议不合并。
+"""
+
+import re
+from collections import defaultdict
+from typing import Iterable
+from .rules import matches
+
+BOUNDARY = r"(?:\s|$)"
+
+
+def _counter_examples(feedback: Iterable[dict], action: str) -> list[tuple[str, dict]]:
+    """与 action 相反的历史结果：allow 对应被拒绝的请求，deny 对应被批准的请求"""
+    opposite = action != "allow"
+    return [
+        (entry.get("tool", ""), entry.get("input", {}))
+        for entry in feedback
+        if entry.get("auto_decision") == "ask" and entry.get("executed") is opposite
+    ]
+
+
+def _verified(candidate: dict, members: list[dict], counters: list[tuple[str, dict]]) -> bool:
+    for tool, tool_input in counters:
+        if matches(candidate, tool, tool_input) and not any(matches(m, tool, tool_input) for m in members):
+            return False
+    return True
+
+
+def _merge(members: list[dict], **fields) -> dict:
+    approved = sum(m["based_on"]["approved"] for m in members)
+    rejected = sum(m["based_on"]["rejected"] for m in members)
+    action = members[0]["action"]
+    total = approved + rejected
+    samples = [s for m in members for s in m["based_on"]["samples"]][:5]
+    merged = {
+        "action": action,
+        "confidence": round((approved if action == "allow" else rejected) / total, 2) if total else 0,
+        "based_on": {"approved": approved, "rejected": rejected, "samples": samples},
+        "pattern_keys": sorted(k for m in members for k in m.get("pattern_keys", [])),
+    }
+    merged.update(fields)
+    return merged
+
+
+def _key_value(suggestion: dict) -> tuple[str, str]:
+    """(pattern_type, pattern_value)，来自建议的 pattern_key"""
+    keys = suggestion.get("pattern_keys") or []
+    if len(keys) != 1:
+        return "", ""
+    parts = keys[0].split(":", 2)
+    return (parts[1], parts[2]) if len(parts) == 3 else ("", "")
+
+
+def _alternation(values: list[str]) -> str:
+    return "(?:" + "|".join(re.escape(v) for v in sorted(values)) + ")"
+
+
+def _verb(action: str) -> str:
+    return "总是批准" if action == "allow" else "总是拒绝"
+
+
+def _generalize_commands(suggestions: list[dict], feedback: list[dict]) -> list[dict]:
+    groups = defaultdict(list)
+    for s in suggestions:
+        words = _key_value(s)[1].split(" ", 1)
+        head, tail = (words[0], words[1]) if len(words) == 2 else ("", words[0])
+        groups[(s["tool"], s["action"], head)].append((tail, s))
+
+    result = []
+    for (tool, action, head), items in groups.items():
+        members = [s for _, s in items]
+        if len(items) < 2:
+            result.extend(members)
+            continue
+        tails = [tail for tail, _ in items]
+        # 只合并成员子命令的列表，不放宽到整个命令
+        if head:
+            pattern = f"^{re.escape(head)}\\ {_alternation(tails)}{BOUNDARY}"
+            label = f"{head} {'/'.join(sorted(tails))} 命令"
+        else:
+            pattern = f"^{_alternation(tails)}{BOUNDARY}"
+            label = f"{'/'.join(sorted(tails))} 命令"
+
+        candidate = {"tool": tool, "action": action, "pattern": pattern}
+        if _verified(candidate, members, _counter_examples(feedback, action)):
+            result.append(_merge(members, tool=tool, pattern=pattern, reason=f"用户{_verb(action)} {label}"))
+        else:
+            result.extend(members)
+    return result
+
+
+def _generalize_files(suggestions: list[dict], feedback: list[dict]) -> list[dict]:
+    result = []
+    by_ext = defaultdict(list)
+    for s in suggestions:
+        ext = _key_value(s)[1]
+        if not ext.startswith("."):
+            result.append(s)  # 无扩展名等无法合并的建议
+            continue
+        by_ext[(s["action"], ext)].append(s)
+
+    # 1. 同扩展名的不同工具合并：Write + Edit
+    merged_tools = []
+    for (action, ext), members in by_ext.items():
+        if len(members) == 1:
+            merged_tools.append((ext, members[0], members))
+            continue
+        tool = "|".join(sorted(m["tool"] for m in members))
+        candidate = {"tool": tool, "action": action, "path": f"**/*{ext}"}
+        if _verified(candidate, members, _counter_examples(feedback, action)):
+            merged_tools.append((ext, _merge(members, **candidate), members))
+        else:
+            merged_tools.extend((ext, m, [m]) for m in members)
+
+    # 2. 同一组工具的不同扩展名合并：**/*.{ts,tsx}
+    by_tools = defaultdict(list)
+    for ext, s, members in merged_tools:
+        by_tools[(s["tool"], s["action"])].append((ext, s, members))
+    for (tool, action), items in by_tools.items():
+        if len(items) == 1:
+            result.append(items[0][1])
+            continue
+        exts = sorted(ext[1:] for ext, _, _ in items)
+        members = [m for _, _, ms in items for m in ms]
+        candidate = {"tool": tool, "action": action, "path": f"**/*.{{{','.join(exts)}}}"}
+        if _verified(candidate, members, _counter_examples(feedback, action)):
+            label = "/".join(f".{e}" for e in exts)
+            result.append(_merge(
+                [s for _, s, _ in items], **candidate,
+                reason=f"用户对 {label} 文件{'总是批准' if action == 'allow' else '比较谨慎'}",
+            ))
+        else:
+            result.extend(s for _, s, _ in items)
+    for s in result:
+        if "reason" not in s:
+            ext = s["path"].rsplit("*", 1)[-1]
+            s["reason"] = f"用户对 {ext} 文件{'总是批准' if s['action'] == 'allow' else '比较谨慎'}"
+    return result
+
+
+def generalize(suggestions: list[dict], feedback: list[dict]) -> list[dict]:
+    """
+    合并同类规则建议
+
+    suggestions 需带 pattern_keys（detect_patterns 生成）；feedback 是用于校验的历史记录
+    """
+    commands, files, others = [], [], []
+    for s in suggestions:
+        pattern_type = _key_value(s)[0]
+        if pattern_type == "command_prefix" and s.get("pattern"):
+            commands.append(s)
+        elif pattern_type == "file_ext" and s.get("path"):
+            files.append(s)
+        else:
+            others.append(s)
+
+    return (
+        _generalize_commands(commands, feedback)
+        + _generalize_files(files, feedback)
+        + others
+    )
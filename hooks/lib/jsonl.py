@@ -0,0 +1,146 @@
+"""
+jsonl.py - feedback JSONL 的字节级扫描与原地修改
+
+feedback 日志每行一个 JSON 对象，且 "id" 总是第一个字段：
+
+    {"id": "toolu_xxx", ..., "executed": null }
+
+- 按 id / session 查找时先用 mmap 在字节上搜索 token，只解码命中的行
+- 每个日志旁边可选维护一个 {date}.idx（每行 "id<TAB>字节偏移"），点查直接定位
+- executed 字段写成定宽（"null " / "true " / "false"），更新状态时原地覆盖，不重写文件
+"""
+
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+# executed 值的定宽槽位，"false" 最长
+STATUS_WIDTH = 5
+EXECUTED_TOKEN = b'"executed": '
+
+
+def dumps_value(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def format_record(entry: dict) -> bytes:
+    """
+    序列化一条记录（不含换行），executed 放在最后并补齐到定宽，便于原地更新
+    """
+    executed = entry.get("executed")
+    body = {k: v for k, v in entry.items() if k != "executed"}
+    head = json.dumps(body, ensure_ascii=False).encode("utf-8")[:-1]
+    value = dumps_value(executed).ljust(STATUS_WIDTH)
+    return head + b", " + EXECUTED_TOKEN + value + b"}"
+
+
+def id_token(request_id: str) -> bytes:
+    """行首的 id token，只可能出现在行首"""
+    return b'{"id": ' + dumps_value(request_id) + b","
+
+
+def index_path(log_file: Path) -> Path:
+    return log_file.with_suffix(".idx")
+
+
+def append_index(log_file: Path, request_id: str, offset: int):
+    """记录 id → 字节偏移"""
+    with open(index_path(log_file), "a", encoding="utf-8") as f:
+        f.write(f"{request_id}\t{offset}\n")
+
+
+def lookup_index(log_file: Path, request_id: str) -> Optional[int]:
+    """在偏移索引中查找 id，返回字节偏移"""
+    try:
+        data = index_path(log_file).read_bytes()
+    except OSError:
+        return None
+    key = request_id.encode("utf-8") + b"\t"
+    pos = data.rfind(b"\n" + key)
+    if pos != -1:
+        pos += 1
+    elif data.startswith(key):
+        pos = 0
+    else:
+        return None
+    end = data.find(b"\n", pos)
+    try:
+        return int(data[pos + len(key):end if end != -1 else None])
+    except ValueError:
+        return None
+
+
+def read_line_at(log_file: Path, offset: int) -> Optional[bytes]:
+    """读取从 offset 开始的一行（不含换行）"""
+    try:
+        with open(log_file, "rb") as f:
+            f.seek(offset)
+            line = f.readline()
+    except OSError:
+        return None
+    return line.rstrip(b"\n") if line else None
+
+
+def iter_lines_with(log_file: Path, token: bytes) -> Iterator[tuple[int, bytes]]:
+    """
+    用 mmap 搜索包含 token 的行，返回 (行首偏移, 行内容)
+
+    不包含 token 的行不会被解码
+    """
+    try:
+        with open(log_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = mm.find(token)
+                while pos != -1:
+                    start = mm.rfind(b"\n", 0, pos) + 1
+                    end = mm.find(b"\n", pos)
+                    if end == -1:
+                        end = len(mm)
+                    yield start, mm[start:end]
+                    pos = mm.find(token, end)
+    except (OSError, ValueError):
+        return
+
+
+def find_record(log_file: Path, request_id: str, use_index: bool = True) -> Optional[tuple[int, bytes]]:
+    """按 id 查找记录，返回 (偏移, 行内容)；先查偏移索引，失效时退回 mmap 扫描"""
+    token = id_token(request_id)
+
+    if use_index:
+        offset = lookup_index(log_file, request_id)
+        if offset is not None:
+            line = read_line_at(log_file, offset)
+            if line and line.startswith(token):
+                return offset, line
+
+    for offset, line in iter_lines_with(log_file, token):
+        if line.startswith(token):
+            return offset, line
+    return None
+
+
+def patch_executed(log_file: Path, offset: int, line: bytes, executed) -> bool:
+    """
+    原地把一行的 executed 改成新值
+
+    只有槽位宽度放得下时才改（新格式总是放得下），返回是否成功
+    """
+    pos = line.rfind(EXECUTED_TOKEN)
+    if pos == -1 or not line.endswith(b"}"):
+        return False
+    slot_start = pos + len(EXECUTED_TOKEN)
+    width = len(line) - 1 - slot_start
+    value = dumps_value(executed)
+    if len(value) > width:
+        return False
+
+    fd = os.open(log_file, os.O_WRONLY)
+    try:
+        os.pwrite(fd, value.ljust(width), offset + slot_start)
+    finally:
+        os.close(fd)
+    return True
@@ -0,0 +1,204 @@
+"""
+learned_rules.py - 学习规则的结构化存储
+
+learned-rules.md 旁边维护一个 learned-rules.json 作为数据源：
+
+{
+  "version": 1,
+  "md_signature": [mtime_ns, size],   # 上次渲染出的 md 文件签名
+  "rules": {rule_key: {...规则字段, "id": ...}}
+}
+
+- 按 _rule_key 建索引，保存规则是一次字典查找 + 插入，不再对整个 md 做子串匹配
+- learned-rules.md 由 json 渲染生成；规则块以外的内容（开头的说明、HTML 注释、规则后的文字）都会保留，
+  注释里的示例规则不算规则
+- 用户手动编辑 md 后签名变化，下次写入前先从 md 重新导入，手工修改不会被覆盖
+"""
+
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+from .rules import _rule_key, html_comment_spans, parse_rules_md
+from .storage import update_json_locked
+
+# 渲染时的字段顺序，其余字段按字母序排在后面
+FIELD_ORDER = ["tool", "action", "pattern", "path", "reason", "confidence", "learned_at", "based_on"]
+# 不写入 md 的内部字段
+INTERNAL_FIELDS = {"id", "source"}
+
+
+def sidecar_path(rules_file: Path) -> Path:
+    return rules_file.with_suffix(".json")
+
+
+def rule_index_key(rule: dict) -> str:
+    return "\t".join(_rule_key(rule))
+
+
+def _md_signature(rules_file: Path) -> Optional[list]:
+    try:
+        st = rules_file.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _import_from_md(store: dict, rules_file: Path):
+    """md 被手动修改过（或首次使用）时，以 md 内容为准重建索引"""
+    old_rules = store.get("rules", {})
+    rules = {}
+    if rules_file.exists():
+        for rule in parse_rules_md(rules_file.read_text(encoding="utf-8")):
+            key = rule_index_key(rule)
+            # 保留 md 里没有的附加字段（如 pattern_key）
+            rules[key] = {**old_rules.get(key, {}), **rule}
+    store["rules"] = rules
+    store["md_signature"] = _md_signature(rules_file)
+
+
+def _format_value(value) -> str:
+    if isinstance(value, dict) and "approved" in value:
+        return f"批准 {value.get('approved', 0)} 次，拒绝 {value.get('rejected', 0)} 次"
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(v) for v in value)
+    return str(value)
+
+
+def render_rule(rule: dict) -> str:
+    """渲染单条规则为 Markdown 块"""
+    lines = [f"### {rule['id']}"]
+    fields = [k for k in FIELD_ORDER if k in rule]
+    fields += sorted(
+        k for k in rule
+        if k not in FIELD_ORDER and k not in INTERNAL_FIELDS and not k.startswith("_")
+    )
+    for i, key in enumerate(fields):
+        prefix = "- " if i == 0 else "  "
+        lines.append(f"{prefix}{key}: {_format_value(rule[key])}")
+    return "\n".join(lines) + "\n"
+
+
+def _rule_spans(content: str) -> list[tuple[int, int]]:
+    """
+    md 中规则块的位置（### 标题到 "- tool:" 块后的空行），与 parse_rules_md 的切分一致；
+    HTML 注释里的标题不算
+    """
+    comments = html_comment_spans(content)
+
+    def in_comment(pos: int) -> bool:
+        return any(start <= pos < end for start, end in comments)
+
+    headings = [m.start() for m in re.finditer(r"^###\s", content, re.M) if not in_comment(m.start())]
+    spans = []
+    for i, start in enumerate(headings):
+        end = headings[i + 1] if i + 1 < len(headings) else len(content)
+        end = min([c for c, _ in comments if start < c < end] + [end])  # 注释之前为止
+        block_start = content.find("- tool:", start, end)
+        if block_start == -1:
+            continue  # 普通标题，不是规则
+        blank = content.find("\n\n", block_start, end)
+        spans.append((start, blank + 1 if blank != -1 else end))
+    return spans
+
+
+def _render_md(store: dict, rules_file: Path, scope: str):
+    header = f"# {'全局' if scope == 'global' else '项目'}学习规则\n\n## 学习到的规则\n"
+    trailer = ""
+    if rules_file.exists():
+        content = rules_file.read_text(encoding="utf-8")
+        spans = _rule_spans(content)
+        if spans:
+            header = content[:spans[0][0]].rstrip("\n") + "\n"
+            # 规则块之间和之后的其他内容原样保留，接在规则后面
+            gaps = [content[end:start] for (_, end), (start, _) in zip(spans, spans[1:])]
+            trailer = "\n".join(g.strip("\n") for g in gaps + [content[spans[-1][1]:]] if g.strip())
+        else:
+            header = content.rstrip("\n") + "\n"
+
+    body = "\n".join(render_rule(rule) for rule in store["rules"].values())
+    rules_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = rules_file.with_name(f".{rules_file.name}.{os.getpid()}.tmp")
+    text = header + ("\n" + body if body else "") + ("\n" + trailer + "\n" if trailer else "")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, rules_file)
+    store["md_signature"] = _md_signature(rules_file)
+
+
+def _new_rule_id(existing_ids: set) -> str:
+    base = f"learned-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    rule_id, n = base, 1
+    while rule_id in existing_ids:
+        rule_id = f"{base}-{n}"
+        n += 1
+    return rule_id
+
+
+def _with_store(rules_file: Path, scope: str, fn: Callable[[dict], tuple]):
+    """
+    加锁打开 json 索引，fn(store) 返回 (result, changed)；
+    changed 为 True 时重新渲染 md
+    """
+    def mutate(store: dict):
+        store.setdefault("version", 1)
+        if "rules" not in store or store.get("md_signature") != _md_signature(rules_file):
+            _import_from_md(store, rules_file)
+        result, changed = fn(store)
+        if changed:
+            _render_md(store, rules_file, scope)
+        return result
+
+    return update_json_locked(sidecar_path(rules_file), {}, mutate)
+
+
+def add_learned_rule(rules_file: Path, rule: dict, scope: str) -> Optional[str]:
+    """
+    添加一条学习规则
+
+    返回: 新规则 ID；同 key 的规则已存在时返回 None
+    """
+    key = rule_index_key(rule)
+
+    def add(store: dict):
+        if key in store["rules"]:
+            return None, False
+
+        rule_id = _new_rule_id({r.get("id") for r in store["rules"].values()})
+        entry = {
+            "id": rule_id,
+            "tool": rule["tool"],
+            "action": rule["action"],
+        }
+        for field in ("pattern", "path"):
+            if rule.get(field):
+                entry[field] = rule[field]
+        entry["reason"] = rule.get("reason", "从用户行为学习")
+        entry["confidence"] = rule.get("confidence", 0.8)
+        entry["learned_at"] = datetime.now().strftime("%Y-%m-%d")
+        if "based_on" in rule:
+            entry["based_on"] = _format_value(rule["based_on"])
+        if rule.get("pattern_keys"):
+            # 不写入 md，只留在 json 索引里，供 rule_scores 重新评分
+            entry["_pattern_keys"] = list(rule["pattern_keys"])
+
+        store["rules"][key] = entry
+        return rule_id, True
+
+    return _with_store(rules_file, scope, add)
+
+
+def update_learned_rules(rules_file: Path, scope: str, fn: Callable[[dict], bool]):
+    """
+    批量修改学习规则：fn 接收 {rule_key: rule} 字典，原地修改，返回是否有变化
+    """
+    if not rules_file.exists() and not sidecar_path(rules_file).exists():
+        return None
+    return _with_store(rules_file, scope, lambda store: (None, fn(store["rules"])))
+
+
+def list_learned_rules(rules_file: Path, scope: str) -> list[dict]:
+    """列出学习规则（以 json 索引为准，md 有手动修改时先导入）"""
+    if not rules_file.exists() and not sidecar_path(rules_file).exists():
+        return []
+    return _with_store(rules_file, scope, lambda store: (list(store["rules"].values()), False))
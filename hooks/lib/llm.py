@@ -12,6 +12,7 @@ import subprocess
 import re
 from typing import Optional
 from .storage import load_config
+from .simplify import simplify_input
 
 
 def is_llm_enabled() -> bool:
@@ -128,7 +129,7 @@ def llm_decide(tool_name: str, tool_input: dict, context: dict = None) -> tuple[
 用户正在使用 Claude Code，Claude 想要执行以下操作：
 
 工具: {tool_name}
-输入: {json.dumps(tool_input, ensure_ascii=False)[:500]}
+输入: {json.dumps(simplify_input(tool_input, tool_name), ensure_ascii=False)[:800]}
 
 请判断这个操作是否应该自动批准。考虑：
 1. 操作是否安全（不会造成数据丢失或系统损坏）
@@ -182,23 +183,28 @@ def llm_generate_rule_suggestion(pattern_data: dict) -> Optional[dict]:
     return extract_json(result_text)
 
 
-def llm_generate_session_summary(feedback: list[dict], stats: dict) -> str:
-    """
-    使用 LLM 生成会话总结
-    """
-    if not is_llm_enabled():
-        return generate_simple_summary(stats)
+# 会话总结的提示词模板（不含操作记录），用于计算 token 预算
+CHUNK_PROMPT = """你在为一个 Claude Code 工作会话写滚动总结。
+
+已有总结:
+{summary}
+
+新的操作记录（时间 工具 决策[✓执行/✗拒绝] 内容）:
+{lines}
+
+请把新记录合并进已有总结：主要完成了什么工作、有哪些值得注意的决策。
+只输出更新后的总结，纯文本，不超过 300 字。"""
 
-    # 只发送最近 20 条记录，避免 token 过多
-    recent_feedback = feedback[-20:] if len(feedback) > 20 else feedback
+MERGE_PROMPT = """总结以下 Claude Code 工作会话：
 
-    prompt = f"""总结以下 Claude Code 工作会话：
+之前操作的滚动总结:
+{summary}
 
-操作记录:
-{json.dumps(recent_feedback, ensure_ascii=False, indent=2)}
+最近的操作记录（时间 工具 决策[✓执行/✗拒绝] 内容）:
+{lines}
 
 统计:
-{json.dumps(stats, ensure_ascii=False, indent=2)}
+{stats}
 
 请生成一份简洁的会话总结，包括：
 1. 主要完成了什么工作
@@ -207,8 +213,56 @@ def llm_generate_session_summary(feedback: list[dict], stats: dict) -> str:
 
 用 Markdown 格式，不超过 200 字。"""
 
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：UTF-8 字节数 / 3（中文约 1 字 1 token，英文偏保守）"""
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def format_feedback_line(entry: dict, max_chars: int = 160) -> str:
+    """把一条 feedback 压缩成一行，供总结使用"""
+    tool_input = entry.get("input") or {}
+    detail = (
+        tool_input.get("command") or tool_input.get("file_path")
+        or tool_input.get("pattern") or tool_input.get("query") or ""
+    )
+    executed = entry.get("executed")
+    mark = "✓" if executed is True else "✗" if executed is False else ""
+    ts = entry.get("ts") or ""
+    return f"{ts[11:16]} {entry.get('tool', '?')} {entry.get('auto_decision', '?')}{mark} {detail[:max_chars]}"
+
+
+def llm_summarize_chunk(summary: str, lines: list[str]) -> Optional[str]:
+    """把一段操作记录合并进滚动总结，失败返回 None"""
+    if not is_llm_enabled():
+        return None
+    prompt = CHUNK_PROMPT.format(summary=summary or "（无）", lines="\n".join(lines))
+    return call_llm(prompt) or None
+
+
+def llm_generate_session_summary(
+    summary: str,
+    lines: list[str],
+    stats: dict,
+    fallback: bool = True,
+) -> Optional[str]:
+    """
+    使用 LLM 生成会话总结：滚动总结 + 尚未并入的最近操作 + 统计
+
+    LLM 不可用或调用失败时，fallback=True 返回统计总结，否则返回 None（由调用方决定是否重试）
+    """
+    if not is_llm_enabled():
+        return generate_simple_summary(stats) if fallback else None
+
+    prompt = MERGE_PROMPT.format(
+        summary=summary or "（无）",
+        lines="\n".join(lines) or "（无）",
+        stats=json.dumps(stats, ensure_ascii=False, indent=2),
+    )
     result = call_llm(prompt)
-    return result if result else generate_simple_summary(stats)
+    if result:
+        return result
+    return generate_simple_summary(stats) if fallback else None
 
 
 def generate_simple_summary(stats: dict) -> str:
@@ -0,0 +1,177 @@
+"""
+memo.py - 重复工具调用的决策缓存
+
+Agent 经常发出完全相同的调用（同一个 Read 路径、git status、npm test），
+对这些调用直接复用上一次的决策，跳过规则加载/匹配和 LLM。
+
+- key = hash(工具名, 规范化后的 tool_input, 规则集版本)；规范化复用 simplify_input：
+  Write/Edit 的大段内容只以指纹（大小、行数、sha1）参与，指纹和写 feedback 时共用同一次计算，
+  几 MB 的内容也不会在热路径上再序列化一遍
+- 规则集版本由当前项目的规则文件、config.json 和匹配代码的 (mtime, size) 计算；
+  版本是 key 的一部分，规则变化后旧条目不再命中、按 LRU 自然淘汰。
+  不同项目的会话共用一个文件也不会互相清空
+- LRU，最多 memo.max_entries 条；文件里同时记录命中/未命中次数
+- 命中时不重写缓存文件：只往 decision_memo.hits 追加一行 key，
+  下次写缓存（未命中）时再合并进命中次数和 LRU 顺序
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+from . import AUTO_DECISION_DIR, CONFIG_FILE
+from .rules import default_rule_files
+from .simplify import simplify_input
+from .storage import read_json, write_json_atomic
+
+MEMO_FILE = AUTO_DECISION_DIR / "decision_memo.json"
+HITS_FILE = AUTO_DECISION_DIR / "decision_memo.hits"
+MEMO_MAX_ENTRIES = 256
+# 命中记录超过这个大小时，命中的调用也顺便合并一次
+HITS_FLUSH_BYTES = 64 * 1024
+
+# 不影响决策的输入字段（如 Bash 的 description）
+IGNORED_INPUT_KEYS = {"description"}
+# simplify_input 没保留的字段超过这个长度时只用 sha1 参与 key
+KEY_TEXT_CHARS = 500
+
+
+def _rule_files() -> list[Path]:
+    files = [path for path, _ in default_rule_files()]
+    return files + [CONFIG_FILE, Path(__file__).parent / "rules.py"]
+
+
+def rules_version() -> str:
+    """规则集版本：所有相关文件的 stat 签名"""
+    parts = []
+    for path in _rule_files():
+        try:
+            st = path.stat()
+            parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append(f"{path}:-")
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _key_input(tool_name: str, tool_input: dict) -> dict:
+    """
+    参与 key 的输入：simplify_input 的结果，补上它没保留或截断的字段
+
+    大段文本已经是指纹；补上的长字段（截断的 URL、MultiEdit 的 edits 等）只取 sha1，
+    不同的调用仍然得到不同的 key
+    """
+    key_input = simplify_input(tool_input, tool_name)
+    for field, value in tool_input.items():
+        if field in IGNORED_INPUT_KEYS or f"{field}_fp" in key_input or key_input.get(field) == value:
+            continue
+        if field == "edits" and isinstance(value, list):
+            value = "\0".join(
+                f"{e.get('old_string', '')}\0{e.get('new_string', '')}\0{e.get('replace_all', False)}"
+                for e in value if isinstance(e, dict)
+            )
+        if isinstance(value, str) and len(value) > KEY_TEXT_CHARS:
+            key_input[f"{field}_sha1"] = hashlib.sha1(value.encode("utf-8", "surrogatepass")).hexdigest()
+            key_input.pop(field, None)
+        else:
+            key_input[field] = value
+    return key_input
+
+
+def memo_key(tool_name: str, tool_input: dict, version: str) -> str:
+    payload = json.dumps([tool_name, _key_input(tool_name, tool_input), version],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def load_memo() -> dict:
+    """读取缓存"""
+    memo = read_json(MEMO_FILE, {})
+    if not isinstance(memo, dict):
+        memo = {}
+    memo.setdefault("hits", 0)
+    memo.setdefault("misses", 0)
+    memo.setdefault("entries", {})
+    memo.pop("version", None)  # 旧格式的整体版本号
+    return memo
+
+
+def _note_hit(key: str) -> bool:
+    """追加一条命中记录，返回记录是否已经攒得足够多、该合并了"""
+    try:
+        with open(HITS_FILE, "a", encoding="utf-8") as f:
+            f.write(key + "\n")
+            return f.tell() > HITS_FLUSH_BYTES
+    except OSError:
+        return False
+
+
+def pending_hits() -> list[str]:
+    """还没合并进缓存文件的命中 key"""
+    try:
+        return HITS_FILE.read_text(encoding="utf-8").split()
+    except OSError:
+        return []
+
+
+def memo_get(memo: dict, key: str) -> Optional[dict]:
+    """查缓存；命中只追加命中记录，未命中时标记缓存需要写回"""
+    entry = memo["entries"].get(key)
+    if entry is None:
+        memo["misses"] += 1
+        memo["_dirty"] = True
+        return None
+    if _note_hit(key):
+        memo["_dirty"] = True
+    return entry
+
+
+def memo_put(memo: dict, key: str, decision: str, reason: Optional[str], rule: Optional[dict]):
+    """
+    写入一条决策
+
+    rule 只保留统计需要的字段，缓存命中时照常记录规则命中
+    """
+    entry = {"decision": decision, "reason": reason}
+    if rule is not None:
+        entry["rule"] = {k: rule[k] for k in ("id", "source", "tool", "pattern", "path", "secrets") if k in rule}
+    memo["entries"].pop(key, None)
+    memo["entries"][key] = entry
+    memo["_dirty"] = True
+
+
+def _merge_hits(memo: dict):
+    """把命中记录合并进命中次数和 LRU 顺序（先改名再读，读取期间的新命中写进新文件）"""
+    claimed = HITS_FILE.with_name(f".{HITS_FILE.name}.{os.getpid()}")
+    try:
+        os.replace(HITS_FILE, claimed)
+    except OSError:
+        return
+    try:
+        keys = claimed.read_text(encoding="utf-8").split()
+    except OSError:
+        keys = []
+    claimed.unlink(missing_ok=True)
+    entries = memo["entries"]
+    for key in keys:
+        entry = entries.pop(key, None)
+        if entry is not None:
+            entries[key] = entry
+    memo["hits"] += len(keys)
+
+
+def save_memo(memo: dict, max_entries: int = MEMO_MAX_ENTRIES):
+    """
+    有变化时合并命中记录、按 LRU 截断并写回缓存
+
+    不加锁：并发时最多丢失一条缓存或几次计数，下次调用会补上
+    """
+    if not memo.pop("_dirty", False):
+        return
+    _merge_hits(memo)
+    while len(memo["entries"]) > max_entries:
+        del memo["entries"][next(iter(memo["entries"]))]
+    try:
+        write_json_atomic(MEMO_FILE, memo)
+    except OSError:
+        pass
@@ -0,0 +1,81 @@
+"""
+paths.py - 项目 memory-bank 目录发现
+
+从当前目录向上查找 .claude/memory-bank，支持 monorepo 多层规则：
+
+    repo/.claude/memory-bank               ← 上层（优先级低）
+    repo/packages/web/.claude/memory-bank  ← 最近一层（优先级高，feedback 写这里）
+
+查找在 git 仓库根目录或用户主目录处停止（~/.claude/memory-bank 是全局目录，不算项目）。
+结果按 cwd 缓存到文件，同一目录下的后续 hook 调用不再逐级 stat。
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+MEMORY_BANK_SUBDIR = Path(".claude") / "memory-bank"
+CACHE_TTL_SECONDS = 600
+CACHE_MAX_ENTRIES = 200
+
+
+def discover_project_chain(cwd: Path, home: Path) -> list[Path]:
+    """
+    向上查找项目 memory-bank，返回由近到远的列表
+
+    第一个元素总是当前项目的 memory-bank（可能尚不存在）：
+    - 找到了 memory-bank → 最近的那个
+    - 没找到但在 git 仓库里 → 仓库根目录下的 .claude/memory-bank
+    - 都没有 → cwd 下的 .claude/memory-bank
+    """
+    chain = []
+    repo_root = None
+
+    for directory in (cwd, *cwd.parents):
+        if directory == home:
+            break
+        bank = directory / MEMORY_BANK_SUBDIR
+        if bank.is_dir():
+            chain.append(bank)
+        if (directory / ".git").exists():
+            repo_root = directory
+            break
+
+    if not chain:
+        chain.append((repo_root or cwd) / MEMORY_BANK_SUBDIR)
+    return chain
+
+
+def resolve_project_chain(cwd: Path, home: Path, cache_file: Path) -> list[Path]:
+    """带文件缓存的 discover_project_chain"""
+    key = str(cwd)
+    now = time.time()
+
+    try:
+        cache = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        cache = {}
+
+    entry = cache.get(key)
+    if entry and now - entry.get("at", 0) < CACHE_TTL_SECONDS:
+        chain = [Path(p) for p in entry.get("chain", [])]
+        # 已缓存的上层目录被删除时重新查找
+        if chain and all(p.is_dir() for p in chain[1:]):
+            return chain
+
+    chain = discover_project_chain(cwd, home)
+
+    cache[key] = {"at": now, "chain": [str(p) for p in chain]}
+    if len(cache) > CACHE_MAX_ENTRIES:
+        for stale_key in sorted(cache, key=lambda k: cache[k].get("at", 0))[:len(cache) - CACHE_MAX_ENTRIES]:
+            del cache[stale_key]
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_name(f".{cache_file.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(cache, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass
+
+    return chain
@@ -4,14 +4,17 @@ patterns.py - 行为模式检测
 从用户的审批行为中检测规律，生成规则建议
 """
 
+import hashlib
 import re
-import json
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional
 from . import MEMORY_BANK_PROJECT, MEMORY_BANK_GLOBAL, AUTO_DECISION_DIR
-from .storage import get_recent_feedback, load_config
+from .rules import _rule_key
+from .learned_rules import add_learned_rule
+from .generalize import generalize
+from .storage import get_recent_feedback, load_config, read_json, update_json_locked
 
 
 def detect_patterns() -> list[dict]:
@@ -28,8 +31,10 @@ def detect_patterns() -> list[dict]:
 
     feedback = get_recent_feedback(days=30)
 
-    # 按工具和模式分组统计
-    patterns = defaultdict(lambda: {"approved": 0, "rejected": 0, "samples": []})
+    # 按工具和模式分组统计；置信度用按时间衰减的权重计算，近期的选择比一个月前的更重要
+    half_life = config.get("learning", {}).get("score_half_life_days", 14)
+    now = datetime.now()
+    patterns = defaultdict(lambda: {"approved": 0, "rejected": 0, "weighted": [0.0, 0.0], "samples": []})
 
     for entry in feedback:
         if entry.get("auto_decision") != "ask":
@@ -45,10 +50,18 @@ def detect_patterns() -> list[dict]:
         # 生成模式 key
         pattern_key = generate_pattern_key(tool, input_data)
 
+        try:
+            age_days = (now - datetime.fromisoformat(entry.get("ts", ""))).total_seconds() / 86400
+        except (TypeError, ValueError):
+            age_days = 0
+        weight = 0.5 ** (max(age_days, 0) / half_life)
+
         if executed:
             patterns[pattern_key]["approved"] += 1
+            patterns[pattern_key]["weighted"][0] += weight
         else:
             patterns[pattern_key]["rejected"] += 1
+            patterns[pattern_key]["weighted"][1] += weight
 
         # 保存样本（最多 5 个）
         if len(patterns[pattern_key]["samples"]) < 5:
@@ -62,13 +75,14 @@ def detect_patterns() -> list[dict]:
         if total < threshold:
             continue
 
-        # 计算置信度
-        if stats["approved"] > stats["rejected"]:
+        # 计算置信度（衰减加权）
+        approved_w, rejected_w = stats["weighted"]
+        if approved_w > rejected_w:
             action = "allow"
-            confidence = stats["approved"] / total
+            confidence = approved_w / (approved_w + rejected_w)
         else:
             action = "deny"
-            confidence = stats["rejected"] / total
+            confidence = rejected_w / (approved_w + rejected_w)
 
         if confidence < confidence_min:
             continue
@@ -80,6 +94,7 @@ def detect_patterns() -> list[dict]:
             "tool": tool,
             "action": action,
             "confidence": round(confidence, 2),
+            "pattern_keys": [pattern_key],
             "based_on": {
                 "approved": stats["approved"],
                 "rejected": stats["rejected"],
@@ -96,6 +111,10 @@ def detect_patterns() -> list[dict]:
 
         suggestions.append(suggestion)
 
+    # 合并同类建议（npm test + npm run、Write + Edit ……），并用历史记录校验
+    if config.get("learning", {}).get("generalize", True):
+        suggestions = generalize(suggestions, feedback)
+
     return suggestions
 
 
@@ -184,114 +203,164 @@ def determine_scope(rule: dict) -> tuple[str, str]:
 
 
 # 待确认的全局规则队列
+#
+# 文件格式（按规则 key 去重，重复检测只会刷新 last_seen）：
+# {
+#   "version": 2,
+#   "entries": {pending_id: {"id", "key", "rule", "reason", "created_at", "last_seen", "seen_count"}},
+#   "dismissed": {rule_key: 拒绝时间}   # 拒绝过的规则在过期前不再提示
+# }
 PENDING_GLOBAL_RULES_FILE = AUTO_DECISION_DIR / "pending_global_rules.json"
+PENDING_TTL_DAYS = 14
+
+
+def _pending_rule_key(rule: dict) -> str:
+    return "\t".join(_rule_key(rule))
+
+
+def _pending_id(key: str) -> str:
+    return f"pending-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}"
+
+
+def _normalize_pending_store(data) -> dict:
+    """兼容旧格式（列表），并保证字段齐全"""
+    if isinstance(data, list):
+        entries = {}
+        for entry in data:
+            key = _pending_rule_key(entry.get("rule", {}))
+            entries[_pending_id(key)] = {
+                **entry,
+                "id": _pending_id(key),
+                "key": key,
+                "last_seen": entry.get("created_at", ""),
+                "seen_count": 1,
+            }
+        data = {"entries": entries}
+    if not isinstance(data, dict):
+        data = {}
+    data["version"] = 2
+    data.setdefault("entries", {})
+    data.setdefault("dismissed", {})
+    return data
+
+
+def _expire_pending(store: dict):
+    """删除过期的待确认规则和拒绝记录"""
+    ttl_days = load_config().get("learning", {}).get("pending_ttl_days", PENDING_TTL_DAYS)
+    cutoff = (datetime.now() - timedelta(days=ttl_days)).isoformat()
+    store["entries"] = {
+        pid: entry for pid, entry in store["entries"].items()
+        if entry.get("last_seen", "") >= cutoff
+    }
+    store["dismissed"] = {
+        key: ts for key, ts in store["dismissed"].items() if ts >= cutoff
+    }
 
 
 def get_pending_global_rules() -> list[dict]:
-    """获取待确认的全局规则"""
-    if PENDING_GLOBAL_RULES_FILE.exists():
-        try:
-            return json.loads(PENDING_GLOBAL_RULES_FILE.read_text())
-        except:
-            pass
-    return []
+    """获取待确认的全局规则（按最近一次检测时间排序，最新的在最后）"""
+    store = _normalize_pending_store(read_json(PENDING_GLOBAL_RULES_FILE, {}))
+    _expire_pending(store)
+    return sorted(store["entries"].values(), key=lambda e: e.get("last_seen", ""))
 
 
-def add_pending_global_rule(rule: dict, reason: str) -> str:
+def add_pending_global_rule(rule: dict, reason: str) -> Optional[str]:
     """
     添加待确认的全局规则
 
-    返回: pending_id
+    同一规则（tool + pattern + path）只保留一条，重复添加只更新统计。
+    返回: pending_id；如果该规则之前被拒绝过，返回 None
     """
-    pending = get_pending_global_rules()
-    pending_id = f"pending-{datetime.now().strftime('%Y%m%d%H%M%S')}-{len(pending)}"
+    key = _pending_rule_key(rule)
+    pending_id = _pending_id(key)
+    now = datetime.now().isoformat()
 
-    pending.append({
-        "id": pending_id,
-        "rule": rule,
-        "reason": reason,
-        "created_at": datetime.now().isoformat(),
-    })
+    def add(data):
+        _expire_pending(data)
 
-    PENDING_GLOBAL_RULES_FILE.parent.mkdir(parents=True, exist_ok=True)
-    PENDING_GLOBAL_RULES_FILE.write_text(json.dumps(pending, ensure_ascii=False, indent=2))
+        if key in data["dismissed"]:
+            return None
+
+        entry = data["entries"].get(pending_id)
+        if entry:
+            entry.update(rule=rule, reason=reason, last_seen=now)
+            entry["seen_count"] = entry.get("seen_count", 1) + 1
+        else:
+            data["entries"][pending_id] = {
+                "id": pending_id,
+                "key": key,
+                "rule": rule,
+                "reason": reason,
+                "created_at": now,
+                "last_seen": now,
+                "seen_count": 1,
+            }
+        return pending_id
 
-    return pending_id
+    return update_json_locked(PENDING_GLOBAL_RULES_FILE, {}, add, migrate=_normalize_pending_store)
 
 
-def confirm_pending_global_rule(pending_id: str, approved: bool) -> Optional[str]:
+def resolve_pending_global_rules(approved_ids=(), rejected_ids=()) -> list[str]:
     """
-    确认或拒绝待确认的全局规则
+    批量确认/拒绝待确认的全局规则，队列文件只写一次
 
-    返回: 如果批准，返回规则 ID；否则返回 None
+    被拒绝的规则记入 dismissed，过期前不会再次提示。
+    返回: 保存成功的全局规则 ID 列表
     """
-    pending = get_pending_global_rules()
-
-    # 找到对应的规则
-    rule_entry = None
-    remaining = []
-    for entry in pending:
-        if entry["id"] == pending_id:
-            rule_entry = entry
-        else:
-            remaining.append(entry)
+    approved_ids = set(approved_ids)
+    rejected_ids = set(rejected_ids)
+    now = datetime.now().isoformat()
+
+    def resolve(data):
+        _expire_pending(data)
+
+        approved = []
+        for pid in approved_ids | rejected_ids:
+            entry = data["entries"].pop(pid, None)
+            if entry is None:
+                continue
+            if pid in approved_ids:
+                approved.append(entry)
+            else:
+                data["dismissed"][entry["key"]] = now
+        return approved
+
+    approved_entries = update_json_locked(
+        PENDING_GLOBAL_RULES_FILE, {}, resolve, migrate=_normalize_pending_store
+    )
+
+    saved = []
+    for entry in approved_entries:
+        rule_id = save_learned_rule(entry["rule"], scope="global")
+        if rule_id:
+            saved.append(rule_id)
+    return saved
 
-    # 更新待确认列表
-    PENDING_GLOBAL_RULES_FILE.write_text(json.dumps(remaining, ensure_ascii=False, indent=2))
 
-    if rule_entry and approved:
-        # 保存到全局
-        return save_learned_rule(rule_entry["rule"], scope="global")
+def confirm_pending_global_rule(pending_id: str, approved: bool) -> Optional[str]:
+    """
+    确认或拒绝待确认的全局规则
 
-    return None
+    返回: 如果批准，返回规则 ID；否则返回 None
+    """
+    if approved:
+        saved = resolve_pending_global_rules(approved_ids=[pending_id])
+    else:
+        saved = resolve_pending_global_rules(rejected_ids=[pending_id])
+    return saved[0] if saved else None
 
 
 def save_learned_rule(rule: dict, scope: str = "project"):
     """
-    保存学习到的规则到 learned-rules.md
+    保存学习到的规则
 
+    写入 learned-rules.json 索引并重新渲染 learned-rules.md；
     scope: "project" 或 "global"
+    返回: 规则 ID；已存在相同 tool + pattern + path 的规则时返回 None
     """
     if scope == "global":
         rules_file = MEMORY_BANK_GLOBAL / "learned-rules.md"
     else:
         rules_file = MEMORY_BANK_PROJECT / "learned-rules.md"
 
-    rules_file.parent.mkdir(parents=True, exist_ok=True)
-
-    # 生成规则 ID
-    rule_id = f"learned-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-
-    # 生成规则文本
-    rule_text = f"""
-### {rule_id}
-- tool: {rule['tool']}
-  action: {rule['action']}
-"""
-
-    if "pattern" in rule:
-        rule_text += f"  pattern: {rule['pattern']}\n"
-    if "path" in rule:
-        rule_text += f"  path: {rule['path']}\n"
-
-    rule_text += f"""  reason: {rule.get('reason', '从用户行为学习')}
-  confidence: {rule.get('confidence', 0.8)}
-  learned_at: {datetime.now().strftime('%Y-%m-%d')}
-  based_on: 批准 {rule['based_on']['approved']} 次，拒绝 {rule['based_on']['rejected']} 次
-"""
-
-    # 追加到文件
-    if rules_file.exists():
-        content = rules_file.read_text()
-        # 检查是否已存在类似规则（简单去重）
-        if rule.get("pattern") and rule["pattern"] in content:
-            return None
-        if rule.get("path") and rule["path"] in content:
-            return None
-    else:
-        content = f"# {'全局' if scope == 'global' else '项目'}学习规则\n\n## 学习到的规则\n"
-
-    content += rule_text
-    rules_file.write_text(content, encoding="utf-8")
-
-    return rule_id
+    return add_learned_rule(rules_file, rule, scope)
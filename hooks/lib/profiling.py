@@ -0,0 +1,204 @@
+"""
+profiling.py - Hook 性能剖析模式（可开关）
+
+耗时统计（timing.py）只能看到哪个阶段慢，看不到慢在哪个函数。偶发的慢调用
+（例如碰到一个很大的 feedback 文件）需要完整的调用剖析。开启方式（任一即可）：
+- 环境变量 AUTO_DECISION_PROFILE=1
+- config.json 中 "profiling": {"enabled": true}
+
+开启后每次 hook 调用都在 cProfile 下运行，结果写入
+~/.claude/auto-decision/profiles/{时间}.{hook}.{工具}.{pid}.prof：
+- 只保留耗时 ≥ profiling.min_ms 的调用（默认 0，全部保留）
+- 目录里最多保留 profiling.max_files 个文件，超出时删除最旧的
+
+用法：
+    with profiled("PreToolUse"):
+        main()            # main 里解析出工具名后调用 tag_tool(tool_name)
+
+汇总为火焰图可用的折叠栈：python3 ~/.claude/hooks/admin.py profile > hooks.folded
+"""
+
+import cProfile
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional
+from . import AUTO_DECISION_DIR
+
+PROFILES_DIR = AUTO_DECISION_DIR / "profiles"
+DEFAULT_MAX_FILES = 200
+# 展开折叠栈时的最大深度
+MAX_DEPTH = 64
+# 分摊后不足这个时间（秒）的子树不再展开，避免调用图路径数爆炸
+MIN_SUBTREE_SECONDS = 1e-6
+
+_enabled: Optional[bool] = None
+_config: dict = {}
+_local = threading.local()
+
+
+def is_profiling_enabled() -> bool:
+    """是否开启剖析（进程内只判断一次）"""
+    global _enabled, _config
+    if _enabled is None:
+        try:
+            from .storage import load_config
+            _config = load_config().get("profiling", {})
+        except Exception:
+            _config = {}
+        env = os.environ.get("AUTO_DECISION_PROFILE")
+        if env is not None:
+            _enabled = env.lower() not in ("", "0", "false", "no")
+        else:
+            _enabled = bool(_config.get("enabled", False))
+    return _enabled
+
+
+def tag_tool(tool_name: str):
+    """记录当前线程正在剖析的调用对应的工具名"""
+    _local.tool = tool_name
+
+
+def _safe(part: str) -> str:
+    return re.sub(r"[^\w-]", "_", part or "none")[:64]
+
+
+@contextmanager
+def profiled(hook: str, tool: str = ""):
+    """在 cProfile 下运行一段代码；未开启时几乎零开销"""
+    if not is_profiling_enabled():
+        yield
+        return
+    _local.tool = tool
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ 同一时刻只能有一个剖析器（合并入口的并发 provider），其余的不剖析
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms >= _config.get("min_ms", 0):
+            try:
+                _dump(profiler, hook, getattr(_local, "tool", ""))
+            except OSError:
+                pass
+
+
+def _dump(profiler: cProfile.Profile, hook: str, tool: str):
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    name = f"{stamp}.{_safe(hook)}.{_safe(tool)}.{os.getpid()}.prof"
+    tmp = PROFILES_DIR / f".{name}.tmp"
+    profiler.dump_stats(tmp)
+    os.replace(tmp, PROFILES_DIR / name)
+    _rotate(_config.get("max_files", DEFAULT_MAX_FILES))
+
+
+def _rotate(max_files: int):
+    files = sorted(PROFILES_DIR.glob("*.prof"))  # 文件名以时间开头，按名字排序即按时间
+    for old in files[:max(len(files) - max_files, 0)]:
+        old.unlink(missing_ok=True)
+
+
+def parse_profile_name(path: Path) -> dict:
+    """{时间}.{hook}.{工具}.{pid}.prof → 字段"""
+    parts = path.name.split(".")
+    if len(parts) != 5:
+        return {}
+    return {"time": parts[0], "hook": parts[1], "tool": parts[2], "pid": parts[3]}
+
+
+def find_profiles(hook: Optional[str] = None, tool: Optional[str] = None,
+                  since: Optional[datetime] = None) -> list[Path]:
+    """按 hook / 工具 / 时间筛选剖析文件（从旧到新）"""
+    if not PROFILES_DIR.is_dir():
+        return []
+    cutoff = since.strftime("%Y%m%dT%H%M%S") if since else ""
+    result = []
+    for path in sorted(PROFILES_DIR.glob("*.prof")):
+        info = parse_profile_name(path)
+        if not info or info["time"] < cutoff:
+            continue
+        if hook and info["hook"] != _safe(hook):
+            continue
+        if tool and info["tool"] != _safe(tool):
+            continue
+        result.append(path)
+    return result
+
+
+def _frame_name(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # 内置函数，如 <built-in method posix.stat>
+    return f"{name} ({Path(filename).name}:{line})".replace(";", ":")
+
+
+def folded_stacks(stats: pstats.Stats) -> dict[str, float]:
+    """
+    把 cProfile 的调用图展开成折叠栈 {"a;b;c": 自身耗时（秒）}
+
+    cProfile 只记录调用者→被调用者的边，不记录完整调用栈；
+    从根开始沿边展开，每条边按它占被调用函数累计时间的比例分摊自身耗时（与 flameprof 等工具相同的近似）
+    """
+    entries = stats.stats  # func → (cc, nc, tt, ct, callers)
+    callees: dict[tuple, list[tuple[tuple, float]]] = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    stacks: dict[str, float] = {}
+
+    def walk(func: tuple, path: list[str], seen: set, fraction: float):
+        tt = entries[func][2]
+        stack = path + [_frame_name(func)]
+        key = ";".join(stack)
+        stacks[key] = stacks.get(key, 0.0) + tt * fraction
+        if len(stack) >= MAX_DEPTH:
+            return
+        for child, edge_ct in callees.get(func, []):
+            if child in seen or child not in entries:
+                continue  # 递归调用只展开一层
+            child_ct = entries[child][3]
+            if child_ct <= 0 or edge_ct <= 0:
+                continue
+            child_fraction = fraction * min(edge_ct / child_ct, 1.0)
+            if child_ct * child_fraction < MIN_SUBTREE_SECONDS:
+                continue
+            walk(child, stack, seen | {child}, child_fraction)
+
+    roots = [func for func, value in entries.items() if not value[4]]
+    for root in roots:
+        walk(root, [], {root}, 1.0)
+    return stacks
+
+
+def aggregate(paths: Iterable[Path]) -> Optional[pstats.Stats]:
+    """合并多个剖析文件"""
+    stats = None
+    for path in paths:
+        try:
+            if stats is None:
+                stats = pstats.Stats(str(path))
+            else:
+                stats.add(str(path))
+        except (OSError, EOFError, TypeError, ValueError):
+            continue
+    return stats
+
+
+def format_folded(stacks: dict[str, float]) -> str:
+    """火焰图输入格式：每行 "帧;帧;帧 微秒数"，忽略不足 1 微秒的栈"""
+    lines = [f"{key} {round(seconds * 1e6)}" for key, seconds in sorted(stacks.items()) if seconds >= 1e-6]
+    return "\n".join(lines) + ("\n" if lines else "")
@@ -0,0 +1,192 @@
+"""
+replay.py - 用历史 feedback 回放候选规则集
+
+把 .claude/memory-bank/feedback/*.jsonl 里记录过的工具调用逐条交给 match_rule，
+对比基线（当前规则，或日志里记录的 auto_decision）和候选规则集的决策：
+
+- 决策迁移（ask→allow、allow→deny ...）及示例
+- 需要用户确认的次数变化
+- 候选规则会自动放行、但用户当时拒绝了的请求（回归风险）
+- 匹配吞吐量（本项目真实流量上的匹配基准）
+
+每个日志文件在独立进程中回放，几个月的历史也能在几秒内跑完。
+只回放规则部分，不调用 LLM、不记录规则命中。
+"""
+
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+from .rules import load_rule_files, match_rule
+from .storage import feedback_files
+
+# 每种迁移保留的示例条数
+EXAMPLES_PER_TRANSITION = 3
+
+# 进程内的规则缓存，同一个 worker 回放多个文件时只解析一次
+_rules_cache: dict = {}
+
+
+def _cached_rules(rule_files: tuple) -> list[dict]:
+    if rule_files not in _rules_cache:
+        _rules_cache[rule_files] = load_rule_files([(Path(p), source) for p, source in rule_files])
+    return _rules_cache[rule_files]
+
+
+def _replay_input(entry: dict) -> dict:
+    """
+    从日志记录还原 tool_input
+
+    日志里只存了简化后的输入：content 只有前 100 字符的 content_preview，
+    回放时用它代替 content（长内容上的 pattern 可能与实时结果不同）
+    """
+    tool_input = dict(entry.get("input") or {})
+    preview = tool_input.pop("content_preview", None)
+    if preview is not None and "content" not in tool_input:
+        tool_input["content"] = preview[:-3] if preview.endswith("...") else preview
+    return tool_input
+
+
+def _describe(entry: dict) -> str:
+    tool_input = entry.get("input") or {}
+    detail = tool_input.get("command") or tool_input.get("file_path") or tool_input.get("pattern") or ""
+    return f"{entry.get('tool', '?')}: {detail[:80]}"
+
+
+def _decide(rules: list[dict], tool_name: str, tool_input: dict) -> str:
+    rule = match_rule(tool_name, tool_input, rules)
+    return rule.get("action", "ask") if rule is not None else "ask"
+
+
+def replay_file(log_file: str, candidate_files: tuple, baseline_files: Optional[tuple] = None) -> dict:
+    """
+    回放单个日志文件
+
+    candidate_files / baseline_files 是 ((path, source), ...)，优先级从高到低；
+    baseline_files 为 None 时以日志里记录的 auto_decision 为基线
+    """
+    candidate = _cached_rules(candidate_files)
+    baseline = _cached_rules(baseline_files) if baseline_files is not None else None
+
+    result = {
+        "files": 1,
+        "records": 0,
+        "baseline": Counter(),
+        "candidate": Counter(),
+        "transitions": Counter(),
+        "rejected_allowed": 0,
+        "examples": {},
+        "match_seconds": 0.0,
+    }
+
+    try:
+        f = open(log_file, "rb")
+    except OSError:
+        return result
+
+    with f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            tool_name = entry.get("tool")
+            if not tool_name:
+                continue
+            tool_input = _replay_input(entry)
+
+            start = time.perf_counter()
+            new = _decide(candidate, tool_name, tool_input)
+            if baseline is not None:
+                old = _decide(baseline, tool_name, tool_input)
+            else:
+                old = entry.get("auto_decision") or "ask"
+            result["match_seconds"] += time.perf_counter() - start
+
+            result["records"] += 1
+            result["baseline"][old] += 1
+            result["candidate"][new] += 1
+            if old == new:
+                continue
+
+            transition = f"{old}->{new}"
+            result["transitions"][transition] += 1
+            examples = result["examples"].setdefault(transition, [])
+            if len(examples) < EXAMPLES_PER_TRANSITION:
+                examples.append(_describe(entry))
+            # 用户当时没有执行（拒绝了），候选规则却会自动放行
+            if new == "allow" and entry.get("executed") is False:
+                result["rejected_allowed"] += 1
+
+    return result
+
+
+def _merge(total: dict, part: dict):
+    for key in ("files", "records", "rejected_allowed", "match_seconds"):
+        total[key] += part[key]
+    for key in ("baseline", "candidate", "transitions"):
+        total[key].update(part[key])
+    for transition, examples in part["examples"].items():
+        merged = total["examples"].setdefault(transition, [])
+        merged.extend(examples[:EXAMPLES_PER_TRANSITION - len(merged)])
+
+
+def replay(
+    candidate_files: list[tuple[Path, str]],
+    baseline_files: Optional[list[tuple[Path, str]]] = None,
+    days: int = 30,
+    workers: Optional[int] = None,
+    feedback_dir: Optional[Path] = None,
+) -> dict:
+    """
+    并行回放最近 N 天的 feedback
+
+    workers 默认取 CPU 数；workers=1 时在当前进程内顺序执行
+    """
+    files = [str(f) for f in feedback_files(days, feedback_dir)]
+    candidate = tuple((str(p), source) for p, source in candidate_files)
+    baseline = tuple((str(p), source) for p, source in baseline_files) if baseline_files is not None else None
+
+    total = {
+        "files": 0,
+        "records": 0,
+        "baseline": Counter(),
+        "candidate": Counter(),
+        "transitions": Counter(),
+        "rejected_allowed": 0,
+        "examples": {},
+        "match_seconds": 0.0,
+    }
+
+    start = time.perf_counter()
+    workers = max(1, min(workers or os.cpu_count() or 1, len(files) or 1))
+    if workers == 1:
+        for log_file in files:
+            _merge(total, replay_file(log_file, candidate, baseline))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(
+                replay_file, files, [candidate] * len(files), [baseline] * len(files),
+            )
+            for part in parts:
+                _merge(total, part)
+    wall_seconds = time.perf_counter() - start
+
+    prompts_before = total["baseline"]["ask"]
+    prompts_after = total["candidate"]["ask"]
+    total.update({
+        "workers": workers,
+        "wall_seconds": wall_seconds,
+        "prompts_before": prompts_before,
+        "prompts_after": prompts_after,
+        "prompt_reduction": (prompts_before - prompts_after) / prompts_before if prompts_before else 0.0,
+        "records_per_second": total["records"] / wall_seconds if wall_seconds else 0.0,
+        # 每条记录的匹配耗时（基线为当前规则时包含两次匹配）
+        "match_us_per_record": total["match_seconds"] / total["records"] * 1e6 if total["records"] else 0.0,
+    })
+    for key in ("baseline", "candidate", "transitions"):
+        total[key] = dict(total[key])
+    return total
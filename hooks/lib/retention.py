@@ -0,0 +1,239 @@
+"""
+retention.py - feedback / 会话文件的保留策略
+
+memory-bank 下的 feedback/ 和 sessions/ 只增不减：每天一个 JSONL（外加 .idx / .bloom），
+每个会话一个总结（外加 .rolling.json）。长期使用的项目会积累几个月的原始记录，
+目录越来越大，按天扫描的代码也要跳过越来越多的文件。这里按三条规则清理当前项目：
+
+- 按时间：超过 retention.max_age_days 天的 feedback 日期和会话删除
+- 按大小：feedback/ 总大小超过 retention.max_total_mb 时，从最旧的日期删起
+- 按数量：sessions/ 最多保留 retention.max_sessions 个会话，超出时删最旧的
+
+最近 retention.min_keep_days 天（模式检测窗口）的 feedback 无论大小都不删。
+删除原始记录之前，先把统计并入 feedback/archive.json（按模式 / 工具 / 月份的决策与批准计数），
+长期的行为概况不会随原始记录一起丢失。
+
+清理由 Stop hook 顺带触发（maybe_prune）：每个项目每 retention.interval_hours 小时最多一次，
+是否到期只读一个状态文件；也可以手动运行 admin.py prune。
+"""
+
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+from . import AUTO_DECISION_DIR, MEMORY_BANK_PROJECT
+from .analytics import analyze, load_columns_from_files
+from .storage import load_config, project_key, read_json, update_json_locked
+
+RETENTION_STATE_FILE = AUTO_DECISION_DIR / "retention_state.json"
+ARCHIVE_NAME = "archive.json"
+# 一个日期对应的全部文件
+DAY_SUFFIXES = (".jsonl", ".idx", ".bloom")
+SESSION_SUFFIXES = (".rolling.json", ".md")
+# 最多保留多少个项目的清理时间
+MAX_PROJECTS = 100
+# 并入归档的统计字段
+COUNT_FIELDS = ("total", "auto_allowed", "auto_denied", "user_approved", "user_rejected", "pending")
+
+DEFAULTS = {
+    "enabled": True,
+    "max_age_days": 90,
+    "max_total_mb": 50,
+    "max_sessions": 200,
+    "min_keep_days": 30,
+    "interval_hours": 24,
+}
+
+
+def retention_config() -> dict:
+    try:
+        retention = load_config().get("retention", {})
+    except Exception:
+        retention = {}
+    return {key: retention.get(key, default) for key, default in DEFAULTS.items()}
+
+
+def _day_files(feedback_dir: Path) -> dict[str, list[Path]]:
+    """{日期: [该日期的 .jsonl / .idx / .bloom]}，按日期升序"""
+    days: dict[str, list[Path]] = {}
+    if feedback_dir.is_dir():
+        for path in feedback_dir.iterdir():
+            if path.suffix in DAY_SUFFIXES and not path.name.startswith("."):
+                days.setdefault(path.stem, []).append(path)
+    return dict(sorted(days.items()))
+
+
+def _session_files(sessions_dir: Path) -> dict[str, list[Path]]:
+    """{session_id: [总结 .md / .rolling.json]}"""
+    sessions: dict[str, list[Path]] = {}
+    if sessions_dir.is_dir():
+        for path in sessions_dir.iterdir():
+            for suffix in SESSION_SUFFIXES:
+                if path.name.endswith(suffix):
+                    sessions.setdefault(path.name[:-len(suffix)], []).append(path)
+                    break
+    return sessions
+
+
+def _size(paths: list[Path]) -> int:
+    total = 0
+    for path in paths:
+        try:
+            total += path.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def _mtime(paths: list[Path]) -> float:
+    latest = 0.0
+    for path in paths:
+        try:
+            latest = max(latest, path.stat().st_mtime)
+        except OSError:
+            pass
+    return latest
+
+
+def plan_prune(memory_bank: Optional[Path] = None, config: Optional[dict] = None,
+               now: Optional[datetime] = None) -> dict:
+    """
+    计算要删除的内容（不修改任何文件）
+
+    返回 {"days": {日期: [文件]}, "sessions": {session_id: [文件]}, "bytes": 删除的字节数,
+          "remaining_bytes": 清理后 feedback/ 的大小}
+    """
+    memory_bank = memory_bank or MEMORY_BANK_PROJECT
+    config = {**DEFAULTS, **(config or {})}
+    now = now or datetime.now()
+
+    days = _day_files(memory_bank / "feedback")
+    age_cutoff = (now - timedelta(days=config["max_age_days"])).strftime("%Y-%m-%d")
+    keep_from = (now - timedelta(days=max(config["min_keep_days"], 1) - 1)).strftime("%Y-%m-%d")
+    budget = config["max_total_mb"] * 1024 * 1024
+
+    sizes = {day: _size(files) for day, files in days.items()}
+    remaining = sum(sizes.values())
+    doomed_days = {}
+    for day, files in days.items():  # 从最旧的日期开始
+        if day >= keep_from:
+            break
+        if day < age_cutoff or remaining > budget:
+            doomed_days[day] = files
+            remaining -= sizes[day]
+
+    sessions = _session_files(memory_bank / "sessions")
+    by_age = sorted(sessions, key=lambda sid: _mtime(sessions[sid]), reverse=True)
+    session_cutoff = (now - timedelta(days=config["max_age_days"])).timestamp()
+    doomed_sessions = {
+        sid: sessions[sid]
+        for i, sid in enumerate(by_age)
+        if i >= config["max_sessions"] or _mtime(sessions[sid]) < session_cutoff
+    }
+
+    freed = sum(sizes[day] for day in doomed_days)
+    freed += sum(_size(files) for files in doomed_sessions.values())
+    return {"days": doomed_days, "sessions": doomed_sessions, "bytes": freed, "remaining_bytes": remaining}
+
+
+def _add_counts(target: dict, stats: dict):
+    for field in COUNT_FIELDS:
+        target[field] = target.get(field, 0) + stats.get(field, 0)
+
+
+def archive_days(day_files: dict[str, list[Path]], memory_bank: Optional[Path] = None) -> int:
+    """
+    把将被删除的日期的统计并入 feedback/archive.json，返回并入的记录数
+
+    删除总是从最旧的日期开始，archive 记下已并入的最后一个日期；
+    上次并入后没来得及删除的日期不会重复计数
+    """
+    archive_file = (memory_bank or MEMORY_BANK_PROJECT) / "feedback" / ARCHIVE_NAME
+    last_day = read_json(archive_file, {}).get("last_day") or ""
+    pending = {day: files for day, files in day_files.items() if day > last_day}
+    if not pending:
+        return 0
+
+    reports = {}
+    for day, files in pending.items():
+        columns = load_columns_from_files(f for f in files if f.suffix == ".jsonl")
+        if len(columns):
+            reports[day] = analyze(columns)
+
+    def mutate(archive: dict) -> int:
+        archived = 0
+        for day in sorted(pending):
+            if day <= (archive.get("last_day") or ""):
+                continue  # 并发的清理已经并入
+            report = reports.get(day)
+            if report:
+                _add_counts(archive.setdefault("months", {}).setdefault(day[:7], {}), report)
+                for group in ("patterns", "tools"):
+                    target = archive.setdefault(group, {})
+                    for name, stats in report[group].items():
+                        _add_counts(target.setdefault(name, {}), stats)
+                archived += report["total"]
+            archive.setdefault("first_day", day)
+            archive["last_day"] = day
+        archive["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        return archived
+
+    return update_json_locked(archive_file, {}, mutate)
+
+
+def prune(memory_bank: Optional[Path] = None, config: Optional[dict] = None, dry_run: bool = False) -> dict:
+    """
+    按保留策略清理当前项目的 feedback / sessions
+
+    返回 {"days": [删除的日期], "sessions": 删除的会话数, "archived": 并入归档的记录数,
+          "bytes": 释放的字节数, "remaining_bytes": 清理后 feedback/ 的大小}
+    """
+    memory_bank = memory_bank or MEMORY_BANK_PROJECT
+    plan = plan_prune(memory_bank, config)
+    report = {
+        "days": list(plan["days"]),
+        "sessions": len(plan["sessions"]),
+        "archived": 0,
+        "bytes": plan["bytes"],
+        "remaining_bytes": plan["remaining_bytes"],
+    }
+    if dry_run:
+        return report
+
+    if plan["days"]:
+        report["archived"] = archive_days(plan["days"], memory_bank)
+    for files in [*plan["days"].values(), *plan["sessions"].values()]:
+        for path in files:
+            path.unlink(missing_ok=True)
+    return report
+
+
+def claim_prune(memory_bank: Optional[Path] = None, interval_hours: float = 24) -> bool:
+    """当前项目是否到了清理时间；到了就记下本次时间（同一把锁里，并发的 hook 只有一个拿到）"""
+    key = project_key(memory_bank)
+    now = time.time()
+    interval = interval_hours * 3600
+
+    # 绝大多数调用都没到期，先无锁读一次
+    if now - read_json(RETENTION_STATE_FILE, {}).get("projects", {}).get(key, 0) < interval:
+        return False
+
+    def mutate(state: dict) -> bool:
+        projects = state.setdefault("projects", {})
+        if now - projects.get(key, 0) < interval:
+            return False
+        projects[key] = int(now)
+        if len(projects) > MAX_PROJECTS:
+            for stale in sorted(projects, key=projects.get)[:len(projects) - MAX_PROJECTS]:
+                del projects[stale]
+        return True
+
+    return update_json_locked(RETENTION_STATE_FILE, {}, mutate)
+
+
+def maybe_prune(memory_bank: Optional[Path] = None) -> Optional[dict]:
+    """到期时清理当前项目，返回 prune 的结果；未开启或未到期返回 None"""
+    config = retention_config()
+    if not config["enabled"] or not claim_prune(memory_bank, config["interval_hours"]):
+        return None
+    return prune(memory_bank, config)
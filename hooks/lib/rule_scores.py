@@ -0,0 +1,196 @@
+"""
+rule_scores.py - 学习规则的时间衰减评分
+
+规则保存时的 confidence 只反映当时 30 天窗口里的行为。这里为每个 pattern_key
+（generate_pattern_key 的分组）维护指数衰减的批准/拒绝分数，每确定一个 ask 请求的结果就增量更新：
+
+    a ← a · 0.5^(Δt / half_life) + [批准]
+    r ← r · 0.5^(Δt / half_life) + [拒绝]
+
+分数按项目和全局各存一份（全局汇总所有项目的结果），保存在 ~/.claude/auto-decision/rule_scores.json：
+
+    {"scopes": {"global": {pattern_key: [a, r, 更新时间]}, "<项目 memory-bank>": {...}}}
+
+模式检测运行时用分数重新评估学习规则（学习规则在 json 索引里记录了自己的 _pattern_keys）：
+
+- confidence 更新为衰减后的批准率（deny 规则为拒绝率）
+- 低于 learning.demote_below：降级为 ask（原 action 记在 _action），不再自动决策
+- 降级后回升到 learning.confidence_min：恢复原 action
+- 低于 learning.retire_below：从学习规则中删除
+- 有效样本（a + r）不足 learning.rescore_min_weight 时不调整
+
+学习规则生效后，它覆盖的调用都被自动决策，不再产生 ask 结果，分数只会按比例衰减、置信度停在学习时的值。
+所以 PreToolUse 把学习规则自动决策的调用按 learning.review_sample_rate 抽样改回 ask（sample_for_review），
+用户的批准/拒绝照常经 PostToolUse / Stop 记入分数，行为变化后规则才能被降级或删除。
+"""
+
+import random
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional
+from . import AUTO_DECISION_DIR, MEMORY_BANK_GLOBAL, MEMORY_BANK_PROJECT
+from .learned_rules import update_learned_rules
+from .logger import log
+from .patterns import generate_pattern_key
+from .storage import load_config, project_key, read_json, update_json_locked
+
+RULE_SCORES_FILE = AUTO_DECISION_DIR / "rule_scores.json"
+GLOBAL_SCOPE = "global"
+# 每个范围最多保留的 pattern_key 数（超出时删掉有效样本最少的）
+MAX_KEYS_PER_SCOPE = 500
+
+DEFAULTS = {
+    "score_half_life_days": 14,
+    "demote_below": 0.6,
+    "retire_below": 0.3,
+    "rescore_min_weight": 3,
+    "confidence_min": 0.8,
+    "review_sample_rate": 0.05,
+}
+# 参与抽样复核的规则来源（手写规则不抽样）
+LEARNED_SOURCES = {"project-learned", "parent-learned", "global-learned"}
+
+_PLAIN_PREFIX_RE = re.compile(r"\^((?:\\.|[^\\^$.*+?()\[\]{}|])+)")
+
+
+def _config() -> dict:
+    try:
+        learning = load_config().get("learning", {})
+    except Exception:
+        learning = {}
+    return {key: learning.get(key, default) for key, default in DEFAULTS.items()}
+
+
+def decay(score: list, now: float, half_life_days: float) -> tuple[float, float]:
+    """把 [a, r, t] 衰减到 now"""
+    a, r, t = score
+    factor = 0.5 ** (max(now - t, 0) / 86400 / half_life_days)
+    return a * factor, r * factor
+
+
+def sample_for_review(rule: Optional[dict], decision: str, learning: Optional[dict] = None) -> bool:
+    """
+    学习规则给出的 allow/deny 是否抽样改为 ask，交给用户确认
+
+    learning: config.json 的 learning 段（调用方已读过配置时传入，省一次读取）
+    """
+    if rule is None or decision not in ("allow", "deny") or rule.get("source") not in LEARNED_SOURCES:
+        return False
+    if learning is None:
+        learning = load_config().get("learning", {})
+    return random.random() < learning.get("review_sample_rate", DEFAULTS["review_sample_rate"])
+
+
+def note_outcomes(outcomes: Iterable[tuple[dict, bool]], memory_bank: Optional[Path] = None):
+    """
+    记录一批 ask 请求的结果
+
+    outcomes: (feedback 记录, 是否批准)
+    """
+    keys = [(generate_pattern_key(e.get("tool", ""), e.get("input", {})), approved) for e, approved in outcomes]
+    if not keys:
+        return
+    half_life = _config()["score_half_life_days"]
+    now = time.time()
+    project = project_key(memory_bank)
+
+    def mutate(data: dict):
+        scopes = data.setdefault("scopes", {})
+        for scope in (project, GLOBAL_SCOPE):
+            scores = scopes.setdefault(scope, {})
+            for key, approved in keys:
+                a, r = decay(scores.get(key, [0.0, 0.0, now]), now, half_life)
+                scores[key] = [round(a + approved, 4), round(r + (not approved), 4), int(now)]
+            if len(scores) > MAX_KEYS_PER_SCOPE:
+                by_weight = sorted(scores, key=lambda k: sum(decay(scores[k], now, half_life)))
+                for key in by_weight[:len(scores) - MAX_KEYS_PER_SCOPE]:
+                    del scores[key]
+
+    update_json_locked(RULE_SCORES_FILE, {}, mutate)
+
+
+def rule_pattern_keys(rule: dict) -> list[str]:
+    """
+    规则对应的 pattern_key
+
+    新规则保存时记录了 _pattern_keys；旧规则从简单的 ^前缀 / **/*.ext 反推
+    """
+    if rule.get("_pattern_keys"):
+        return list(rule["_pattern_keys"])
+    tool = rule.get("tool", "")
+    if not re.fullmatch(r"\w+", tool):
+        return []
+    pattern = rule.get("pattern", "")
+    match = _PLAIN_PREFIX_RE.fullmatch(pattern) if pattern else None
+    if match:
+        prefix = re.sub(r"\\(.)", r"\1", match.group(1))
+        return [f"{tool}:command_prefix:{prefix}"]
+    path = rule.get("path", "").strip('"\'')
+    if not pattern and re.fullmatch(r"\*\*/\*\.\w+", path):
+        return [f"{tool}:file_ext:{path[4:]}"]
+    return []
+
+
+def _rescore(rules: dict, scores: dict, config: dict, now: float, changes: dict) -> bool:
+    changed = False
+    for key in list(rules):
+        rule = rules[key]
+        pattern_keys = rule_pattern_keys(rule)
+        if not pattern_keys:
+            continue
+        a = r = 0.0
+        for pattern_key in pattern_keys:
+            if pattern_key in scores:
+                da, dr = decay(scores[pattern_key], now, config["score_half_life_days"])
+                a, r = a + da, r + dr
+        if a + r < config["rescore_min_weight"]:
+            continue
+
+        action = rule.get("_action", rule.get("action"))
+        confidence = round((a if action == "allow" else r) / (a + r), 2)
+        label = f"{rule.get('id', '')} ({rule.get('tool', '')} {rule.get('pattern') or rule.get('path', '')})"
+
+        if confidence < config["retire_below"]:
+            del rules[key]
+            changes["retired"].append(label)
+            changed = True
+            continue
+        if str(rule.get("confidence")) != str(confidence):
+            rule["confidence"] = confidence
+            changed = True
+        if confidence < config["demote_below"] and rule.get("action") != "ask":
+            rule["_action"] = rule.get("action")
+            rule["action"] = "ask"
+            rule["demoted_at"] = datetime.now().strftime("%Y-%m-%d")
+            changes["demoted"].append(label)
+            changed = True
+        elif "_action" in rule and confidence >= config["confidence_min"]:
+            rule["action"] = rule.pop("_action")
+            rule.pop("demoted_at", None)
+            changes["restored"].append(label)
+            changed = True
+    return changed
+
+
+def rescore_learned_rules(memory_bank: Optional[Path] = None) -> dict[str, list[str]]:
+    """按衰减分数重新评估项目和全局学习规则，返回 {demoted, restored, retired: [规则说明]}"""
+    config = _config()
+    scopes = read_json(RULE_SCORES_FILE, {}).get("scopes", {})
+    now = time.time()
+    changes = {"demoted": [], "restored": [], "retired": []}
+
+    targets = [
+        ((memory_bank or MEMORY_BANK_PROJECT) / "learned-rules.md", "project", project_key(memory_bank)),
+        (MEMORY_BANK_GLOBAL / "learned-rules.md", "global", GLOBAL_SCOPE),
+    ]
+    for rules_file, scope, scope_key in targets:
+        scores = scopes.get(scope_key)
+        if scores:
+            update_learned_rules(rules_file, scope, lambda rules: _rescore(rules, scores, config, now, changes))
+
+    for kind, labels in changes.items():
+        for label in labels:
+            log("RuleScores", f"{kind}: {label}")
+    return changes
@@ -0,0 +1,178 @@
+"""
+rule_stats.py - 规则命中统计
+
+记录每条规则的命中次数和最后命中时间，用于：
+1. 按热度重排规则（只在 action 相同的连续规则之间调整，不改变决策结果）
+2. 找出长期没有命中的规则，提示清理
+
+写入是批量的：每次 hook 只往 rule_hits.log 追加一行，
+日志超过 COMPACT_BYTES 后才合并进 rule_stats.json。
+"""
+
+import json
+import os
+from datetime import datetime
+from . import AUTO_DECISION_DIR
+
+RULE_HITS_LOG = AUTO_DECISION_DIR / "rule_hits.log"
+RULE_STATS_FILE = AUTO_DECISION_DIR / "rule_stats.json"
+COMPACT_BYTES = 16 * 1024
+
+# 本进程内尚未落盘的命中: key -> [id, source, hits, last_hit]
+_pending: dict[str, list] = {}
+
+
+def rule_stat_key(rule: dict) -> str:
+    """规则统计 key，与 rules._rule_key 保持一致"""
+    from .rules import _rule_key
+    return "\t".join(_rule_key(rule))
+
+
+def record_rule_hit(rule: dict):
+    """记录一次命中（只写内存，flush_rule_hits 时落盘）"""
+    key = rule_stat_key(rule)
+    now = datetime.now().isoformat(timespec="seconds")
+    if key in _pending:
+        _pending[key][2] += 1
+        _pending[key][3] = now
+    else:
+        _pending[key] = [rule.get("id", ""), rule.get("source", ""), 1, now]
+
+
+def flush_rule_hits():
+    """把本进程的命中追加到日志，日志过大时合并进统计文件"""
+    if not _pending:
+        return
+    lines = "".join(
+        json.dumps([key, *values], ensure_ascii=False) + "\n"
+        for key, values in _pending.items()
+    )
+    _pending.clear()
+
+    try:
+        RULE_HITS_LOG.parent.mkdir(parents=True, exist_ok=True)
+        with open(RULE_HITS_LOG, "a", encoding="utf-8") as f:
+            f.write(lines)
+            size = f.tell()
+        if size > COMPACT_BYTES:
+            compact_rule_hits()
+    except OSError:
+        pass  # 统计失败不影响主流程
+
+
+def _merge_hit(stats: dict, key: str, rule_id: str, source: str, hits: int, last_hit: str):
+    entry = stats.setdefault(key, {"id": rule_id, "source": source, "hits": 0, "last_hit": ""})
+    entry["id"] = rule_id or entry["id"]
+    entry["source"] = source or entry["source"]
+    entry["hits"] += hits
+    if last_hit > entry["last_hit"]:
+        entry["last_hit"] = last_hit
+
+
+def _read_hits_log(path) -> list[list]:
+    records = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return records
+
+
+def compact_rule_hits():
+    """把命中日志合并进 rule_stats.json 并清空日志"""
+    from .storage import update_json_locked
+
+    def merge(stats: dict):
+        if not RULE_HITS_LOG.exists():
+            return
+        # 先改名再读，合并期间新的追加会写到新文件里
+        snapshot = RULE_HITS_LOG.with_name(f".{RULE_HITS_LOG.name}.{os.getpid()}")
+        os.replace(RULE_HITS_LOG, snapshot)
+        for record in _read_hits_log(snapshot):
+            if len(record) == 5:
+                _merge_hit(stats, *record)
+        snapshot.unlink(missing_ok=True)
+
+    update_json_locked(RULE_STATS_FILE, {}, merge)
+
+
+def load_hit_counts() -> dict[str, int]:
+    """只读已合并的统计（热路径使用，不解析日志）"""
+    from .storage import read_json
+    return {key: entry.get("hits", 0) for key, entry in read_json(RULE_STATS_FILE, {}).items()}
+
+
+def load_rule_stats() -> dict[str, dict]:
+    """完整统计：已合并的统计 + 尚未合并的日志"""
+    from .storage import read_json
+    stats = read_json(RULE_STATS_FILE, {})
+    for record in _read_hits_log(RULE_HITS_LOG):
+        if len(record) == 5:
+            _merge_hit(stats, *record)
+    return stats
+
+
+def reorder_by_hotness(rules: list[dict], hits: dict[str, int]) -> list[dict]:
+    """
+    按命中次数重排规则
+
+    只在 action 相同的连续规则内部排序：这些规则谁先命中决策都一样，
+    所以不会改变任何请求的 allow/deny/ask 结果（只可能改变 reason）
+    """
+    if not hits:
+        return rules
+
+    result = []
+    run = []
+    for rule in rules:
+        if run and rule.get("action") != run[0].get("action"):
+            run.sort(key=lambda r: -hits.get(rule_stat_key(r), 0))
+            result.extend(run)
+            run = []
+        run.append(rule)
+    run.sort(key=lambda r: -hits.get(rule_stat_key(r), 0))
+    result.extend(run)
+    return result
+
+
+def find_stale_rules(rules: list[dict], days: int, stats: dict[str, dict] = None) -> list[dict]:
+    """
+    找出 N 天内没有命中过的规则
+
+    learned_at 在 N 天内的新规则不算（还没来得及命中）
+    """
+    stats = load_rule_stats() if stats is None else stats
+    now = datetime.now()
+    stale = []
+
+    for rule in rules:
+        entry = stats.get(rule_stat_key(rule), {})
+        last_hit = entry.get("last_hit", "")
+        if last_hit:
+            try:
+                if (now - datetime.fromisoformat(last_hit)).days < days:
+                    continue
+            except ValueError:
+                pass
+        else:
+            learned_at = rule.get("learned_at", "")
+            try:
+                if learned_at and (now - datetime.fromisoformat(learned_at)).days < days:
+                    continue
+            except ValueError:
+                pass
+
+        stale.append({
+            "id": rule.get("id", ""),
+            "source": rule.get("source", ""),
+            "tool": rule.get("tool", ""),
+            "hits": entry.get("hits", 0),
+            "last_hit": last_hit,
+        })
+
+    return stale
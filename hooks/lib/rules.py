@@ -8,38 +8,88 @@ rules.py - 规则加载、解析、匹配
   action: allow
   pattern: ^npm test
   reason: 说明文字
+
+条件（tool / pattern / path / domain / secrets）在加载时编译成匹配器，按条件内容缓存；
+field 指定 pattern / path / domain 检查的输入字段（如 WebFetch 的 url、Grep 的 path）。
+tool 可以写 MCP 命名空间通配（mcp__github__*），加载的规则按工具名建前缀树（tool_index.py）。
 """
 
+import fnmatch
 import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
+from urllib.parse import urlsplit
 from . import (
     LEARNED_RULES_GLOBAL,
     LEARNED_RULES_PROJECT,
+    PROJECT_MEMORY_BANKS,
     RULES_GLOBAL,
     RULES_PROJECT,
 )
 from .logger import log
+from .simplify import secret_markers
+from .tool_index import SEPARATOR, ToolIndex, namespace_alternatives, segments_match
+from .rule_stats import record_rule_hit, load_hit_counts, reorder_by_hotness
+
+# 没写 field 时各条件检查的输入字段（pattern 取第一个非空的）
+DEFAULT_FIELDS = {
+    "pattern": ("command", "content"),
+    "path": ("file_path",),
+    "domain": ("url",),
+}
+
+
+class RuleSet(list):
+    """规则列表 + 按工具名的前缀树索引（首次匹配时建立，列表长度变化后重建）"""
+
+    _index: Optional[ToolIndex] = None
+    _indexed_len = -1
 
+    def candidates(self, tool_name: str) -> list[int]:
+        """可能匹配 tool_name 的规则下标，按优先级顺序"""
+        if self._index is None or self._indexed_len != len(self):
+            self._index = ToolIndex([rule.get("tool") for rule in self])
+            self._indexed_len = len(self)
+        return self._index.candidates(tool_name)
 
-def load_rules() -> list[dict]:
+
+def load_rules() -> RuleSet:
     """
     加载所有规则，按优先级排序：
     1. 项目 learned-rules.md（项目学习的规则，最高优先级）
     2. 项目 rules.md（项目手动规则）
-    3. 全局 learned-rules.md（全局学习的规则）
-    4. 全局 rules.md（全局手动规则，最低优先级）
+    3. 上层目录的 learned-rules.md / rules.md（monorepo，由近到远）
+    4. 全局 learned-rules.md（全局学习的规则）
+    5. 全局 rules.md（全局手动规则，最低优先级）
     """
-    rules = []
+    rules = load_rule_files(default_rule_files())
+
+    if _telemetry_config().get("reorder_by_hits", True):
+        rules = RuleSet(reorder_by_hotness(rules, load_hit_counts()))
+
+    return rules
 
-    # 优先级从高到低
+
+def default_rule_files() -> list[tuple[Path, str]]:
+    """当前生效的规则文件及其 source，优先级从高到低"""
     rule_files = [
         (LEARNED_RULES_PROJECT, "project-learned"),
         (RULES_PROJECT, "project-base"),
+    ]
+    for bank in PROJECT_MEMORY_BANKS[1:]:
+        rule_files.append((bank / "learned-rules.md", "parent-learned"))
+        rule_files.append((bank / "rules.md", "parent-base"))
+    rule_files += [
         (LEARNED_RULES_GLOBAL, "global-learned"),
         (RULES_GLOBAL, "global-base"),
     ]
+    return rule_files
+
 
+def load_rule_files(rule_files: list[tuple[Path, str]]) -> RuleSet:
+    """按给定顺序（优先级从高到低）加载规则文件，同 key 的低优先级规则被忽略"""
+    rules = RuleSet()
     seen = {}
 
     for file_path, source in rule_files:
@@ -61,17 +111,34 @@ def load_rules() -> list[dict]:
                 else:
                     seen[key] = rule
                     rules.append(rule)
+                    compile_rule(rule)
 
     return rules
 
 
-def _rule_key(rule: dict) -> tuple[str, str, str]:
-    """生成规则去重/冲突检查的 key"""
-    return (
-        rule.get("tool", ""),
-        rule.get("pattern", ""),
-        rule.get("path", ""),
+def _telemetry_config() -> dict:
+    from .storage import load_config
+    try:
+        return load_config().get("telemetry", {})
+    except Exception:
+        return {}
+
+
+def _rule_key(rule: dict) -> tuple[str, ...]:
+    """
+    生成规则去重/冲突检查的 key（忽略首尾空白和 path 两侧的引号）
+
+    带附加条件（如 secrets、field、domain）的规则把条件追加在后面，只有 tool/pattern/path 的规则 key 不变
+    """
+    key = (
+        rule.get("tool", "").strip(),
+        rule.get("pattern", "").strip(),
+        rule.get("path", "").strip().strip('"\''),
     )
+    for extra in ("field", "domain", "secrets"):
+        if rule.get(extra):
+            key += (f"{extra}={rule[extra].strip()}",)
+    return key
 
 
 def parse_rules_md(content: str) -> list[dict]:
@@ -87,8 +154,11 @@ def parse_rules_md(content: str) -> list[dict]:
     """
     rules = []
 
+    # HTML 注释里的内容（如示例规则）不是规则
+    content = strip_html_comments(content)
+
     # 按 ### 分割，找到包含 "- tool:" 的块
-    sections = re.split(r'\n###\s+', content)
+    sections = re.split(r'(?:^|\n)###\s+', content)
 
     for section in sections:
         if '- tool:' not in section:
@@ -115,6 +185,18 @@ def parse_rules_md(content: str) -> list[dict]:
     return rules
 
 
+_HTML_COMMENT_RE = re.compile(r"<!--.*?(?:-->|\Z)", re.S)
+
+
+def strip_html_comments(content: str) -> str:
+    """去掉 <!-- ... --> 注释（未闭合的注释到文件末尾）"""
+    return _HTML_COMMENT_RE.sub("", content)
+
+
+def html_comment_spans(content: str) -> list[tuple[int, int]]:
+    return [m.span() for m in _HTML_COMMENT_RE.finditer(content)]
+
+
 def parse_rule_block(block: str) -> dict:
     """
     解析单个规则块
@@ -148,51 +230,166 @@ def match_rules(tool_name: str, tool_input: dict, rules: list[dict]) -> tuple[st
 
     如果没有匹配的规则，返回 ("ask", None)
     """
+    rule = match_rule(tool_name, tool_input, rules)
+    if rule is None:
+        return "ask", None
+
+    record_rule_hit(rule)
+    return rule.get("action", "ask"), rule.get("reason")
+
+
+def match_rule(tool_name: str, tool_input: dict, rules: list[dict]) -> Optional[dict]:
+    """
+    返回第一条匹配的规则，没有则返回 None（不记录命中）
+
+    RuleSet 只检查前缀树给出的候选规则；普通列表逐条检查
+    """
+    if isinstance(rules, RuleSet):
+        for i in rules.candidates(tool_name):
+            if matches(rules[i], tool_name, tool_input):
+                return rules[i]
+        return None
     for rule in rules:
         if matches(rule, tool_name, tool_input):
-            return rule.get("action", "ask"), rule.get("reason")
-
-    return "ask", None
+            return rule
+    return None
 
 
 def matches(rule: dict, tool_name: str, tool_input: dict) -> bool:
     """检查单条规则是否匹配"""
+    return compile_rule(rule)(tool_name, tool_input)
+
+
+def compile_rule(rule: dict) -> Callable[[str, dict], bool]:
+    """规则的匹配器（同样的条件只编译一次）"""
+    return _compile(
+        rule.get("tool"),
+        rule.get("pattern"),
+        rule.get("path"),
+        rule.get("domain"),
+        rule.get("secrets"),
+        rule.get("field"),
+    )
 
-    # 检查工具名（支持正则，如 "Write|Edit"）
-    if "tool" in rule:
-        tool_pattern = rule["tool"]
-        if not re.match(f"^({tool_pattern})$", tool_name):
-            return False
-
-    # 检查命令/内容模式
-    if "pattern" in rule:
-        # 对于 Bash，匹配 command
-        # 对于 Write/Edit，匹配 content 或 file_path
-        text = tool_input.get("command", "") or tool_input.get("content", "") or ""
-        try:
-            if not re.search(rule["pattern"], text):
-                return False
-        except re.error:
-            # 正则语法错误，跳过这条规则
-            return False
-
-    # 检查路径模式（glob）
-    if "path" in rule:
-        file_path = tool_input.get("file_path", "")
-        if file_path:
-            import fnmatch
-            pattern = rule["path"].strip('"\'')  # 去掉引号
-            # 支持 **/ 前缀（匹配任意目录）
-            if pattern.startswith("**/"):
-                # 只匹配文件名部分
-                filename = Path(file_path).name
-                file_pattern = pattern[3:]  # 去掉 **/
-                if not fnmatch.fnmatch(filename, file_pattern):
-                    return False
-            else:
-                if not fnmatch.fnmatch(file_path, pattern):
-                    return False
-        else:
-            return False
-
-    return True
+
+def _never(tool_name: str, tool_input: dict) -> bool:
+    return False
+
+
+@lru_cache(maxsize=1024)
+def _compile(
+    tool: Optional[str],
+    pattern: Optional[str],
+    path: Optional[str],
+    domain: Optional[str],
+    secrets: Optional[str],
+    field: Optional[str],
+) -> Callable[[str, dict], bool]:
+    checks = []
+    try:
+        # 检查工具名（支持正则，如 "Write|Edit"，以及 MCP 命名空间通配，如 "mcp__github__*"）
+        alternatives = namespace_alternatives(tool)
+        if alternatives is not None:
+            checks.append(lambda name, _: any(segments_match(a, name.split(SEPARATOR)) for a in alternatives))
+        elif tool is not None:
+            tool_re = re.compile(f"^({tool})$")
+            checks.append(lambda name, _: tool_re.match(name) is not None)
+
+        # 检查命令/内容模式：Bash 匹配 command，Write 匹配 content，指定 field 时匹配该字段
+        if pattern is not None:
+            pattern_re = re.compile(pattern)
+            pattern_values = _extractor(field, DEFAULT_FIELDS["pattern"], first_only=True)
+            checks.append(lambda _, tool_input: any(pattern_re.search(v) for v in pattern_values(tool_input)))
+    except re.error:
+        # 正则语法错误，这条规则永远不匹配
+        return _never
+
+    # 检查内容中的密钥标记：any / none / 逗号分隔的标记名
+    if secrets is not None:
+        checks.append(_secrets_check(secrets.strip()))
+
+    # 检查路径模式（glob，支持 {a,b} 展开）
+    if path is not None:
+        globs = expand_braces(path.strip('"\''))  # 去掉引号
+        path_values = _extractor(field, DEFAULT_FIELDS["path"])
+        checks.append(lambda _, tool_input: any(
+            _path_matches(g, v) for v in path_values(tool_input) for g in globs
+        ))
+
+    # 检查 URL 的域名：example.com 只匹配该域名，*.example.com 匹配其子域名
+    if domain is not None:
+        domains = [d.strip().lower().rstrip(".") for d in domain.split(",") if d.strip()]
+        domain_values = _extractor(field, DEFAULT_FIELDS["domain"])
+        checks.append(lambda _, tool_input: any(
+            _domain_matches(d, host) for host in map(url_host, domain_values(tool_input)) if host for d in domains
+        ))
+
+    return lambda tool_name, tool_input: all(check(tool_name, tool_input) for check in checks)
+
+
+def _secrets_check(expected: str) -> Callable[[str, dict], bool]:
+    if expected == "any":
+        return lambda _, tool_input: bool(secret_markers(tool_input))
+    if expected == "none":
+        return lambda _, tool_input: not secret_markers(tool_input)
+    names = {name.strip() for name in expected.split(",")}
+    return lambda _, tool_input: bool(secret_markers(tool_input) & names)
+
+
+def _extractor(field: Optional[str], defaults: tuple[str, ...], first_only: bool = False) -> Callable[[dict], list[str]]:
+    """
+    字段取值函数：返回要检查的字符串列表，取不到值时返回空列表
+
+    field 支持点号访问嵌套字段，经过列表时取每个元素（如 MultiEdit 的 edits.new_string）；
+    没写 field 时用 defaults，first_only 保留原来 "command 或 content" 的语义（都没有时检查空串）
+    """
+    if field:
+        keys = [k.strip() for k in field.strip().split(".") if k.strip()]
+        return lambda tool_input: _field_values(tool_input, keys)
+    if first_only:
+        return lambda tool_input: [next((str(tool_input[k]) for k in defaults if tool_input.get(k)), "")]
+    return lambda tool_input: [str(tool_input[k]) for k in defaults if tool_input.get(k)]
+
+
+def _field_values(value, keys: list[str]) -> list[str]:
+    if isinstance(value, list):
+        return [v for item in value for v in _field_values(item, keys)]
+    if not keys:
+        return [str(value)] if value not in (None, "") else []
+    if not isinstance(value, dict) or keys[0] not in value:
+        return []
+    return _field_values(value[keys[0]], keys[1:])
+
+
+def url_host(value: str) -> Optional[str]:
+    """URL 的主机名（小写）；没写协议的 example.com/path 也能取到"""
+    try:
+        host = urlsplit(value if "//" in value else f"//{value}").hostname
+    except ValueError:
+        return None
+    return host.rstrip(".") if host else None
+
+
+def _domain_matches(pattern: str, host: str) -> bool:
+    if pattern.startswith("*."):
+        return host.endswith(pattern[1:])
+    return host == pattern
+
+
+@lru_cache(maxsize=256)
+def expand_braces(pattern: str) -> tuple[str, ...]:
+    """展开 glob 中的 {a,b}：**/*.{ts,tsx} → (**/*.ts, **/*.tsx)"""
+    match = re.search(r"\{([^{}]*)\}", pattern)
+    if not match:
+        return (pattern,)
+    expanded = []
+    for option in match.group(1).split(","):
+        expanded.extend(expand_braces(pattern[:match.start()] + option + pattern[match.end():]))
+    return tuple(expanded)
+
+
+def _path_matches(pattern: str, file_path: str) -> bool:
+    # 支持 **/ 前缀（匹配任意目录）：只匹配文件名部分
+    if pattern.startswith("**/"):
+        return fnmatch.fnmatch(Path(file_path).name, pattern[3:])
+    return fnmatch.fnmatch(file_path, pattern)
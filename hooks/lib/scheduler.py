@@ -0,0 +1,83 @@
+"""
+scheduler.py - 模式检测的调度
+
+detect_patterns 要读 30 天的 feedback，不需要每次 PostToolUse 都跑。
+只有 ask 请求有了结果（用户批准 / 拒绝）才可能产生新规则，所以按「新结果」调度：
+
+- feedback_collector / sweeper 每确定一个 ask 请求的结果就记一次（note_resolved）
+- 新结果数达到 learning.detect_min_outcomes，或最早一个未检测的结果已等了
+  learning.detect_interval_minutes，才运行检测
+- 没有新结果时永远不跑：空闲时不检测，连续批准时很快触发
+
+状态按项目保存在 ~/.claude/auto-decision/detect_state.json，加锁读-改-写；
+claim_detection 在同一把锁里判断并清零，并发的 hook 只会有一个拿到检测权。
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from . import AUTO_DECISION_DIR
+from .storage import load_config, project_key, read_json, update_json_locked
+
+DETECT_STATE_FILE = AUTO_DECISION_DIR / "detect_state.json"
+# 最多保留多少个项目的状态
+MAX_PROJECTS = 100
+
+
+def _learning_config() -> dict:
+    try:
+        return load_config().get("learning", {})
+    except Exception:
+        return {}
+
+
+def note_resolved(count: int = 1, memory_bank: Optional[Path] = None):
+    """记录新确定结果的 ask 请求数"""
+    if count <= 0:
+        return
+    key = project_key(memory_bank)
+    now = datetime.now().isoformat(timespec="seconds")
+
+    def mutate(state: dict):
+        projects = state.setdefault("projects", {})
+        entry = projects.setdefault(key, {"pending": 0, "last_run": None})
+        if entry["pending"] <= 0:
+            entry["since"] = now  # 最早一个未检测结果的时间
+        entry["pending"] += count
+        entry["last_outcome"] = now
+        if len(projects) > MAX_PROJECTS:
+            oldest = sorted(projects, key=lambda k: projects[k].get("last_outcome") or "")
+            for stale in oldest[:len(projects) - MAX_PROJECTS]:
+                del projects[stale]
+
+    update_json_locked(DETECT_STATE_FILE, {}, mutate)
+
+
+def claim_detection(memory_bank: Optional[Path] = None) -> Optional[int]:
+    """
+    判断当前项目是否该运行检测；该运行时清零计数并返回本次覆盖的新结果数，否则返回 None
+    """
+    config = _learning_config()
+    min_outcomes = config.get("detect_min_outcomes", 3)
+    interval_seconds = config.get("detect_interval_minutes", 30) * 60
+    key = project_key(memory_bank)
+    now = datetime.now()
+
+    # 绝大多数调用都没有新结果，先无锁读一次，避免每次都加锁重写状态文件
+    if read_json(DETECT_STATE_FILE, {}).get("projects", {}).get(key, {}).get("pending", 0) <= 0:
+        return None
+
+    def mutate(state: dict) -> Optional[int]:
+        entry = state.get("projects", {}).get(key)
+        if not entry or entry.get("pending", 0) <= 0:
+            return None  # 没有新结果，检测结果不会变
+        pending = entry["pending"]
+        since = datetime.fromisoformat(entry.get("since") or entry["last_outcome"])
+        overdue = (now - since).total_seconds() >= interval_seconds
+        if pending < min_outcomes and not overdue:
+            return None
+        entry["pending"] = 0
+        entry["last_run"] = now.isoformat(timespec="seconds")
+        return pending
+
+    return update_json_locked(DETECT_STATE_FILE, {}, mutate)
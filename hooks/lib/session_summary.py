@@ -0,0 +1,266 @@
+"""
+session_summary.py - 会话总结的生成与后台队列
+
+LLM 总结要调用一次 claude -p（最长 llm.timeout 秒），放在 Stop 里会拖慢会话结束。
+开启 session_review.deferred 后：
+
+- Stop 只把一个小的任务描述写到 ~/.claude/auto-decision/summary_jobs/{session_id}.json
+  （同一会话后写的覆盖先写的），然后启动一个脱离会话的 summary_worker.py 立即返回
+- worker 用 flock 保证同时只有一个在跑，以 session_review.max_workers 为并发上限
+  处理队列，直到队列清空
+- worker 没跑完就退出时（如机器休眠），下一次 UserPromptSubmit 发现积压的任务会重新拉起
+
+总结是增量的：每次 Stop（每轮对话结束）后，把还没总结过的操作按 session_review.token_budget
+切成块，逐块并入 sessions/{session_id}.rolling.json 中的滚动总结；不足一块的尾部
+和滚动总结、统计一起做最后一次合并。每个提示词都不超过预算，长会话的总结也覆盖全部操作。
+"""
+
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from . import AUTO_DECISION_DIR, MEMORY_BANK_PROJECT
+from .llm import (
+    CHUNK_PROMPT,
+    MERGE_PROMPT,
+    estimate_tokens,
+    format_feedback_line,
+    generate_simple_summary,
+    is_llm_enabled,
+    llm_generate_session_summary,
+    llm_summarize_chunk,
+)
+from .logger import log
+from .storage import (
+    get_session_feedback,
+    load_config,
+    read_json,
+    write_json_atomic,
+    write_session_summary,
+)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SUMMARY_JOBS_DIR = AUTO_DECISION_DIR / "summary_jobs"
+WORKER_LOCK = SUMMARY_JOBS_DIR / ".worker.lock"
+WORKER_SCRIPT = Path(__file__).parent.parent / "summary_worker.py"
+
+# 任务失败（LLM 超时等）后最多重试几次，之后退回统计总结
+MAX_ATTEMPTS = 3
+# 任务积压超过这么久仍没被处理，认为 worker 已退出
+STALE_JOB_SECONDS = 120
+# 单个总结提示词的默认 token 预算
+DEFAULT_TOKEN_BUDGET = 4000
+# 统计部分在合并提示词里预留的 token
+STATS_RESERVE = 200
+
+
+def render_summary(summary_content: str, stats: dict, when: Optional[datetime] = None) -> str:
+    return f"""# 会话总结
+
+**日期**: {(when or datetime.now()).strftime('%Y-%m-%d %H:%M')}
+
+{summary_content}
+
+## 统计
+- 总操作: {stats['total']}
+- 自动允许: {stats['auto_allowed']}
+- 用户批准: {stats['user_approved']}
+- 用户拒绝: {stats['user_rejected']}
+"""
+
+
+def rolling_state_path(session_id: str, memory_bank: Optional[Path] = None) -> Path:
+    return (memory_bank or MEMORY_BANK_PROJECT) / "sessions" / f"{session_id}.rolling.json"
+
+
+def _take_chunk(lines: list[str], budget: int) -> int:
+    """从头取不超过 budget 的行数（至少 1 行，保证能前进）"""
+    used = 0
+    for i, line in enumerate(lines):
+        used += estimate_tokens(line) + 1
+        if used > budget:
+            return max(i, 1)
+    return len(lines)
+
+
+def _fit(text: str, budget: int) -> str:
+    """按 token 预算截断文本（保留结尾，滚动总结越往后越新）"""
+    while text and estimate_tokens(text) > budget:
+        text = text[len(text) // 8 + 1:]
+    return text
+
+
+def summarize_session(
+    session_id: str,
+    stats: dict,
+    memory_bank: Optional[Path] = None,
+    fallback: bool = True,
+) -> Optional[str]:
+    """
+    增量生成会话总结正文
+
+    先把超出预算的旧操作逐块并入滚动总结（每块完成后立即保存进度），
+    再用滚动总结 + 剩余操作 + 统计做最终合并。
+    LLM 未启用时直接返回统计总结；任一次调用失败后本次不再调用 LLM，
+    返回统计总结（fallback=False 时返回 None），已保存的进度不丢
+    """
+    if not is_llm_enabled():
+        return generate_simple_summary(stats) if fallback else None
+
+    budget = load_config().get("session_review", {}).get("token_budget", DEFAULT_TOKEN_BUDGET)
+    budget = max(budget, 1000)  # 太小时模板本身就放不下
+    state_file = rolling_state_path(session_id, memory_bank)
+    state = read_json(state_file, {"summary": "", "last_id": None, "chunks": 0})
+
+    # 任务可能在前一天的会话结束时写入，多读一天
+    feedback = get_session_feedback(session_id, days=2, memory_bank=memory_bank)
+    ids = [entry.get("id") for entry in feedback]
+    start = ids.index(state["last_id"]) + 1 if state["last_id"] in ids else 0
+    pending = feedback[start:]
+    lines = [format_feedback_line(entry) for entry in pending]
+
+    chunk_overhead = estimate_tokens(CHUNK_PROMPT) + budget // 4  # 为滚动总结留 1/4
+    merge_overhead = estimate_tokens(MERGE_PROMPT) + STATS_RESERVE + budget // 4
+
+    while True:
+        summary = _fit(state["summary"], budget // 4)
+        tail_tokens = sum(estimate_tokens(line) + 1 for line in lines)
+        if tail_tokens <= budget - merge_overhead:
+            break
+        n = _take_chunk(lines, budget - chunk_overhead)
+        result = llm_summarize_chunk(summary, lines[:n])
+        if result is None:
+            # LLM 失败多半是超时或不可用，剩下的块和最终合并也会同样等满超时：
+            # 本次不再调用，已保存的进度留给下一次 Stop
+            return generate_simple_summary(stats) if fallback else None
+        state["summary"] = result
+        state["last_id"] = pending[n - 1].get("id")
+        state["chunks"] += 1
+        write_json_atomic(state_file, state)
+        lines, pending = lines[n:], pending[n:]
+
+    return llm_generate_session_summary(summary, lines, stats, fallback=fallback)
+
+
+def enqueue_summary_job(session_id: str, stats: dict, memory_bank: Optional[Path] = None) -> Path:
+    """写入一个总结任务（同一会话只保留最新的一个）"""
+    job_file = SUMMARY_JOBS_DIR / f"{session_id}.json"
+    write_json_atomic(job_file, {
+        "session_id": session_id,
+        "memory_bank": str((memory_bank or MEMORY_BANK_PROJECT).resolve()),
+        "stats": stats,
+        "created_at": datetime.now().isoformat(),
+        "attempts": 0,
+    })
+    return job_file
+
+
+def _mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:  # 刚被 worker 处理完删除
+        return None
+
+
+def pending_jobs() -> list[tuple[Path, int]]:
+    """队列中的任务 (路径, mtime_ns)，最早的在前"""
+    if not SUMMARY_JOBS_DIR.exists():
+        return []
+    jobs = [(p, _mtime_ns(p)) for p in SUMMARY_JOBS_DIR.glob("*.json")]
+    return sorted(((p, m) for p, m in jobs if m is not None), key=lambda job: job[1])
+
+
+def spawn_summary_worker():
+    """启动脱离当前进程组的 worker，不等待"""
+    try:
+        subprocess.Popen(
+            [sys.executable, str(WORKER_SCRIPT)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            close_fds=True,
+        )
+    except OSError as e:
+        log("Summary", f"启动 worker 失败: {e}")
+
+
+def kick_stale_jobs():
+    """有积压任务且已过 STALE_JOB_SECONDS 时重新拉起 worker（worker 自身有锁，重复启动无害）"""
+    jobs = pending_jobs()
+    if jobs and datetime.now().timestamp() - jobs[0][1] / 1e9 > STALE_JOB_SECONDS:
+        spawn_summary_worker()
+
+
+def run_job(job_file: Path) -> bool:
+    """处理一个任务，返回是否已完成（完成后删除任务文件）"""
+    job = read_json(job_file, None)
+    if not job:
+        job_file.unlink(missing_ok=True)
+        return True
+
+    session_id = job["session_id"]
+    memory_bank = Path(job["memory_bank"])
+    stats = job["stats"]
+
+    summary_content = None
+    if is_llm_enabled() and job.get("attempts", 0) < MAX_ATTEMPTS:
+        summary_content = summarize_session(session_id, stats, memory_bank, fallback=False)
+        if summary_content is None:
+            job["attempts"] = job.get("attempts", 0) + 1
+            if job["attempts"] < MAX_ATTEMPTS:
+                write_json_atomic(job_file, job)
+                return False
+    if summary_content is None:
+        summary_content = generate_simple_summary(stats)
+
+    created_at = datetime.fromisoformat(job["created_at"])
+    write_session_summary(session_id, render_summary(summary_content, stats, created_at), memory_bank=memory_bank)
+
+    # 处理期间同一会话又写入了新任务时保留新任务
+    if read_json(job_file, {}).get("created_at") == job["created_at"]:
+        job_file.unlink(missing_ok=True)
+    return True
+
+
+def process_jobs(max_workers: int = 2) -> int:
+    """
+    处理队列中的所有任务，返回完成数
+
+    同一轮里失败的任务不再重试，留给下一次 worker
+    """
+    SUMMARY_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    with open(WORKER_LOCK, "a") as lock:
+        if fcntl:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0  # 已有 worker 在处理
+
+        done = 0
+        # 本轮已处理过的任务版本（mtime），没有被新写入覆盖的不再重试
+        seen = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            while True:
+                batch = [path for path, mtime in pending_jobs() if seen.get(path.name) != mtime]
+                if not batch:
+                    break
+                for path, ok in zip(batch, pool.map(_safe_run_job, batch)):
+                    if ok:
+                        done += 1
+                    seen[path.name] = _mtime_ns(path)
+        return done
+
+
+def _safe_run_job(job_file: Path) -> bool:
+    try:
+        return run_job(job_file)
+    except Exception as e:
+        log("Summary", f"处理 {job_file.name} 失败: {e}")
+        return False
@@ -0,0 +1,236 @@
+"""
+similar.py - LLM 决策的相似请求缓存
+
+规则没命中时每个请求都要调用一次 LLM，但未命中的请求大多只是参数不同：
+`pytest tests/a.py` 和 `pytest tests/b.py` 的决策不会不一样。
+LLM 给出 allow/deny 后记下请求的 MinHash 签名，之后足够相似的请求直接复用这个决策。
+
+- 只处理命令/路径类输入（Bash 命令、Read/Glob/Grep 路径、WebFetch URL 等）；
+  Write/Edit/MultiEdit 的决策取决于写入内容，不参与
+- 规范化：数字替换为 #，带扩展名的文件名替换为 *.ext（tests/a.py → tests/*.py）
+- 特征：规范化后的词和相邻词对；签名：64 个 32 位 MinHash，相同槽位的比例估计 Jaccard 相似度
+- 只在同一个 generate_pattern_key 分组内比较（git push 不会复用 git status 的决策），
+  且密钥标记必须一致
+- 相似度 ≥ similarity.threshold 时复用，每次复用追加一行到 similar_audit.jsonl
+- 默认只复用 deny：相似度高不代表同样安全，`git push origin x` 和 `git push --force origin x`
+  只差一个词。similarity.reuse_allow 打开后也复用 allow，但要求命令头（每段命令的第一个词）
+  和选项集合完全相同
+
+缓存保存在 ~/.claude/auto-decision/similar_cache.json，只在即将调用 LLM 时读取。
+"""
+
+import hashlib
+import json
+import random
+import re
+from datetime import datetime
+from typing import Optional
+from . import AUTO_DECISION_DIR
+from .patterns import generate_pattern_key
+from .simplify import secret_markers
+from .storage import read_json, write_json_atomic
+
+SIMILAR_FILE = AUTO_DECISION_DIR / "similar_cache.json"
+AUDIT_FILE = AUTO_DECISION_DIR / "similar_audit.jsonl"
+# 审计日志超过这个大小时轮转为 .1
+AUDIT_MAX_BYTES = 1024 * 1024
+
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_REUSE_ALLOW = False
+DEFAULT_MAX_ENTRIES = 512
+# 每个分组最多保留的决策数
+MAX_PER_BUCKET = 32
+
+NUM_PERM = 64
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+_rng = random.Random(20240119)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# 参与相似度计算的字段（按工具输入中出现的顺序拼接）
+TEXT_FIELDS = ("command", "file_path", "path", "pattern", "url", "query")
+# 决策依赖写入内容的工具
+CONTENT_TOOLS = {"Write", "Edit", "MultiEdit", "NotebookEdit"}
+
+_TOKEN_RE = re.compile(r"\S+")
+_NUMBER_RE = re.compile(r"\d+")
+_FILENAME_RE = re.compile(r"(^|/)[^/\s]+(\.[A-Za-z0-9]{1,8})$")
+_SEGMENT_RE = re.compile(r"&&|\|\||[;|&\n]")
+_ASSIGNMENT_RE = re.compile(r"^\w+=")
+
+
+def request_text(tool_name: str, tool_input: dict) -> Optional[str]:
+    """参与比较的文本；不适合做相似复用的请求返回 None"""
+    if tool_name in CONTENT_TOOLS:
+        return None
+    values = [str(tool_input[f]) for f in TEXT_FIELDS if isinstance(tool_input.get(f), (str, int, float))]
+    text = " ".join(values).strip()
+    return text[:1000] or None
+
+
+def command_shape(tool_name: str, tool_input: dict) -> list:
+    """
+    复用 allow 时必须一致的部分：[每段命令的第一个词, 排序后的选项]
+
+    非 Bash 工具没有选项，只比较工具名
+    """
+    if tool_name != "Bash":
+        return [[tool_name], []]
+    heads, flags = [], set()
+    for segment in _SEGMENT_RE.split(str(tool_input.get("command", ""))):
+        words = [w for w in segment.split() if not _ASSIGNMENT_RE.match(w)]
+        if words:
+            heads.append(words[0])
+        flags.update(w for w in words if w.startswith("-"))
+    return [heads, sorted(flags)]
+
+
+def normalize_tokens(text: str) -> list[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        token = _FILENAME_RE.sub(r"\1*\2", token)
+        tokens.append(_NUMBER_RE.sub("#", token))
+    return tokens
+
+
+def shingles(text: str) -> set[str]:
+    tokens = normalize_tokens(text)
+    features = set(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return features
+
+
+def minhash(features: set[str]) -> list[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big")
+              for f in features]
+    if not hashes:
+        return [_MASK] * NUM_PERM
+    return [min((a * h + b) % _PRIME for h in hashes) & _MASK for a, b in _PERMUTATIONS]
+
+
+def similarity(sig_a: list[int], sig_b: list[int]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _encode(sig: list[int]) -> str:
+    return "".join(f"{v:08x}" for v in sig)
+
+
+def _decode(text: str) -> list[int]:
+    return [int(text[i:i + 8], 16) for i in range(0, len(text), 8)]
+
+
+def _load() -> dict:
+    cache = read_json(SIMILAR_FILE, {})
+    if not isinstance(cache, dict):
+        cache = {}
+    cache.setdefault("buckets", {})
+    cache.setdefault("hits", 0)
+    cache.setdefault("misses", 0)
+    return cache
+
+
+def _save(cache: dict):
+    """不加锁：并发时最多丢失一条记录，和决策缓存一样"""
+    try:
+        write_json_atomic(SIMILAR_FILE, cache)
+    except OSError:
+        pass
+
+
+def _audit(record: dict):
+    try:
+        if AUDIT_FILE.exists() and AUDIT_FILE.stat().st_size > AUDIT_MAX_BYTES:
+            AUDIT_FILE.replace(AUDIT_FILE.with_name(AUDIT_FILE.name + ".1"))
+        with open(AUDIT_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def find_similar(tool_name: str, tool_input: dict, config: Optional[dict] = None) -> Optional[dict]:
+    """
+    查找足够相似的已决策请求
+
+    命中时返回 {"decision", "reason", "similarity", "text"}，并写入审计日志
+    """
+    config = config or {}
+    text = request_text(tool_name, tool_input)
+    if text is None:
+        return None
+
+    cache = _load()
+    bucket = cache["buckets"].get(generate_pattern_key(tool_name, tool_input))
+    if not bucket:
+        return None
+
+    threshold = config.get("threshold", DEFAULT_THRESHOLD)
+    reuse_allow = config.get("reuse_allow", DEFAULT_REUSE_ALLOW)
+    secrets = sorted(secret_markers(tool_input))
+    shape = command_shape(tool_name, tool_input)
+    sig = minhash(shingles(text))
+    best, best_score = None, 0.0
+    for entry in bucket:
+        if entry.get("secrets", []) != secrets:
+            continue
+        if entry["decision"] == "allow" and (not reuse_allow or entry.get("shape") != shape):
+            continue
+        score = similarity(sig, _decode(entry["sig"]))
+        if score > best_score:
+            best, best_score = entry, score
+
+    if best is None or best_score < threshold:
+        cache["misses"] += 1
+        _save(cache)
+        return None
+
+    cache["hits"] += 1
+    best["hits"] = best.get("hits", 0) + 1
+    _save(cache)
+    _audit({
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "tool": tool_name,
+        "text": text[:200],
+        "matched": best["text"],
+        "similarity": round(best_score, 3),
+        "decision": best["decision"],
+    })
+    return {"decision": best["decision"], "reason": best.get("reason"),
+            "similarity": best_score, "text": best["text"]}
+
+
+def remember_decision(tool_name: str, tool_input: dict, decision: str, reason: Optional[str],
+                      config: Optional[dict] = None):
+    """记录一次 LLM 给出的 allow/deny 决策"""
+    if decision not in ("allow", "deny"):
+        return
+    config = config or {}
+    text = request_text(tool_name, tool_input)
+    if text is None:
+        return
+
+    cache = _load()
+    key = generate_pattern_key(tool_name, tool_input)
+    bucket = [e for e in cache["buckets"].pop(key, []) if e["text"] != text[:200]]
+    bucket.append({
+        "text": text[:200],
+        "sig": _encode(minhash(shingles(text))),
+        "secrets": sorted(secret_markers(tool_input)),
+        "shape": command_shape(tool_name, tool_input),
+        "decision": decision,
+        "reason": reason,
+        "ts": datetime.now().isoformat(timespec="seconds"),
+    })
+    # 分组按最近写入排在末尾（dict 保持插入顺序），超出总数时从最久未更新的分组删起
+    cache["buckets"][key] = bucket[-MAX_PER_BUCKET:]
+
+    max_entries = config.get("max_entries", DEFAULT_MAX_ENTRIES)
+    total = sum(len(b) for b in cache["buckets"].values())
+    while total > max_entries and cache["buckets"]:
+        oldest = next(iter(cache["buckets"]))
+        entries = cache["buckets"][oldest]
+        entries.pop(0)
+        total -= 1
+        if not entries:
+            del cache["buckets"][oldest]
+    _save(cache)
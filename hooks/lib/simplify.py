@@ -0,0 +1,198 @@
+"""
+simplify.py - 工具输入简化与内容指纹
+
+feedback 只需要能分组统计、能回放规则的信息，不需要完整的文件内容。
+每个工具注册一个简化函数；大段文本（Write 的 content、Edit 的 old_string/new_string）
+只保留前 100 字符预览和一个指纹：
+
+    {"size": 字节数, "lines": 行数, "sha1": "...", "secrets": ["private_key", ...]}
+
+指纹在一次流式遍历中算完（分块编码、哈希、数行、扫描密钥标记），
+规则的 secrets 条件可以直接用它匹配，不需要保存或重新扫描原文。
+"""
+
+import hashlib
+import re
+from typing import Callable, Iterable, Optional
+
+# 预览保留的字符数（加上 "..." 不超过 104）
+PREVIEW_CHARS = 100
+# 流式处理的块大小（字符）
+CHUNK_CHARS = 64 * 1024
+# 块之间保留的重叠字符，避免标记被切断在两块之间
+OVERLAP_CHARS = 128
+
+SECRET_MARKERS = {
+    "private_key": re.compile(r"-----BEGIN [A-Z ]*PRIVATE KEY-----"),
+    "aws_access_key": re.compile(r"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b"),
+    "github_token": re.compile(r"\bgh[pousr]_[A-Za-z0-9]{36,}"),
+    "slack_token": re.compile(r"\bxox[abprs]-[A-Za-z0-9-]{10,}"),
+    "openai_key": re.compile(r"\bsk-[A-Za-z0-9_-]{20,}"),
+    "assignment": re.compile(
+        r"(?i)\b(?:api[_-]?key|secret|passw(?:or)?d|access[_-]?token|auth[_-]?token)\b"
+        r"\s*[:=]\s*['\"][^'\"\s]{8,}['\"]"
+    ),
+}
+
+# 参与密钥扫描的文本字段（old_string 是被替换掉的内容，不算）
+TEXT_FIELDS = ("content", "new_string", "command")
+
+_SIMPLIFIERS: dict[str, Callable[[dict], dict]] = {}
+
+# 同一个 hook 里规则匹配和写日志会对同一段文本各求一次指纹，按对象身份缓存最近几个
+_FP_CACHE: list[tuple[str, dict]] = []
+_FP_CACHE_SIZE = 8
+
+
+def register_simplifier(*tools: str):
+    """为一个或多个工具注册简化函数"""
+    def decorator(fn: Callable[[dict], dict]):
+        for tool in tools:
+            _SIMPLIFIERS[tool] = fn
+        return fn
+    return decorator
+
+
+def fingerprint(text: str) -> dict:
+    """一次流式遍历计算 size / lines / sha1 / secrets"""
+    for cached_text, cached_fp in _FP_CACHE:
+        if cached_text is text:
+            return dict(cached_fp)
+
+    digest = hashlib.sha1()
+    size = 0
+    newlines = 0
+    found = set()
+    tail = ""
+
+    for start in range(0, len(text), CHUNK_CHARS):
+        chunk = text[start:start + CHUNK_CHARS]
+        data = chunk.encode("utf-8", "surrogatepass")
+        digest.update(data)
+        size += len(data)
+        newlines += data.count(b"\n")
+        window = tail + chunk
+        for name, pattern in SECRET_MARKERS.items():
+            if name not in found and pattern.search(window):
+                found.add(name)
+        tail = chunk[-OVERLAP_CHARS:]
+
+    lines = newlines + (1 if text and not text.endswith("\n") else 0)
+    fp = {"size": size, "lines": lines, "sha1": digest.hexdigest(), "secrets": sorted(found)}
+    _FP_CACHE.append((text, fp))
+    del _FP_CACHE[:-_FP_CACHE_SIZE]
+    return dict(fp)
+
+
+def preview(text: str) -> str:
+    return text[:PREVIEW_CHARS] + "..." if len(text) > PREVIEW_CHARS else text
+
+
+def _common(tool_input: dict) -> dict:
+    result = {}
+    if "command" in tool_input:
+        # Bash 命令：保留完整命令（通常不长）
+        result["command"] = tool_input["command"][:500]
+    if "file_path" in tool_input:
+        result["file_path"] = tool_input["file_path"]
+    if "pattern" in tool_input:
+        result["pattern"] = tool_input["pattern"]
+    if "query" in tool_input:
+        result["query"] = tool_input["query"][:200]
+    if "url" in tool_input:
+        result["url"] = tool_input["url"][:500]
+    return result
+
+
+def _add_text(result: dict, tool_input: dict, field: str, preview_key: Optional[str] = None):
+    text = tool_input.get(field)
+    if not isinstance(text, str):
+        return
+    if preview_key:
+        result[preview_key] = preview(text)
+    result[f"{field}_fp"] = fingerprint(text)
+
+
+@register_simplifier("Write")
+def _simplify_write(tool_input: dict) -> dict:
+    result = _common(tool_input)
+    _add_text(result, tool_input, "content", "content_preview")
+    return result
+
+
+@register_simplifier("Edit")
+def _simplify_edit(tool_input: dict) -> dict:
+    result = _common(tool_input)
+    _add_text(result, tool_input, "old_string")
+    _add_text(result, tool_input, "new_string", "new_preview")
+    if tool_input.get("replace_all"):
+        result["replace_all"] = True
+    return result
+
+
+@register_simplifier("MultiEdit")
+def _simplify_multi_edit(tool_input: dict) -> dict:
+    result = _common(tool_input)
+    edits = tool_input.get("edits") or []
+    result["edits"] = len(edits)
+    # 所有 new_string 合并成一个指纹
+    result["new_string_fp"] = fingerprint("\n".join(
+        e.get("new_string", "") for e in edits if isinstance(e, dict)
+    ))
+    return result
+
+
+@register_simplifier("Bash")
+def _simplify_bash(tool_input: dict) -> dict:
+    result = _common(tool_input)
+    command = tool_input.get("command", "")
+    # 命令超过保留长度时才需要指纹；短命令只记录密钥标记
+    fp = fingerprint(command)
+    if len(command) > 500:
+        result["command_fp"] = fp
+    elif fp["secrets"]:
+        result["secrets"] = fp["secrets"]
+    return result
+
+
+def _simplify_default(tool_input: dict) -> dict:
+    result = _common(tool_input)
+    # 未注册的工具：content 同样只留预览和指纹
+    _add_text(result, tool_input, "content", "content_preview")
+    return result
+
+
+def simplify_input(tool_input: dict, tool_name: Optional[str] = None) -> dict:
+    """简化工具输入，避免存储过大内容"""
+    simplifier = _SIMPLIFIERS.get(tool_name or "", _simplify_default)
+    return simplifier(tool_input)
+
+
+def _texts(tool_input: dict) -> Iterable[str]:
+    for field in TEXT_FIELDS:
+        value = tool_input.get(field)
+        if isinstance(value, str):
+            yield value
+    for edit in tool_input.get("edits") or []:
+        if isinstance(edit, dict) and isinstance(edit.get("new_string"), str):
+            yield edit["new_string"]
+
+
+def secret_markers(tool_input: dict) -> set[str]:
+    """
+    输入中的密钥标记
+
+    优先使用已有的指纹（feedback 回放时原文已不在），否则扫描原文
+    """
+    found = set(tool_input.get("secrets") or [])
+    has_fp = False
+    for key, value in tool_input.items():
+        if key.endswith("_fp") and isinstance(value, dict):
+            has_fp = True
+            if key != "old_string_fp":
+                found.update(value.get("secrets") or [])
+    if has_fp:
+        return found
+    for text in _texts(tool_input):
+        found.update(fingerprint(text)["secrets"])
+    return found
@@ -4,11 +4,30 @@ storage.py - 数据读写
 处理 feedback 日志和 session 总结的读写
 """
 
+import copy
 import json
+import os
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Optional
 from . import MEMORY_BANK_PROJECT, MEMORY_BANK_GLOBAL, CONFIG_FILE
+from .bloom import bloom_add, bloom_might_contain, bloom_path
+from .simplify import simplify_input
+from .jsonl import (
+    EXECUTED_TOKEN,
+    append_index,
+    dumps_value,
+    find_record,
+    format_record,
+    iter_lines_with,
+    patch_executed,
+)
+
+try:
+    import fcntl
+except ImportError:  # 非 Unix 平台不加锁
+    fcntl = None
 
 
 def load_config() -> dict:
@@ -23,12 +42,114 @@ def load_config() -> dict:
     }
 
 
+def read_json(path: Path, default: Any = None) -> Any:
+    """读取 JSON 文件，不存在或损坏时返回 default 的副本"""
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return copy.deepcopy(default)
+
+
+def write_json_atomic(path: Path, data: Any):
+    """原子写入 JSON：先写临时文件再 rename，读者不会看到半截内容"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def update_json_locked(
+    path: Path,
+    default: Any,
+    mutate: Callable[[Any], Any],
+    migrate: Optional[Callable[[Any], Any]] = None,
+) -> Any:
+    """
+    加锁读-改-写 JSON 文件
+
+    多个 hook 进程可能同时更新同一个文件，用 flock 串行化；
+    migrate（可选）把读到的旧格式数据转换成新格式，
+    mutate 原地修改数据，其返回值透传给调用方
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = path.with_name(f".{path.name}.lock")
+    with open(lock_file, "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            data = read_json(path, default)
+            if migrate:
+                data = migrate(data)
+            result = mutate(data)
+            write_json_atomic(path, data)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    return result
+
+
+@contextmanager
+def feedback_lock(log_file: Path, exclusive: bool = False):
+    """
+    加锁打开 feedback 文件（追加模式），yield 文件对象
+
+    追加新行（log_request）和原地改写 executed（update_request_executed）互不冲突，用共享锁；
+    整文件重写和扫描后批量改写（sweeper）要独占，避免并发的追加 / 原地更新丢失。
+    重写用 os.replace 换掉了文件，拿到锁后发现打开的不是当前文件就重新打开
+    """
+    while True:
+        f = open(log_file, "ab")
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            current = os.stat(log_file).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            current = False
+        if current or not fcntl:
+            break
+        f.close()
+    try:
+        yield f
+    finally:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
 def ensure_project_dirs():
     """确保项目级目录存在"""
     (MEMORY_BANK_PROJECT / "feedback").mkdir(parents=True, exist_ok=True)
     (MEMORY_BANK_PROJECT / "sessions").mkdir(parents=True, exist_ok=True)
 
 
+def project_key(memory_bank: Optional[Path] = None) -> str:
+    """按项目保存状态时用的 key（memory-bank 的绝对路径）"""
+    return str((memory_bank or MEMORY_BANK_PROJECT).resolve())
+
+
+def feedback_file(date_str: str, memory_bank: Optional[Path] = None) -> Path:
+    return (memory_bank or MEMORY_BANK_PROJECT) / "feedback" / f"{date_str}.jsonl"
+
+
+def feedback_files(days: int = 30, feedback_dir: Optional[Path] = None) -> list[Path]:
+    """最近 N 天的 feedback 文件（days <= 0 表示全部），按日期升序"""
+    feedback_dir = feedback_dir or MEMORY_BANK_PROJECT / "feedback"
+    if not feedback_dir.exists():
+        return []
+    files = sorted(feedback_dir.glob("*.jsonl"))
+    if days > 0:
+        cutoff = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        files = [f for f in files if f.stem >= cutoff]
+    return files
+
+
+def _storage_config() -> dict:
+    try:
+        return load_config().get("storage", {})
+    except Exception:
+        return {}
+
+
 def log_request(
     request_id: str,
     tool_name: str,
@@ -39,15 +160,16 @@ def log_request(
     """
     记录工具调用请求
 
-    写入 .claude/memory-bank/feedback/{date}.jsonl
+    写入 .claude/memory-bank/feedback/{date}.jsonl，
+    开启偏移索引时同时在 {date}.idx 记录该行的字节偏移
     """
     ensure_project_dirs()
 
     date_str = datetime.now().strftime("%Y-%m-%d")
-    log_file = MEMORY_BANK_PROJECT / "feedback" / f"{date_str}.jsonl"
+    log_file = feedback_file(date_str)
 
     # 简化 input，避免存储过大内容
-    simplified_input = simplify_input(tool_input)
+    simplified_input = simplify_input(tool_input, tool_name)
 
     entry = {
         "id": request_id,
@@ -59,42 +181,201 @@ def log_request(
         "executed": None,  # 待 PostToolUse 更新
     }
 
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-
-
-def update_request_executed(request_id: str, executed: bool = True, search_days: int = 7) -> bool:
+    line = format_record(entry) + b"\n"
+    with feedback_lock(log_file) as f:
+        f.write(line)
+        f.flush()
+        # O_APPEND 写入后文件位置就在本行末尾，并发追加时也准确
+        offset = f.tell() - len(line)
+
+    if request_id:
+        storage_config = _storage_config()
+        if storage_config.get("offset_index", True):
+            append_index(log_file, request_id, offset)
+        if storage_config.get("bloom_filter", True):
+            try:
+                bloom_add(bloom_path(log_file), request_id, offset)
+            except OSError:
+                # 漏记的 id 会被当成不存在；删掉过滤器，这一天退回扫描
+                bloom_path(log_file).unlink(missing_ok=True)
+        else:
+            # 关闭期间的记录不在过滤器里，当天的过滤器已不可信
+            bloom_path(log_file).unlink(missing_ok=True)
+
+
+def update_request_executed(request_id: str, executed: bool = True, search_days: int = 7) -> Optional[dict]:
     """
     更新请求的执行状态
 
-    在 PostToolUse 中调用，标记请求已执行（用户批准了）
+    在 PostToolUse 中调用，标记请求已执行（用户批准了）。
+    每天先探测布隆过滤器，不可能包含该 id 的日期直接跳过；
+    再按偏移索引 / mmap 定位到这一行，executed 是定宽字段，直接原地覆盖；
+    旧格式的行放不下时才重写整个文件
+
+    返回: 更新后的记录；没找到时返回 None
     """
+    storage_config = _storage_config()
+    use_index = storage_config.get("offset_index", True)
+    use_bloom = storage_config.get("bloom_filter", True)
+
     for i in range(search_days):
-        date = datetime.now() - timedelta(days=i)
-        date_str = date.strftime("%Y-%m-%d")
-        log_file = MEMORY_BANK_PROJECT / "feedback" / f"{date_str}.jsonl"
+        date_str = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
+        log_file = feedback_file(date_str)
 
+        if use_bloom and not bloom_might_contain(bloom_path(log_file), request_id):
+            continue
         if not log_file.exists():
             continue
 
-        # 读取所有行，更新匹配的请求
-        lines = log_file.read_text().strip().split("\n")
-        updated_lines = []
-        updated = False
+        with feedback_lock(log_file):
+            found = find_record(log_file, request_id, use_index=use_index)
+            if found is None:
+                continue
+            offset, line = found
+            patched = patch_executed(log_file, offset, line, executed)
+
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            entry = {"id": request_id}
+        entry["executed"] = executed
+
+        if not patched:
+            def mark(record: dict) -> bool:
+                if record.get("id") != request_id:
+                    return False
+                record["executed"] = executed
+                return True
+            with feedback_lock(log_file, exclusive=True):
+                _rewrite_feedback_file(log_file, mark)
+        return entry
+
+    return None
+
+
+def _rewrite_feedback_file(log_file: Path, transform: Callable[[dict], bool]) -> int:
+    """
+    逐行解析一个 feedback 文件，transform 原地修改记录并返回是否有改动；
+    有改动时整文件只重写一次。返回改动的记录数
 
-        for line in lines:
-            if line:
-                entry = json.loads(line)
-                if entry.get("id") == request_id:
-                    entry["executed"] = executed
-                    updated = True
-                updated_lines.append(json.dumps(entry, ensure_ascii=False))
+    调用方必须持有该文件的独占锁（feedback_lock(exclusive=True)），
+    否则重写期间的追加 / 原地更新会随旧文件一起丢失
+    """
+    raw = log_file.read_bytes()
+    lines = raw.split(b"\n")
+    changed = 0
 
-        if updated:
-            log_file.write_text("\n".join(updated_lines) + "\n")
-            return True
+    for i, line in enumerate(lines):
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if transform(entry):
+            lines[i] = format_record(entry)
+            changed += 1
 
-    return False
+    if changed:
+        content = b"\n".join(lines)
+        tmp = log_file.with_name(f".{log_file.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, log_file)
+
+    return changed
+
+
+def resolve_pending_outcomes(
+    session_id: Optional[str] = None,
+    older_than: Optional[timedelta] = None,
+    days: int = 2,
+    rejected_entries: Optional[list] = None,
+) -> int:
+    """
+    把等不到 PostToolUse 的 ask 请求标记为用户拒绝（executed=false）
+
+    PostToolUse 只在工具实际执行后触发，用户点了 No 时不会有任何回调，
+    所以需要在会话 Stop 时（session_id）或定期批量（older_than）收尾。
+    每个日志文件只 mmap 扫描一遍（按 session 或 "executed": null 过滤），
+    命中的行原地改写；只有旧格式的行才需要重写文件。扫描和改写都在文件的独占锁内。返回标记的记录数；
+    传入 rejected_entries 时把标记的记录追加进去（供 rule_scores 更新分数）
+    """
+    cutoff = (datetime.now() - older_than).isoformat() if older_than is not None else None
+    if session_id is not None:
+        token = b'"session_id": ' + dumps_value(session_id)
+    else:
+        token = EXECUTED_TOKEN + b"null"
+
+    def should_reject(entry: dict) -> bool:
+        if entry.get("auto_decision") != "ask" or entry.get("executed") is not None:
+            return False
+        if session_id is not None and entry.get("session_id") != session_id:
+            return False
+        if cutoff is not None and entry.get("ts", "") > cutoff:
+            return False
+        return True
+
+    resolved = 0
+    for i in range(days):
+        date_str = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
+        log_file = feedback_file(date_str)
+        if not log_file.exists():
+            continue
+
+        # 独占锁：扫描到改写之间，PostToolUse 不能把同一行改成 executed=true（否则会被覆盖成拒绝）
+        with feedback_lock(log_file, exclusive=True):
+            legacy_ids = set()
+            for offset, line in list(iter_lines_with(log_file, token)):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not should_reject(entry):
+                    continue
+                if patch_executed(log_file, offset, line, False):
+                    resolved += 1
+                    if rejected_entries is not None:
+                        rejected_entries.append(entry)
+                else:
+                    legacy_ids.add(entry.get("id"))
+
+            if legacy_ids:
+                def reject(entry: dict) -> bool:
+                    if entry.get("id") not in legacy_ids or not should_reject(entry):
+                        return False
+                    entry["executed"] = False
+                    if rejected_entries is not None:
+                        rejected_entries.append(entry)
+                    return True
+                resolved += _rewrite_feedback_file(log_file, reject)
+
+    return resolved
+
+
+def get_session_feedback(session_id: str, days: int = 1, memory_bank: Optional[Path] = None) -> list[dict]:
+    """
+    获取某个会话最近 N 天的反馈记录
+
+    先按 session_id token 在字节上过滤，只解码本会话的行；
+    memory_bank 默认是当前项目（后台 worker 处理其他项目的会话时显式传入）
+    """
+    token = b'"session_id": ' + dumps_value(session_id) + b","
+    entries = []
+
+    for i in reversed(range(days)):
+        date_str = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
+        log_file = feedback_file(date_str, memory_bank)
+        if not log_file.exists():
+            continue
+        for _, line in iter_lines_with(log_file, token):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("session_id") == session_id:
+                entries.append(entry)
+
+    return entries
 
 
 def get_recent_feedback(days: int = 7) -> list[dict]:
@@ -119,37 +400,14 @@ def get_recent_feedback(days: int = 7) -> list[dict]:
     return entries
 
 
-def write_session_summary(session_id: str, summary: str):
+def write_session_summary(session_id: str, summary: str, memory_bank: Optional[Path] = None):
     """
     写入会话总结
 
     写入 .claude/memory-bank/sessions/{session-id}.md
     """
-    ensure_project_dirs()
+    sessions_dir = (memory_bank or MEMORY_BANK_PROJECT) / "sessions"
+    sessions_dir.mkdir(parents=True, exist_ok=True)
 
-    session_file = MEMORY_BANK_PROJECT / "sessions" / f"{session_id}.md"
+    session_file = sessions_dir / f"{session_id}.md"
     session_file.write_text(summary, encoding="utf-8")
-
-
-def simplify_input(tool_input: dict) -> dict:
-    """简化工具输入，避免存储过大内容"""
-    result = {}
-
-    if "command" in tool_input:
-        # Bash 命令：保留完整命令（通常不长）
-        result["command"] = tool_input["command"][:500]
-
-    if "file_path" in tool_input:
-        result["file_path"] = tool_input["file_path"]
-
-    if "content" in tool_input:
-        # 文件内容：只保留前 100 字符
-        result["content_preview"] = tool_input["content"][:100] + "..."
-
-    if "pattern" in tool_input:
-        result["pattern"] = tool_input["pattern"]
-
-    if "query" in tool_input:
-        result["query"] = tool_input["query"][:200]
-
-    return result
@@ -0,0 +1,140 @@
+"""
+timing.py - Hook 分阶段耗时统计（可开关）
+
+开启方式（任一即可）：
+- 环境变量 AUTO_DECISION_TIMING=1
+- config.json 中 "instrumentation": {"enabled": true}
+
+用法：
+    with stage("PreToolUse", "load_rules"):
+        rules = load_rules()
+    ...
+    flush_timings()  # 进程结束前调用一次
+
+每次 hook 结束时把本次样本合并进 ~/.claude/auto-decision/stats.json 的直方图，
+查看：python3 ~/.claude/hooks/admin.py stats
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+from . import AUTO_DECISION_DIR
+
+STATS_FILE = AUTO_DECISION_DIR / "stats.json"
+
+# 直方图桶上界（毫秒），超过最后一个上界的样本落入溢出桶
+BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+_T0 = time.perf_counter()
+_enabled: Optional[bool] = None
+_samples: dict[tuple[str, str], list[float]] = {}
+
+
+def is_timing_enabled() -> bool:
+    """是否开启耗时统计（进程内只判断一次）"""
+    global _enabled
+    if _enabled is None:
+        env = os.environ.get("AUTO_DECISION_TIMING")
+        if env is not None:
+            _enabled = env.lower() not in ("", "0", "false", "no")
+        else:
+            try:
+                from .storage import load_config
+                _enabled = bool(load_config().get("instrumentation", {}).get("enabled", False))
+            except Exception:
+                _enabled = False
+    return _enabled
+
+
+@contextmanager
+def stage(hook: str, name: str):
+    """记录一个阶段的耗时；未开启时几乎零开销"""
+    if not is_timing_enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(hook, name, (time.perf_counter() - start) * 1000)
+
+
+def record(hook: str, name: str, elapsed_ms: float):
+    """手动记录一个样本"""
+    _samples.setdefault((hook, name), []).append(elapsed_ms)
+
+
+def bucket_index(elapsed_ms: float) -> int:
+    for i, bound in enumerate(BUCKETS_MS):
+        if elapsed_ms <= bound:
+            return i
+    return len(BUCKETS_MS)
+
+
+def flush_timings():
+    """
+    把本进程的样本合并进统计文件
+
+    每个出现过样本的 hook 额外记录一个 total（从 lib 导入到 flush 的耗时）
+    """
+    if not _samples or not is_timing_enabled():
+        return
+
+    total_ms = (time.perf_counter() - _T0) * 1000
+    for hook in {h for h, _ in list(_samples)}:
+        record(hook, "total", total_ms)
+
+    samples = dict(_samples)
+    _samples.clear()
+
+    def merge(data: dict):
+        if data.get("buckets") != BUCKETS_MS:
+            # 桶定义变化后旧直方图无法合并，直接重置
+            data.clear()
+            data["buckets"] = BUCKETS_MS
+            data["hooks"] = {}
+        for (hook, name), values in samples.items():
+            stat = data["hooks"].setdefault(hook, {}).setdefault(name, {
+                "count": 0,
+                "sum": 0.0,
+                "max": 0.0,
+                "hist": [0] * (len(BUCKETS_MS) + 1),
+            })
+            for v in values:
+                stat["count"] += 1
+                stat["sum"] += v
+                stat["max"] = max(stat["max"], v)
+                stat["hist"][bucket_index(v)] += 1
+
+    try:
+        from .storage import update_json_locked
+        update_json_locked(STATS_FILE, {}, merge)
+    except Exception:
+        pass  # 统计失败不影响主流程
+
+
+def percentile(stat: dict, p: float) -> float:
+    """从直方图估算分位数（桶内线性插值，上限取实际最大值）"""
+    count = stat.get("count", 0)
+    if not count:
+        return 0.0
+    target = count * p / 100
+    seen = 0
+    for i, n in enumerate(stat["hist"]):
+        if n and seen + n >= target:
+            lower = BUCKETS_MS[i - 1] if i > 0 else 0.0
+            upper = BUCKETS_MS[i] if i < len(BUCKETS_MS) else stat["max"]
+            value = lower + (upper - lower) * (target - seen) / n
+            return min(value, stat["max"])
+        seen += n
+    return stat["max"]
+
+
+def load_stats() -> dict:
+    """读取统计文件"""
+    from .storage import read_json
+    data = read_json(STATS_FILE, {})
+    if data.get("buckets") != BUCKETS_MS:
+        return {}
+    return data.get("hooks", {})
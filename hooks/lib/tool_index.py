@@ -0,0 +1,120 @@
+"""
+tool_index.py - 按工具名索引规则（MCP 命名空间前缀树）
+
+MCP 工具名形如 mcp__server__tool。规则的 tool 字段原本只能写正则，匹配时对每条规则 re.match 一次；
+MCP 服务器一多，几百个工具就要扫一遍正则。这里把工具名按 "__" 切成段，建一棵前缀树：
+
+- 字面工具名（Bash、Write|Edit、mcp__github__create_issue）直接按段插入
+- mcp__ 开头的名字里 * 是通配符而不是正则：mcp__github__* 匹配 github 服务器的所有工具，
+  mcp__*__read_file 匹配任意服务器的 read_file；整段的 * 在最后一段时匹配剩下的一段或多段，
+  段内的 *（mcp__github__delete_*）只在这一段内匹配
+- 其他正则（如 (Write|Edit)、Notebook.*）放进扫描列表，每次都参与匹配
+
+查找一个工具名只沿树走一遍，结果是候选规则下标（保持原顺序），同一进程内按工具名缓存。
+"""
+
+import fnmatch
+import re
+from functools import lru_cache
+from typing import Optional
+
+SEPARATOR = "__"
+WILDCARD = "*"
+NAMESPACE_PREFIX = "mcp" + SEPARATOR
+
+# 可以当字面量处理的工具名（正则里没有特殊字符）
+_LITERAL_RE = re.compile(r"[\w\-*]+")
+
+
+@lru_cache(maxsize=1024)
+def namespace_alternatives(pattern: Optional[str]) -> Optional[tuple[tuple[str, ...], ...]]:
+    """
+    把 tool 字段拆成段序列，每个 | 分支一个；不能放进前缀树的正则返回 None
+
+    只有 mcp__ 开头的分支可以用 *（其他名字里的 * 仍按正则处理）
+    """
+    if pattern is None:
+        return None
+    alternatives = []
+    for alternative in pattern.strip().split("|"):
+        if not _LITERAL_RE.fullmatch(alternative):
+            return None
+        if WILDCARD in alternative and not alternative.startswith(NAMESPACE_PREFIX):
+            return None
+        alternatives.append(tuple(alternative.split(SEPARATOR)))
+    return tuple(alternatives)
+
+
+def _segment_matches(part: str, segment: str) -> bool:
+    if WILDCARD not in part:
+        return part == segment
+    return part == WILDCARD or fnmatch.fnmatchcase(segment, part)
+
+
+def segments_match(pattern: tuple[str, ...], segments: list[str]) -> bool:
+    """单个分支是否匹配工具名的段序列（整段 * 在最后一段时匹配剩下的一段或多段）"""
+    for i, part in enumerate(pattern):
+        if i >= len(segments):
+            return False
+        if part == WILDCARD and i == len(pattern) - 1:
+            return True
+        if not _segment_matches(part, segments[i]):
+            return False
+    return len(pattern) == len(segments)
+
+
+class _Node:
+    __slots__ = ("children", "globs", "exact", "rest")
+
+    def __init__(self):
+        self.children: dict[str, "_Node"] = {}  # 字面段和整段 *
+        self.globs: dict[str, "_Node"] = {}     # 段内通配（delete_*）
+        self.exact: list[int] = []  # 工具名在这里结束的规则
+        self.rest: list[int] = []   # 以 * 结尾、匹配之后任意段的规则
+
+
+class ToolIndex:
+    """规则 tool 字段的前缀树，candidates(tool_name) 返回可能匹配的规则下标"""
+
+    def __init__(self, tools: list[Optional[str]]):
+        self._root = _Node()
+        self._scan: list[int] = []  # 正则工具模式 / 没写 tool 的规则，每次都要检查
+        self._cache: dict[str, list[int]] = {}
+        for i, tool in enumerate(tools):
+            alternatives = namespace_alternatives(tool)
+            if alternatives is None:
+                self._scan.append(i)
+                continue
+            for segments in alternatives:
+                self._insert(segments, i)
+
+    def _insert(self, segments: tuple[str, ...], index: int):
+        node = self._root
+        for i, segment in enumerate(segments):
+            if segment == WILDCARD and i == len(segments) - 1:
+                node.rest.append(index)
+                return
+            branches = node.globs if WILDCARD in segment and segment != WILDCARD else node.children
+            node = branches.setdefault(segment, _Node())
+        node.exact.append(index)
+
+    def _collect(self, node: _Node, segments: list[str], i: int, found: set):
+        if i == len(segments):
+            found.update(node.exact)
+            return
+        found.update(node.rest)
+        for key in (segments[i], WILDCARD):
+            child = node.children.get(key)
+            if child is not None:
+                self._collect(child, segments, i + 1, found)
+        for glob, child in node.globs.items():
+            if fnmatch.fnmatchcase(segments[i], glob):
+                self._collect(child, segments, i + 1, found)
+
+    def candidates(self, tool_name: str) -> list[int]:
+        cached = self._cache.get(tool_name)
+        if cached is None:
+            found = set(self._scan)
+            self._collect(self._root, tool_name.split(SEPARATOR), 0, found)
+            cached = self._cache[tool_name] = sorted(found)
+        return cached
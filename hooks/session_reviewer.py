@@ -11,61 +11,88 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+from lib.timing import stage, flush_timings
+from lib.profiling import profiled
 from lib.logger import log
-from lib.storage import load_config, get_recent_feedback, write_session_summary
-from lib.llm import is_llm_enabled, llm_generate_session_summary, generate_simple_summary
+from lib.storage import load_config, get_session_feedback, write_session_summary, resolve_pending_outcomes
+from lib.analytics import summarize
+from lib.scheduler import note_resolved
+from lib.rule_scores import note_outcomes
+from lib.retention import maybe_prune
+from lib.llm import is_llm_enabled
+from lib.session_summary import enqueue_summary_job, render_summary, spawn_summary_worker, summarize_session
+
+
+def resolve_outcomes(session_id: str) -> int:
+    """本轮结束时仍未执行的 ask 请求 = 用户拒绝；记入检测调度和规则评分，返回拒绝数"""
+    rejected_entries = []
+    with stage("Stop", "resolve_outcomes"):
+        rejected = resolve_pending_outcomes(session_id=session_id, rejected_entries=rejected_entries)
+    if rejected:
+        log("Stop", f"标记用户拒绝: {rejected} 条")
+        note_resolved(rejected)
+        with stage("Stop", "rule_scores"):
+            note_outcomes((entry, False) for entry in rejected_entries)
+    return rejected
 
 
 def main():
     try:
-        data = json.load(sys.stdin)
+        with stage("Stop", "parse"):
+            data = json.load(sys.stdin)
     except json.JSONDecodeError:
         data = {}
 
     session_id = data.get("session_id", datetime.now().strftime("%Y%m%d_%H%M%S"))
+    resolve_outcomes(session_id)
+
+    # 按保留策略清理旧的 feedback / 会话文件（每个项目每天最多一次）
+    with stage("Stop", "retention"):
+        pruned = maybe_prune()
+    if pruned and (pruned["days"] or pruned["sessions"]):
+        log("Stop", f"清理 {len(pruned['days'])} 天 feedback、{pruned['sessions']} 个会话，"
+                    f"释放 {pruned['bytes'] // 1024}KB")
 
     config = load_config()
-    if not config.get("session_review", {}).get("enabled", True):
+    review_config = config.get("session_review", {})
+    if not review_config.get("enabled", True):
         sys.exit(0)
 
-    feedback = get_recent_feedback(days=1)
-    session_feedback = [f for f in feedback if f.get("session_id") == session_id]
+    with stage("Stop", "load_feedback"):
+        session_feedback = get_session_feedback(session_id, days=1)
 
-    min_actions = config.get("session_review", {}).get("min_actions", 5)
+    min_actions = review_config.get("min_actions", 5)
     if len(session_feedback) < min_actions:
         log("Stop", f"操作数不足 ({len(session_feedback)}<{min_actions})")
         sys.exit(0)
 
-    stats = {
-        "total": len(session_feedback),
-        "auto_allowed": sum(1 for f in session_feedback if f.get("auto_decision") == "allow"),
-        "auto_denied": sum(1 for f in session_feedback if f.get("auto_decision") == "deny"),
-        "user_approved": sum(1 for f in session_feedback if f.get("auto_decision") == "ask" and f.get("executed") is True),
-    }
-
-    if is_llm_enabled():
-        summary_content = llm_generate_session_summary(session_feedback, stats)
-    else:
-        summary_content = generate_simple_summary(stats)
-
-    summary = f"""# 会话总结
-
-**日期**: {datetime.now().strftime('%Y-%m-%d %H:%M')}
-
-{summary_content}
-
-## 统计
-- 总操作: {stats['total']}
-- 自动允许: {stats['auto_allowed']}
-- 用户批准: {stats['user_approved']}
-"""
-
-    write_session_summary(session_id, summary)
+    with stage("Stop", "stats"):
+        stats = {
+            k: v for k, v in summarize(session_feedback).items()
+            if k in ("total", "auto_allowed", "auto_denied", "user_approved", "user_rejected")
+        }
+
+    # LLM 总结放到后台 worker，Stop 立即返回
+    if review_config.get("deferred", True) and is_llm_enabled():
+        with stage("Stop", "enqueue"):
+            enqueue_summary_job(session_id, stats)
+            spawn_summary_worker()
+        log("Stop", f"会话总结已排队 ({stats['total']}次操作)")
+        return
+
+    with stage("Stop", "summary"):
+        summary_content = summarize_session(session_id, stats)
+
+    with stage("Stop", "write_summary"):
+        write_session_summary(session_id, render_summary(summary_content, stats))
     log("Stop", f"会话总结已保存 ({stats['total']}次操作)")
 
 
 if __name__ == "__main__":
     try:
-        main()
+        with profiled("session_reviewer"):
+            main()
     except Exception as e:
         log("Stop", f"错误: {e}")
+    finally:
+        flush_timings()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+summary_worker.py - 后台会话总结 worker
+
+由 Stop hook（session_review.deferred）或 UserPromptSubmit（发现积压任务时）
+以脱离会话的方式启动，处理 ~/.claude/auto-decision/summary_jobs/ 中排队的总结任务。
+同时只会有一个 worker 在跑，也可以手动执行：
+
+    python3 ~/.claude/hooks/summary_worker.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from lib.timing import stage, flush_timings
+from lib.logger import log
+from lib.storage import load_config
+from lib.session_summary import process_jobs
+
+
+def main():
+    max_workers = load_config().get("session_review", {}).get("max_workers", 2)
+    with stage("SummaryWorker", "process_jobs"):
+        done = process_jobs(max_workers=max_workers)
+    if done:
+        log("SummaryWorker", f"完成 {done} 个会话总结")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        log("SummaryWorker", f"错误: {e}")
+    finally:
+        flush_timings()
@@ -2,108 +2,253 @@
 """
 update_checker.py - UserPromptSubmit Hook (Optional)
 
-在新会话开始时检查是否有更新可用。
-每天最多提醒一次。
+检查 Auto-Decision 是否有更新可用，每天最多提醒一次。
+
+检查本身（git fetch、比较已安装版本）在脱离会话的后台进程中进行，结果写入
+~/.claude/auto-decision/update_status.json；提交消息时只读这个小文件，
+到期时拉起一次后台刷新，不会因为网络慢卡住用户输入。
+
+状态文件由后台刷新和提交消息两边修改，都在同一把锁里读-改-写，且只改自己负责的字段：
+刷新期间（最长 timeout_seconds）提醒写下的 notified_at 不会被刷新结果覆盖。
+
+    python3 ~/.claude/hooks/update_checker.py --refresh   # 手动刷新（前台）
+
+项目目录按以下顺序确定：
+1. 环境变量 AUTO_DECISION_PROJECT_DIR
+2. config.json 的 update_check.project_dir
+3. 同步脚本记录的 ~/.claude/auto-decision/.project-dir
+4. ~/.claude/hooks 是指向项目 hooks/ 的符号链接时（install.sh 链接模式），取其上级目录
+5. ~/projects/claude-code-auto-decision
 
 要启用此功能，在 settings.json 的 UserPromptSubmit hooks 中添加此脚本。
 """
 
 import json
+import os
+import signal
 import subprocess
 import sys
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from lib.storage import update_json_locked
 
-# 配置
-PROJECT_DIR = Path.home() / "projects" / "claude-code-auto-decision"
 CLAUDE_HOME = Path.home() / ".claude"
-CHECK_FILE = CLAUDE_HOME / "auto-decision" / ".last-update-check"
+AUTO_DECISION_DIR = CLAUDE_HOME / "auto-decision"
+STATUS_FILE = AUTO_DECISION_DIR / "update_status.json"
+CONFIG_FILE = AUTO_DECISION_DIR / "config.json"
+PROJECT_DIR_FILE = AUTO_DECISION_DIR / ".project-dir"
+VERSION_FILE = AUTO_DECISION_DIR / ".installed-version"
+DEFAULT_PROJECT_DIR = Path.home() / "projects" / "claude-code-auto-decision"
+
 CHECK_INTERVAL_HOURS = 24
+# 后台刷新的总时间上限（秒）
+REFRESH_TIMEOUT = 15
 
 
-def should_check() -> bool:
-    """是否应该检查更新（每天最多一次）"""
-    if not CHECK_FILE.exists():
-        return True
+def read_status() -> dict:
+    try:
+        return json.loads(STATUS_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_refresh(fields: dict, drop: tuple[str, ...] = ()):
+    """加锁合并刷新负责的字段，其他字段（notified_at 等）保持文件里的最新值"""
+    def mutate(status: dict):
+        for key in drop:
+            status.pop(key, None)
+        status.update(fields)
 
+    update_json_locked(STATUS_FILE, {}, mutate)
+
+
+def _due(value, now: datetime, after: timedelta = timedelta(0)) -> bool:
+    """时间戳 value 之后再过 after 是否已到（没有记录时视为已到）"""
     try:
-        last_check = datetime.fromisoformat(CHECK_FILE.read_text().strip())
-        hours_since = (datetime.now() - last_check).total_seconds() / 3600
-        return hours_since >= CHECK_INTERVAL_HOURS
-    except:
+        return now >= datetime.fromisoformat(value) + after
+    except (TypeError, ValueError):
         return True
 
 
-def record_check():
-    """记录本次检查时间"""
-    CHECK_FILE.parent.mkdir(parents=True, exist_ok=True)
-    CHECK_FILE.write_text(datetime.now().isoformat())
+def load_update_config() -> dict:
+    try:
+        return json.loads(CONFIG_FILE.read_text(encoding="utf-8")).get("update_check", {})
+    except (OSError, ValueError):
+        return {}
 
 
-def check_for_updates() -> tuple[bool, str]:
-    """
-    检查是否有更新
+def resolve_project_dir(config: dict) -> Path:
+    candidates = [os.environ.get("AUTO_DECISION_PROJECT_DIR"), config.get("project_dir")]
+    try:
+        candidates.append(PROJECT_DIR_FILE.read_text(encoding="utf-8").strip())
+    except OSError:
+        pass
+    for value in candidates:
+        if value:
+            return Path(value).expanduser()
+
+    hooks = CLAUDE_HOME / "hooks"
+    if hooks.is_symlink():
+        target = hooks.resolve()
+        if (target.parent / "update.sh").exists():
+            return target.parent
+    return DEFAULT_PROJECT_DIR
+
+
+def _git(project_dir: Path, args: list[str], deadline: float):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise subprocess.TimeoutExpired(["git"] + args, 0)
+    return subprocess.run(
+        ["git", "-C", str(project_dir)] + args,
+        capture_output=True,
+        text=True,
+        timeout=remaining,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},  # 不要在后台等待输入凭据
+    )
+
+
+def refresh():
+    """检查远程更新和本地未安装的提交，写入状态文件"""
+    config = load_update_config()
+    budget = config.get("timeout_seconds", REFRESH_TIMEOUT)
+    interval = config.get("interval_hours", CHECK_INTERVAL_HOURS)
+    deadline = time.monotonic() + budget
+    # 兜底：任何一步卡住，超出预算 5 秒后直接退出
+    if hasattr(signal, "alarm"):
+        signal.alarm(int(budget) + 5)
+
+    now = datetime.now()
+    result = {
+        "checked_at": now.isoformat(timespec="seconds"),
+        "next_check_at": (now + timedelta(hours=interval)).isoformat(timespec="seconds"),
+        "has_updates": False,
+        "message": "",
+    }
+
+    project_dir = resolve_project_dir(config)
+    result["project_dir"] = str(project_dir)
+    if not (project_dir / ".git").exists():
+        result["error"] = "项目目录不存在或不是 git 仓库"
+        save_refresh(result, drop=("refresh_started_at",))
+        return
 
-    返回: (has_updates, message)
-    """
-    if not PROJECT_DIR.exists():
-        return False, ""
+    try:
+        _git(project_dir, ["fetch", "--quiet"], deadline)
+        behind = _git(project_dir, ["rev-list", "--count", "HEAD..@{u}"], deadline).stdout.strip()
+        head = _git(project_dir, ["rev-parse", "--short", "HEAD"], deadline).stdout.strip()
+    except (subprocess.TimeoutExpired, OSError):
+        result["error"] = "检查超时"
+        save_refresh(result, drop=("refresh_started_at",))
+        return
+
+    try:
+        installed = VERSION_FILE.read_text(encoding="utf-8").strip()
+    except OSError:
+        installed = ""
+
+    remote_commits = int(behind) if behind.isdigit() else 0
+    not_installed = bool(head) and installed != head
+    result["remote_commits"] = remote_commits
+    result["not_installed"] = not_installed
+    if remote_commits or not_installed:
+        result["has_updates"] = True
+        result["message"] = (
+            f"远程有 {remote_commits} 个新提交" if remote_commits else "本地项目有未安装的更新"
+        )
+    save_refresh(result, drop=("refresh_started_at", "error"))
 
-    update_script = PROJECT_DIR / "update.sh"
-    if not update_script.exists():
-        return False, ""
 
+def spawn_refresh():
     try:
-        result = subprocess.run(
-            [str(update_script), "--check"],
-            capture_output=True,
-            text=True,
-            timeout=10,
-            cwd=str(PROJECT_DIR),
+        subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "--refresh"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            close_fds=True,
         )
-        # exit code 1 means updates available
-        if result.returncode == 1:
-            return True, "Auto-Decision 系统有更新可用"
-        return False, ""
-    except:
-        return False, ""
+    except OSError:
+        pass
+
+
+def _refresh_due(status: dict, now: datetime) -> bool:
+    """检查到期且没有正在进行的刷新"""
+    return _due(status.get("next_check_at"), now) and _due(
+        status.get("refresh_started_at"), now, timedelta(minutes=5)
+    )
+
+
+def _notify_due(status: dict, now: datetime) -> bool:
+    return bool(status.get("has_updates")) and _due(
+        status.get("notified_at"), now, timedelta(hours=CHECK_INTERVAL_HOURS)
+    )
+
+
+def run(data: dict) -> Optional[dict]:
+    """读取缓存的检查结果，需要提醒时返回 hook 输出"""
+    now = datetime.now()
+    # 绝大多数调用既不用刷新也不用提醒，无锁读一次就返回
+    status = read_status()
+    if not _refresh_due(status, now) and not _notify_due(status, now):
+        return None
+
+    def claim(status: dict) -> tuple[bool, Optional[dict]]:
+        # 锁内重新判断：并发的提交消息只有一个拉起刷新、只有一个提醒
+        refresh_due = _refresh_due(status, now)
+        if refresh_due:
+            status["refresh_started_at"] = now.isoformat(timespec="seconds")
+        notify = _notify_due(status, now)
+        if notify:
+            status["notified_at"] = now.isoformat(timespec="seconds")
+        return refresh_due, dict(status) if notify else None
+
+    refresh_due, notified = update_json_locked(STATUS_FILE, {}, claim)
+    if refresh_due:
+        spawn_refresh()
+    if notified is None:
+        return None
+
+    project_dir = notified.get("project_dir") or str(DEFAULT_PROJECT_DIR)
+    return {
+        "hookSpecificOutput": {
+            "hookEventName": "UserPromptSubmit",
+            "message": f"🔄 Auto-Decision 系统有更新可用（{notified.get('message', '')}）",
+            "systemPrompt": (
+                "<update-reminder>\n"
+                "Auto-Decision 系统有更新可用。\n"
+                "用户可以运行以下命令来更新：\n"
+                f"cd {project_dir} && git pull && ./update.sh\n"
+                "或者说「更新 auto-decision」让你帮忙执行。\n"
+                "</update-reminder>"
+            ),
+        }
+    }
 
 
 def main():
     # 读取输入（必须消费 stdin）
     try:
         data = json.load(sys.stdin)
-    except:
+    except Exception:
         data = {}
 
-    # 检查是否应该检查更新
-    if not should_check():
-        sys.exit(0)
-
-    record_check()
-
-    has_updates, message = check_for_updates()
-
-    if has_updates:
-        output = {
-            "hookSpecificOutput": {
-                "hookEventName": "UserPromptSubmit",
-                "message": f"🔄 {message}",
-                "systemPrompt": (
-                    "<update-reminder>\n"
-                    "Auto-Decision 系统有更新可用。\n"
-                    "用户可以运行以下命令来更新：\n"
-                    f"cd {PROJECT_DIR} && git pull && ./update.sh\n"
-                    "或者说「更新 auto-decision」让你帮忙执行。\n"
-                    "</update-reminder>"
-                ),
-            }
-        }
+    output = run(data)
+    if output:
         print(json.dumps(output, ensure_ascii=False))
 
 
 if __name__ == "__main__":
     try:
-        main()
+        if "--refresh" in sys.argv[1:]:
+            refresh()
+        else:
+            main()
     except Exception:
         pass  # 更新检查失败不影响正常使用
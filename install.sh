@@ -112,7 +112,7 @@ update_settings() {
         "hooks": [
           {
             "type": "command",
-            "command": "python3 ~/.claude/hooks/context_injector.py"
+            "command": "python3 ~/.claude/hooks/dispatch.py prompt"
           }
         ]
       }
@@ -134,11 +134,7 @@ update_settings() {
         "hooks": [
           {
             "type": "command",
-            "command": "python3 ~/.claude/hooks/feedback_collector.py"
-          },
-          {
-            "type": "command",
-            "command": "python3 ~/.claude/hooks/experience_saver.py"
+            "command": "python3 ~/.claude/hooks/dispatch.py post"
           }
         ]
       }
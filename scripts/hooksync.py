@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+hooksync.py - 基于清单的增量同步
+
+把项目的 hooks/ 和 skills/ 同步到 ~/.claude/，替代 diff -rq + cp -r：
+
+- 清单：每个文件的 sha256（忽略 __pycache__ / *.pyc），保存在安装目录的 .manifest.json
+- hooks 安装为版本目录 ~/.claude/hooks-versions/<清单哈希>/，~/.claude/hooks 是指向当前版本的符号链接。
+  新版本中未变化的文件从当前版本硬链接过来，只复制变化的文件；
+  最后用 rename 原子替换符号链接，正在运行的 hook 不会看到复制了一半的 lib
+- 版本目录按清单哈希命名，内容相同的版本只存一份；旧版本即备份，默认保留最近 5 个
+- skills 逐个文件比较哈希，只复制变化的文件（写临时文件后 rename）
+
+用法：
+    python3 scripts/hooksync.py status            # 列出差异，有差异时退出码为 1
+    python3 scripts/hooksync.py sync [--dry-run]  # 同步 hooks 和 skills
+    python3 scripts/hooksync.py rollback          # 切回上一个版本
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+CLAUDE_HOME = Path.home() / ".claude"
+MANIFEST_NAME = ".manifest.json"
+# 记录项目目录，供 update_checker.py 定位仓库（版本目录不在项目里）
+PROJECT_DIR_FILE = Path("auto-decision") / ".project-dir"
+SKILLS = ("rule-editor", "experience-learner")
+DEFAULT_KEEP = 5
+IGNORED_NAMES = {"__pycache__", ".DS_Store", ".experience_counter", MANIFEST_NAME}
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_manifest(root: Path) -> dict[str, str]:
+    """{相对路径: sha256}"""
+    manifest = {}
+    if not root.is_dir():
+        return manifest
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_NAMES)
+        for name in sorted(filenames):
+            if name in IGNORED_NAMES or name.endswith(".pyc"):
+                continue
+            path = Path(dirpath) / name
+            manifest[path.relative_to(root).as_posix()] = file_hash(path)
+    return manifest
+
+
+def load_manifest(root: Path) -> dict[str, str]:
+    """已安装目录的清单；没有 .manifest.json（旧安装）时现算"""
+    try:
+        return json.loads((root / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return build_manifest(root)
+
+
+def manifest_id(manifest: dict[str, str]) -> str:
+    payload = json.dumps(manifest, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+def diff_manifests(old: dict[str, str], new: dict[str, str]) -> dict[str, list[str]]:
+    return {
+        "added": sorted(set(new) - set(old)),
+        "changed": sorted(p for p in new if p in old and old[p] != new[p]),
+        "removed": sorted(set(old) - set(new)),
+    }
+
+
+def _has_changes(diff: dict[str, list[str]]) -> bool:
+    return any(diff.values())
+
+
+def _place(src: Path, dst: Path, link_from: Path = None):
+    """把文件放到 dst：能从旧版本硬链接就链接，否则复制（保留权限）"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if link_from is not None:
+        try:
+            os.link(link_from, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def _atomic_symlink(target: Path, link: Path):
+    tmp = link.with_name(f".{link.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    os.symlink(target, tmp)
+    os.replace(tmp, link)
+
+
+class HooksInstall:
+    """~/.claude/hooks → ~/.claude/hooks-versions/<id>"""
+
+    def __init__(self, claude_home: Path):
+        self.link = claude_home / "hooks"
+        self.versions = claude_home / "hooks-versions"
+
+    def current(self) -> Path:
+        return self.link.resolve() if self.link.exists() else self.link
+
+    def list_versions(self) -> list[Path]:
+        """版本目录，最近启用的在前"""
+        if not self.versions.is_dir():
+            return []
+        dirs = [d for d in self.versions.iterdir() if d.is_dir() and not d.name.startswith(".")]
+        return sorted(dirs, key=lambda d: d.stat().st_mtime, reverse=True)
+
+    def _adopt_directory(self) -> Path:
+        """
+        旧安装方式下 ~/.claude/hooks 是普通目录：整体移到版本目录下（即备份），
+        再换成符号链接。rename 很快，但这一步不是原子的，只在第一次迁移时发生
+        """
+        manifest = build_manifest(self.link)
+        target = self.versions / manifest_id(manifest)
+        self.versions.mkdir(parents=True, exist_ok=True)
+        if target.exists():
+            shutil.rmtree(self.link)
+        else:
+            os.rename(self.link, target)
+            (target / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+        _atomic_symlink(target, self.link)
+        return target
+
+    def activate(self, target: Path):
+        _atomic_symlink(target, self.link)
+        os.utime(target)  # mtime 记录启用时间，用于排序和清理
+
+    def sync(self, source: Path, keep: int = DEFAULT_KEEP, dry_run: bool = False) -> dict[str, list[str]]:
+        new_manifest = build_manifest(source)
+        current = self.current()
+        old_manifest = load_manifest(current) if current.is_dir() else {}
+        diff = diff_manifests(old_manifest, new_manifest)
+        if dry_run:
+            return diff
+
+        if self.link.is_dir() and not self.link.is_symlink():
+            current = self._adopt_directory()
+        elif self.link.is_symlink() and not current.is_relative_to(self.versions):
+            # install.sh 的链接模式（指向项目目录）：改为版本目录
+            old_manifest, current = {}, None
+
+        target = self.versions / manifest_id(new_manifest)
+        if current is not None and target == current:
+            return diff
+        created = not target.exists()
+        if created:
+            staging = self.versions / f".staging-{os.getpid()}-{int(time.time())}"
+            shutil.rmtree(staging, ignore_errors=True)
+            try:
+                for rel, digest in new_manifest.items():
+                    unchanged = current is not None and old_manifest.get(rel) == digest
+                    _place(source / rel, staging / rel, link_from=current / rel if unchanged else None)
+                (staging / MANIFEST_NAME).write_text(json.dumps(new_manifest, indent=1), encoding="utf-8")
+                os.rename(staging, target)
+            except BaseException:
+                # 没复制完的版本不留下；符号链接还指向旧版本
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+        try:
+            self.activate(target)
+        except BaseException:
+            # 替换符号链接失败时链接仍指向旧版本（rename 是原子的）；
+            # 删掉刚建的版本目录，免得 rollback 把它当成上一个版本
+            if created:
+                shutil.rmtree(target, ignore_errors=True)
+            raise
+        self.prune(keep)
+        return diff
+
+    def rollback(self) -> Path:
+        current = self.current()
+        previous = [d for d in self.list_versions() if d != current]
+        if not previous:
+            raise SystemExit("没有可以回滚的版本")
+        self.activate(previous[0])
+        return previous[0]
+
+    def prune(self, keep: int):
+        current = self.current()
+        for old in [d for d in self.list_versions() if d != current][max(keep - 1, 0):]:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def sync_tree(source: Path, dest: Path, dry_run: bool = False) -> dict[str, list[str]]:
+    """逐文件增量同步（skills 用）：只复制哈希不同的文件，删除源中已不存在的文件"""
+    if dest.is_symlink():
+        if not dry_run:
+            dest.unlink()
+        old = {}
+    else:
+        old = build_manifest(dest)
+    new = build_manifest(source)
+    diff = diff_manifests(old, new)
+    if dry_run:
+        return diff
+
+    for rel in diff["added"] + diff["changed"]:
+        dst = dest / rel
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+        shutil.copy2(source / rel, tmp)
+        os.replace(tmp, dst)
+    for rel in diff["removed"]:
+        (dest / rel).unlink(missing_ok=True)
+    return diff
+
+
+def _print_diff(label: str, diff: dict[str, list[str]]):
+    if not _has_changes(diff):
+        print(f"  {label}: (无变化)")
+        return
+    print(f"  {label}:")
+    for kind, mark in (("added", "+"), ("changed", "~"), ("removed", "-")):
+        for rel in diff[kind]:
+            print(f"    {mark} {rel}")
+
+
+def cmd_status(args) -> int:
+    hooks = HooksInstall(args.claude_home)
+    current = hooks.current()
+    changed = False
+
+    diff = diff_manifests(load_manifest(current) if current.is_dir() else {}, build_manifest(args.source / "hooks"))
+    _print_diff("hooks/", diff)
+    changed |= _has_changes(diff)
+
+    for skill in SKILLS:
+        src = args.source / "skills" / skill
+        if src.is_dir():
+            diff = sync_tree(src, args.claude_home / "skills" / skill, dry_run=True)
+            _print_diff(f"skills/{skill}/", diff)
+            changed |= _has_changes(diff)
+    return 1 if changed else 0
+
+
+def cmd_sync(args) -> int:
+    hooks = HooksInstall(args.claude_home)
+    diff = hooks.sync(args.source / "hooks", keep=args.keep, dry_run=args.dry_run)
+    _print_diff("hooks/", diff)
+    if not args.dry_run:
+        print(f"  当前版本: {hooks.current().name}")
+        record = args.claude_home / PROJECT_DIR_FILE
+        record.parent.mkdir(parents=True, exist_ok=True)
+        record.write_text(str(args.source.resolve()) + "\n", encoding="utf-8")
+
+    for skill in SKILLS:
+        src = args.source / "skills" / skill
+        if src.is_dir():
+            diff = sync_tree(src, args.claude_home / "skills" / skill, dry_run=args.dry_run)
+            _print_diff(f"skills/{skill}/", diff)
+    return 0
+
+
+def cmd_rollback(args) -> int:
+    target = HooksInstall(args.claude_home).rollback()
+    print(f"已切换到版本 {target.name}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="hooks / skills 增量同步")
+    parser.add_argument("--source", type=Path, default=PROJECT_DIR, help="项目目录（默认本脚本所在项目）")
+    parser.add_argument("--claude-home", type=Path, default=CLAUDE_HOME, help="安装目录（默认 ~/.claude）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("status", help="列出差异（有差异时退出码为 1）")
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("sync", help="同步 hooks 和 skills")
+    p.add_argument("--dry-run", action="store_true", help="只列出将要同步的文件")
+    p.add_argument("--keep", type=int, default=DEFAULT_KEEP, help=f"保留多少个 hooks 版本（默认 {DEFAULT_KEEP}）")
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser("rollback", help="hooks 切回上一个版本")
+    p.set_defaults(func=cmd_rollback)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
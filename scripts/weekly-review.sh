@@ -220,6 +220,19 @@ check_hooks_health() {
     fi
 }
 
+# 统计当前项目最近 7 天的决策（一次 Python 调用读完所有 feedback；
+# memory-bank 由 admin.py 按 hook 相同的规则向上查找，子目录里运行也能找到）
+check_decision_stats() {
+    print_section "决策统计（最近 7 天）"
+
+    local admin="$CLAUDE_HOME/hooks/admin.py"
+    if [ ! -f "$admin" ]; then
+        print_issue "admin.py 不存在，跳过"
+        return 0
+    fi
+    python3 "$admin" analytics --days 7 --top 5 | sed 's/^/  /'
+}
+
 # 生成审查报告
 generate_report() {
     print_header "审查摘要"
@@ -272,6 +285,7 @@ check_trigger_conflicts
 check_global_configs
 check_recent_changes
 check_hooks_health
+check_decision_stats
 generate_report
 
 echo ""
@@ -33,29 +33,11 @@ show_diff() {
 
     local has_diff=false
 
-    # Check hooks
-    echo "📁 hooks/"
-    if diff -rq "$SCRIPT_DIR/hooks" "$CLAUDE_HOME/hooks" > /dev/null 2>&1; then
-        echo "   (无变化)"
-    else
-        diff -rq "$SCRIPT_DIR/hooks" "$CLAUDE_HOME/hooks" 2>/dev/null | head -10 | sed 's/^/   /'
+    # Check hooks & skills（按文件哈希比较）
+    if ! python3 "$SCRIPT_DIR/scripts/hooksync.py" status; then
         has_diff=true
     fi
 
-    # Check skills
-    for skill in rule-editor experience-learner; do
-        echo ""
-        echo "📁 skills/$skill/"
-        if [ -d "$SCRIPT_DIR/skills/$skill" ]; then
-            if diff -rq "$SCRIPT_DIR/skills/$skill" "$CLAUDE_HOME/skills/$skill" > /dev/null 2>&1; then
-                echo "   (无变化)"
-            else
-                diff -rq "$SCRIPT_DIR/skills/$skill" "$CLAUDE_HOME/skills/$skill" 2>/dev/null | head -5 | sed 's/^/   /'
-                has_diff=true
-            fi
-        fi
-    done
-
     # Check config (info only, we preserve user config)
     echo ""
     echo "📄 config.json"
@@ -92,37 +74,15 @@ do_sync() {
     echo "目标: $CLAUDE_HOME"
     echo ""
 
-    # Sync hooks (always overwrite - this is the main code)
+    # Sync hooks & skills：只复制变化的文件，hooks 以版本目录 + 符号链接原子切换
     if [ "$dry_run" = true ]; then
-        log_action "[预览] hooks/ → ~/.claude/hooks/"
+        log_action "[预览] hooks/ skills/ → ~/.claude/"
+        python3 "$SCRIPT_DIR/scripts/hooksync.py" sync --dry-run
     else
-        # 如果是符号链接，先删除
-        if [ -L "$CLAUDE_HOME/hooks" ]; then
-            rm "$CLAUDE_HOME/hooks"
-        fi
-        # 复制（覆盖）
-        rm -rf "$CLAUDE_HOME/hooks"
-        cp -r "$SCRIPT_DIR/hooks" "$CLAUDE_HOME/hooks"
-        log_info "hooks/ 已同步"
+        python3 "$SCRIPT_DIR/scripts/hooksync.py" sync
+        log_info "hooks/ skills/ 已同步"
     fi
 
-    # Sync skills (always overwrite)
-    for skill in rule-editor experience-learner; do
-        if [ -d "$SCRIPT_DIR/skills/$skill" ]; then
-            if [ "$dry_run" = true ]; then
-                log_action "[预览] skills/$skill/ → ~/.claude/skills/$skill/"
-            else
-                mkdir -p "$CLAUDE_HOME/skills"
-                if [ -L "$CLAUDE_HOME/skills/$skill" ]; then
-                    rm "$CLAUDE_HOME/skills/$skill"
-                fi
-                rm -rf "$CLAUDE_HOME/skills/$skill"
-                cp -r "$SCRIPT_DIR/skills/$skill" "$CLAUDE_HOME/skills/"
-                log_info "skills/$skill/ 已同步"
-            fi
-        fi
-    done
-
     # Config: only create if not exists (preserve user settings)
     if [ ! -f "$CLAUDE_HOME/auto-decision/config.json" ]; then
         if [ "$dry_run" = true ]; then
@@ -60,9 +60,9 @@ show_diff() {
 
     local has_diff=false
 
-    # Check hooks
-    if ! diff -rq "$SCRIPT_DIR/hooks" "$CLAUDE_HOME/hooks" > /dev/null 2>&1; then
-        log_warn "hooks/ has changes"
+    # Check hooks & skills（按文件哈希比较）
+    if ! python3 "$SCRIPT_DIR/scripts/hooksync.py" status; then
+        log_warn "hooks/ or skills/ have changes"
         has_diff=true
     fi
 
@@ -78,16 +78,6 @@ show_diff() {
         has_diff=true
     fi
 
-    # Check skills
-    for skill in rule-editor experience-learner; do
-        if [ -d "$SCRIPT_DIR/skills/$skill" ]; then
-            if ! diff -rq "$SCRIPT_DIR/skills/$skill" "$CLAUDE_HOME/skills/$skill" > /dev/null 2>&1; then
-                log_warn "skills/$skill has changes"
-                has_diff=true
-            fi
-        fi
-    done
-
     if [ "$has_diff" = false ]; then
         log_info "No differences found. System is up to date."
         return 1
@@ -100,18 +90,15 @@ do_update() {
 
     log_info "Updating Claude Code Auto-Decision System..."
 
-    # Update hooks
+    # Update hooks & skills
+    # 只复制变化的文件；hooks 装到 ~/.claude/hooks-versions/<hash>/，符号链接原子切换，
+    # 旧版本目录即备份（内容相同的版本只存一份，保留最近 5 个）
     if [ "$dry_run" = true ]; then
-        log_action "[DRY-RUN] Would copy hooks/ -> ~/.claude/hooks/"
+        log_action "[DRY-RUN] Would sync hooks/ and skills/:"
+        python3 "$SCRIPT_DIR/scripts/hooksync.py" sync --dry-run
     else
-        # 备份现有 hooks（如果不是符号链接）
-        if [ -d "$CLAUDE_HOME/hooks" ] && [ ! -L "$CLAUDE_HOME/hooks" ]; then
-            cp -r "$CLAUDE_HOME/hooks" "$CLAUDE_HOME/hooks.backup.$(date +%Y%m%d%H%M%S)"
-            log_info "Backed up existing hooks"
-        fi
-        rm -rf "$CLAUDE_HOME/hooks"
-        cp -r "$SCRIPT_DIR/hooks" "$CLAUDE_HOME/hooks"
-        log_info "Updated: hooks/"
+        python3 "$SCRIPT_DIR/scripts/hooksync.py" sync
+        log_info "Updated: hooks/ skills/"
     fi
 
     # Update config (preserve user modifications)
@@ -141,20 +128,6 @@ do_update() {
         fi
     fi
 
-    # Update skills
-    for skill in rule-editor experience-learner; do
-        if [ -d "$SCRIPT_DIR/skills/$skill" ]; then
-            if [ "$dry_run" = true ]; then
-                log_action "[DRY-RUN] Would copy skills/$skill"
-            else
-                mkdir -p "$CLAUDE_HOME/skills"
-                rm -rf "$CLAUDE_HOME/skills/$skill"
-                cp -r "$SCRIPT_DIR/skills/$skill" "$CLAUDE_HOME/skills/"
-                log_info "Updated: skills/$skill"
-            fi
-        fi
-    done
-
     # Record installed version
     if [ "$dry_run" != true ]; then
         mkdir -p "$(dirname "$VERSION_FILE")"